@@ -11,45 +11,142 @@
 #!_____________________________________________________________________!
 
 #!---------------------------------------------------------------------!
-#! This is the main source file of QUICK integral code generator.      !
+#! This is the main source file of QUICK integral code generator. Edit !
+#! the settings below and run it, or use the command line interface,   !
+#! python -m genint oei --help.                                        !
 #!---------------------------------------------------------------------!
 
 import sys
 import os
 
-# Get the absolute path of oei directory and set module search path
+# Get the absolute path of oei directory
 GenIntHome=os.path.abspath(os.getcwd())
 outdir_name="output"
 outdir=os.path.join(GenIntHome,outdir_name)
 
-try:
-    os.mkdir(outdir)
-except OSError as error:
-    print(error)
-
-#common_abs_path=os.path.abspath(os.getcwd())+"/src/common"
-#oei_abs_path=os.path.abspath(os.getcwd())+"/src/oei"
-#sys.path.append(common_abs_path)
-#sys.path.append(oei_abs_path)
-
-import src.oei.one_electron_integral as one_electron_integral
-
 # set function qualifiers. If you want to generate host code, leave an empty string.
 # The default is for generating cuda code. 
 func_qualifier='__device__ __inline__'
 
-# generate one electron integral source code
-one_electron_integral.write_oei(outdir, func_qualifier)
+# set cse=1 to generate assemblers that compute each integral component only once per branch
+# instead of constructing nested integral classes.
+cse=0
+
+# set ir=1 to lower integral classes and assemblers from an in-memory recurrence graph. The
+# graph is also written into the output folder in json format.
+ir=0
+
+# set sym=1 to generate only [a|b] integral classes with a >= b. [b|a] is served by exchanging
+# centers A and B, and diagonal shell pairs reuse the transposed integral. This enables ir mode.
+sym=0
+
+# set grad_dce=1 to generate a gradient assembler that only computes the store entries read by
+# the gradient code. These entries are taken from the json file grad_entries, which grad_dce
+# requires; branches it does not list compute all of their gradient classes.
+grad_dce=0
+grad_entries=None
+
+# set plan=1 to choose the recurrence center and direction of each integral component so that
+# the branches generated with cse=1, grad_dce=1, ssa=1 or hrr=1 require fewer components and
+# operations. The plan is keyed on the component (i,j) only, so all auxiliary indices m share a
+# step, and it does not apply to the class layout (ir=1, sym=1) or the default mode. The savings
+# are small, e.g. 2352 to 2214 flops for the DD gradient branch.
+plan=0
+
+# set ssa=1 to write every assembler branch as a flat function where intermediates are local
+# constants assigned once and Boys function values are loaded once. No integral classes are
+# generated in this mode, so the REG_* and LOCSTOREFULL switches are not required.
+ssa=0
+
+# set hrr=1 to compute [e|s] integrals (e=a,...,a+b) in OEint_vertical and derive [a|b] with the
+# horizontal recurrence in OEint_horizontal, which should be called once per shell pair after
+# primitive contraction. Gradient assemblers are not affected.
+hrr=0
+
+# number of processes used for generating code, 0 uses all available cpus. The output does not
+# depend on this setting.
+nproc=0
+
+# set cache=1 to skip generation when the output folder holds files generated by the same
+# generator with the same settings, and to leave unchanged files untouched. Set the environment
+# variable SOURCE_DATE_EPOCH to make the date stamped into generated files reproducible. In any
+# case, output/.genint_cache.json lists the generated files and settings, and files of earlier
+# runs that are not generated again are removed.
+cache=1
+
+# set batch=1 to also write cpu_oei_batch.h with host kernels that evaluate an integral class for a
+# batch of n primitive pairs. Inputs are arrays in structure of arrays layout and the loops over
+# pairs are vectorized with #pragma omp simd (compile with -fopenmp-simd or -fopenmp).
+batch=0
+
+# set numpy=1 to also write oei_numpy.py with python functions that evaluate each integral class
+# from [s|s] to [f|f] for arrays of primitive pairs with numpy. No CUDA build is required.
+numpy=0
+
+# set boys=1 to also write gpu_oei_boys.h with oei_boys(M, T, prefactor, YVerticalTemp), which
+# fills YVerticalTemp with prefactor*F_m(T), m=0,...,M, for the orders required by the
+# assemblers. The Taylor grid of the Boys function is tabulated at generation time (requires numpy).
+boys=0
+
+# set charges=1 to also write gpu_oei_charges.h with OEint_vertical_charges and
+# oei_grad_vertical_charges, which add the integrals of a primitive pair summed over an array of
+# point charges to the store array. Implies boys=1.
+charges=0
+
+# set tree=1 to also write cpu_oei_tree.h, host code that sorts point charges into an octree and
+# sums OEint_vertical_tree/oei_grad_vertical_tree over them with a multipole far field whose
+# accuracy is set by the opening angle theta at run time. Implies charges=1.
+tree=0
+
+# set attenuated=1 to also write the Boys function producers oei_boys_erf/oei_boys_erfc and the
+# point charge assemblers of the range separated operators erf(omega r)/r and erfc(omega r)/r,
+# e.g. OEint_vertical_charges_erf and OEint_vertical_charges_erfc. Implies charges=1.
+attenuated=0
+
+# set esp=1 to also write gpu_oei_esp.h with oei_esp, which adds the integrals of a primitive pair
+# contracted with a density block to the electrostatic potential at an array of grid points, and
+# cpu_oei_esp.h with the host driver oei_esp_grid. Implies boys=1.
+esp=0
+
+# set field=1 to also write gpu_oei_field.h with oei_field_vertical, which saves the integrals and
+# their derivatives with respect to C in one pass, and OEint_vertical_dipoles, which adds the
+# integrals summed over point charges and point dipoles to the store array. Implies boys=1.
+field=0
+
+# set pair_cache=1 to also write cpu_oei_pair_cache.h, a host cache that keeps the primitive pair
+# quantities and point charge sums of the most recent QM geometries and, when only the point
+# charges change, updates the sums for the charges that moved. Implies charges=1.
+pair_cache=0
+
+# set cost=1 to also write oei_cost.json, the multiplication, addition, fma, VY load, store access,
+# nested constructor and live temporary counts of every class constructor and assembler branch.
+# Check them against samples/oei_cost.json with python -m genint cost.
+cost=0
+
+# set reg_budget to a number of registers (e.g. 64) to estimate the live values of every class
+# constructor and split the classes above it into row partial classes (e.g. DDint_0_1, ...), which
+# are constructed one part at a time. Implies ir=1. 0 splits nothing.
+reg_budget=0
 
-def print_store():
+# list the classes (e.g. ["FF", "FD", "DF"]) whose constructors loop over a recurrence table of
+# their components instead of unrolling them, for smaller code and shorter compile times at some
+# cost in speed. Implies ir=1. [] writes every class unrolled.
+compact=[]
 
-    labels = ("S", "Px", "Py", "Pz", "Dxy", "Dyz", "Dxz", "Dxx", "Dyy", "Dzz", "Fxyz", "Fxxy", "Fxyy", "Fxxz", "Fxzz", "Fyyz", "Fyzz", "Fxxx", "Fyyy", "Fzzz",\
-        "Gxxyy", "Gxxzz", "Gyyzz", "Gxxyz", "Gxyyz", "Gxyzz", "Gxxxz", "Gxzzz", "Gxxxy", "Gxyyy", "Gyyyz", "Gyzzz", "Gxxxx", "Gyyyy", "Gzzzz")
+# generate only the assembler branches listed here (e.g. ["DD", "PD"]) and the integral classes
+# they require. None generates all branches up to d functions.
+branches=None
 
-    for i in range(0, 35):
-        str=''
-        for j in range(0,35):
-            str += "[" + labels[i] + "|" + labels[j] + "]"
-        print(str)
+# generate one electron integral source code. The generator is only imported when this file is
+# run as a script.
+if __name__ == "__main__":
+    try:
+        os.mkdir(outdir)
+    except OSError as error:
+        print(error)
 
-print_store()
\ No newline at end of file
+    import src.oei.one_electron_integral as one_electron_integral
+    one_electron_integral.write_oei(outdir, func_qualifier=func_qualifier, cse=cse, ir=ir, grad_dce=grad_dce, grad_entries=grad_entries,\
+        plan=plan, ssa=ssa, hrr=hrr, sym=sym, nproc=nproc, cache=cache, branches=branches, batch=batch, numpy=numpy, boys=boys,\
+        charges=charges, tree=tree, attenuated=attenuated, esp=esp, field=field, pair_cache=pair_cache, cost=cost, reg_budget=reg_budget,\
+        compact=compact)
@@ -0,0 +1,284 @@
+#!---------------------------------------------------------------------!
+#! Written by Madu Manathunga on 07/01/2021                            !
+#!                                                                     !
+#! Copyright (C) 2020-2021 Merz lab                                    !
+#! Copyright (C) 2020-2021 Götz lab                                    !
+#!                                                                     !
+#! This source file is a part of QUICK-GenInt code generator and       !
+#! is subjected to the terms of the Mozilla Public License, v. 2.0.    !
+#! If a copy of the MPL was not distributed with this file, you can    !
+#! obtain one at http://mozilla.org/MPL/2.0/.                          !
+#!_____________________________________________________________________!
+
+#!---------------------------------------------------------------------!
+#! This source file contains the command line interface of QUICK       !
+#! integral code generator. Example:                                   !
+#!   python -m genint oei --max-l d --classes dd,pd --out DIR --host   !
+#!---------------------------------------------------------------------!
+
+import sys
+import os
+import argparse
+
+# Get the absolute path of the generator so that src is found from any working directory
+GenIntHome=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if GenIntHome not in sys.path:
+    sys.path.insert(0, GenIntHome)
+
+# shells supported by the assemblers
+shells=("s", "p", "d")
+
+# Return the integral classes of a comma separated list such as ff,fd,df as sorted labels, e.g.
+# ["DF", "FD", "FF"]
+def compact_list(value):
+    lbls=set()
+    for lbl in value.split(","):
+        lbl=lbl.strip().lower()
+        if len(lbl) != 2 or lbl[0] not in "spdf" or lbl[1] not in "spdf":
+            raise argparse.ArgumentTypeError("unknown class %s, expected two of s,p,d,f, e.g. ff" % (lbl))
+        lbls.add(lbl.upper())
+    return sorted(lbls)
+
+# Add the options of the generator, shared by the oei, bench and tune commands
+def add_generator_args(parser):
+    parser.add_argument("--max-l", default="d", choices=shells, help="highest shell of the assemblers (default: d)")
+    parser.add_argument("--classes", default=None, help="comma separated assembler branches to generate, e.g. dd,pd. "
+        "Only the integral classes they require are generated. Default: all branches up to max-l")
+    parser.add_argument("--cse", action="store_true", help="common subexpression elimination mode for assemblers")
+    parser.add_argument("--ir", action="store_true", help="lower classes and assemblers from the recurrence graph")
+    parser.add_argument("--sym", action="store_true", help="only generate [a|b] classes with a >= b, implies --ir")
+    parser.add_argument("--grad-dce", action="store_true", help="only compute store entries consumed by the gradient code, requires --grad-entries")
+    parser.add_argument("--grad-entries", default=None, help="json file with the consumed store entries of each gradient branch")
+    parser.add_argument("--plan", action="store_true", help="choose the recurrence step of each component (i,j), shared by all m, in --cse, --grad-dce, --ssa and --hrr branches; savings are small")
+    parser.add_argument("--ssa", action="store_true", help="write assembler branches as flat functions in single assignment form")
+    parser.add_argument("--hrr", action="store_true", help="use the horizontal recurrence after contraction")
+    parser.add_argument("--batch", action="store_true", help="also write host kernels vectorized over batches of primitive pairs")
+    parser.add_argument("--numpy", action="store_true", help="also write python functions that evaluate each class with numpy")
+    parser.add_argument("--boys", action="store_true", help="also write the Boys function producer of YVerticalTemp")
+    parser.add_argument("--charges", action="store_true", help="also write assemblers summed over arrays of point charges (implies --boys)")
+    parser.add_argument("--tree", action="store_true", help="also write host code that sums over an octree of point charges (implies --charges)")
+    parser.add_argument("--attenuated", action="store_true", help="also write the erf and erfc attenuated operator variants of the point charge assemblers (implies --charges)")
+    parser.add_argument("--esp", action="store_true", help="also write functions and a host driver that evaluate the electrostatic potential of a density on a grid (implies --boys)")
+    parser.add_argument("--field", action="store_true", help="also write functions for the integral derivatives with respect to C and sums over point dipoles (implies --boys)")
+    parser.add_argument("--pair-cache", action="store_true", help="also write a host cache of pair data and point charge sums for QM/MM with a fixed QM region (implies --charges)")
+    parser.add_argument("--cost", action="store_true", help="also write oei_cost.json with the static operation counts of the generated code")
+    parser.add_argument("--reg-budget", type=int, default=0, help="split classes whose estimated live values exceed this budget into partial classes, implies --ir (default: 0, off)")
+    parser.add_argument("--compact", type=compact_list, default=[], help="comma separated integral classes, e.g. ff,fd,df, whose constructors loop over a recurrence table instead of being unrolled, implies --ir")
+    parser.add_argument("--nproc", type=int, default=0, help="number of worker processes, 0 uses all cpus (default: 0)")
+    parser.add_argument("--no-cache", action="store_true", help="always regenerate and rewrite all files")
+
+def parse_args(argv):
+    parser=argparse.ArgumentParser(prog="genint", description="QUICK integral code generator")
+    sub=parser.add_subparsers(dest="command")
+    sub.required=True
+
+    oei=sub.add_parser("oei", help="generate one electron integral headers")
+    oei.add_argument("--out", default=os.path.join(os.getcwd(), "output"), help="output folder (default: ./output)")
+    oei.add_argument("--host", action="store_true", help="generate host code, i.e. no __device__ qualifiers")
+    add_generator_args(oei)
+
+    val=sub.add_parser("validate", help="compile generated headers for the host and compare them with the reference")
+    val.add_argument("--out", default=os.path.join(os.getcwd(), "output"), help="folder with the generated files (default: ./output)")
+    val.add_argument("--pairs", type=int, default=16, help="number of random primitive pairs (default: 16)")
+    val.add_argument("--seed", type=int, default=0, help="seed of the random pairs (default: 0)")
+    val.add_argument("--cxx", default=None, help="C++ compiler (default: $CXX or g++)")
+    val.add_argument("--tol", type=float, default=1e-10, help="max relative error (default: 1e-10)")
+
+    bench=sub.add_parser("bench", help="generate host headers for each branch, compile them and time the assemblers")
+    bench.add_argument("--out", default=os.path.join(os.getcwd(), "bench"), help="folder for the headers of each branch and the results (default: ./bench)")
+    bench.add_argument("--pairs", type=int, default=64, help="number of random primitive pairs (default: 64)")
+    bench.add_argument("--seed", type=int, default=0, help="seed of the random pairs (default: 0)")
+    bench.add_argument("--cxx", default=None, help="C++ compiler (default: $CXX or g++)")
+    bench.add_argument("--cxxflags", default="-O2", help="flags of the C++ compiler (default: -O2)")
+    bench.add_argument("--min-time", type=float, default=0.2, help="minimum seconds each function is timed for (default: 0.2)")
+    bench.add_argument("--json", default=None, help="json file of the results (default: OUT/bench.json)")
+    bench.add_argument("--compare", default=None, help="json file of an earlier run to compare the time per call with")
+    add_generator_args(bench)
+
+    tune=sub.add_parser("tune", help="time the variants of the switches of the generated headers on the host and write the fastest combination into a config header")
+    tune.add_argument("--out", default=os.path.join(os.getcwd(), "tune"), help="folder for the headers of each branch (default: ./tune)")
+    tune.add_argument("--header", default=None, help="config header to write (default: OUT/gpu_oei_config.h)")
+    tune.add_argument("--pairs", type=int, default=64, help="number of random primitive pairs (default: 64)")
+    tune.add_argument("--seed", type=int, default=0, help="seed of the random pairs (default: 0)")
+    tune.add_argument("--cxx", default=None, help="C++ compiler (default: $CXX or g++)")
+    tune.add_argument("--cxxflags", default="-O2", help="flags of the C++ compiler (default: -O2)")
+    tune.add_argument("--min-time", type=float, default=0.1, help="minimum seconds each function is timed for (default: 0.1)")
+    tune.add_argument("--margin", type=float, default=0.03, help="fraction by which a variant must be faster to be chosen (default: 0.03)")
+    add_generator_args(tune)
+
+    cost=sub.add_parser("cost", help="report the static operation counts of generated headers and check them against a baseline")
+    cost.add_argument("--out", default=os.path.join(os.getcwd(), "output"), help="folder with the generated files (default: ./output)")
+    cost.add_argument("--baseline", default=os.path.join(GenIntHome, "samples", "oei_cost.json"), help="report to compare with, any increase fails, as does a missing baseline (default: samples/oei_cost.json)")
+    cost.add_argument("--no-baseline", action="store_true", help="only report the counts, without comparing them against a baseline")
+    cost.add_argument("--json", default=None, help="also write the report to this file, e.g. to update the baseline")
+    cost.add_argument("--top", type=int, default=10, help="number of the most expensive branches and classes to print (default: 10)")
+    return parser, parser.parse_args(argv)
+
+# Return the assembler branches (e.g. ["DD", "PD"]) selected by --classes and --max-l, or None
+# if all branches of the default generator are requested.
+def select_branches(parser, args):
+    lmax=shells.index(args.max_l)
+    if args.classes is None:
+        if lmax == len(shells)-1:
+            return None
+        return [a.upper()+b.upper() for a in shells[:lmax+1] for b in shells[:lmax+1]]
+
+    branches=[]
+    for lbl in args.classes.split(","):
+        lbl=lbl.strip().lower()
+        if len(lbl) != 2 or lbl[0] not in shells or lbl[1] not in shells:
+            parser.error("unknown class %s, expected two of %s, e.g. dd" % (lbl, ",".join(shells)))
+        if shells.index(lbl[0]) > lmax or shells.index(lbl[1]) > lmax:
+            parser.error("class %s exceeds --max-l %s" % (lbl, args.max_l))
+        if lbl.upper() not in branches:
+            branches.append(lbl.upper())
+    return branches
+
+# Generate the headers of branches into outdir with the generator options of args
+def generate(args, outdir, func_qualifier, branches):
+    import src.oei.one_electron_integral as one_electron_integral
+
+    os.makedirs(outdir, exist_ok=True)
+    one_electron_integral.write_oei(outdir, func_qualifier=func_qualifier, cse=int(args.cse), ir=int(args.ir), grad_dce=int(args.grad_dce),\
+        grad_entries=args.grad_entries, plan=int(args.plan), ssa=int(args.ssa), hrr=int(args.hrr), sym=int(args.sym), nproc=args.nproc,\
+        cache=int(not args.no_cache), branches=branches, batch=int(args.batch), numpy=int(args.numpy), boys=int(args.boys),\
+        charges=int(args.charges), tree=int(args.tree), attenuated=int(args.attenuated), esp=int(args.esp), field=int(args.field),\
+        pair_cache=int(args.pair_cache), cost=int(args.cost), reg_budget=args.reg_budget, compact=args.compact)
+
+# Stop with an error for generator options of args that do not work together
+def check_generator_args(parser, args):
+    if args.grad_dce and args.grad_entries is None:
+        parser.error("--grad-dce requires --grad-entries, the store entries read by the gradient code")
+    if args.grad_entries is not None:
+        import src.oei.one_electron_integral as one_electron_integral
+        try:
+            one_electron_integral.check_grad_entries(one_electron_integral.read_grad_entries(args.grad_entries))
+        except ValueError as error:
+            parser.error("--grad-entries %s: %s" % (args.grad_entries, error))
+
+def run_oei(parser, args):
+    check_generator_args(parser, args)
+    branches=select_branches(parser, args)
+    func_qualifier = '' if args.host else '__device__ __inline__'
+    generate(args, args.out, func_qualifier, branches)
+
+def run_validate(parser, args):
+    import src.oei.validate as validate
+
+    if not validate.validate(args.out, args.pairs, args.seed, args.cxx, args.tol):
+        sys.exit(1)
+
+# Generate the host headers of each branch selected by args alone into a folder of args.out, so that
+# the compile time of a branch covers only the classes it needs. Returns ((I, J), folder) of the branches.
+def generate_branches(parser, args):
+    check_generator_args(parser, args)
+    branches=select_branches(parser, args)
+    if branches is None:
+        branches=[a.upper()+b.upper() for a in shells for b in shells]
+
+    outdirs=[]
+    for lbl in branches:
+        outdir=os.path.join(args.out, lbl)
+        generate(args, outdir, '', [lbl])
+        outdirs.append(((shells.index(lbl[0].lower()), shells.index(lbl[1].lower())), outdir))
+    return outdirs
+
+def run_bench(parser, args):
+    import src.oei.benchmark as benchmark
+
+    outdirs=generate_branches(parser, args)
+    results=benchmark.bench(outdirs, args.pairs, args.seed, args.cxx, args.cxxflags, args.min_time)
+    baseline=None
+    if args.compare is not None:
+        baseline=benchmark.read_json(args.compare)
+    for line in benchmark.report(results, baseline):
+        print(line)
+
+    fname=args.json if args.json is not None else os.path.join(args.out, "bench.json")
+    benchmark.write_json(fname, results, args.cxx, args.cxxflags, args.pairs, args.seed, args.min_time)
+    print("results written to %s" % (fname))
+
+def run_tune(parser, args):
+    import src.oei.autotune as autotune
+
+    outdirs=generate_branches(parser, args)
+    config, log, starts = autotune.tune(outdirs, args.pairs, args.seed, args.cxx, args.cxxflags, args.min_time, args.margin)
+    for line in autotune.report(log, starts):
+        print(line)
+
+    fname=args.header if args.header is not None else os.path.join(args.out, "gpu_oei_config.h")
+    autotune.write_config(fname, config, log, starts, args.cxx, args.cxxflags)
+    print("config written to %s" % (fname))
+
+def run_cost(parser, args):
+    import json
+    import src.oei.cost_model as cost_model
+
+    outputs={}
+    for name in os.listdir(args.out):
+        if name.endswith(".h"):
+            fh=open(os.path.join(args.out, name))
+            outputs[name]=fh.read()
+            fh.close()
+    if "gpu_oei_assembler.h" not in outputs:
+        print("Error: no generated headers found in %s. \n" % (args.out))
+        sys.exit(1)
+
+    # the counts of the generator (oei --cost) are checked against the generated text, which
+    # fails if they disagree or the headers were generated again without --cost
+    path=os.path.join(args.out, "oei_cost.json")
+    if os.path.isfile(path):
+        fh=open(path)
+        report=json.load(fh)
+        fh.close()
+        found=cost_model.cross_check(report, outputs)
+        for (key, name, counted, parsed) in found:
+            if name is None:
+                print("mismatch: %s is not found in the generated code" % (key))
+            else:
+                print("mismatch: %s %s %d in oei_cost.json, %d in the generated code" % (key, name, counted, parsed))
+        if len(found) > 0:
+            print("Error: %s does not match the generated headers, generate them again with --cost. \n" % (path))
+            sys.exit(1)
+    else:
+        print("%s not found, counting the generated text only (generate with --cost to count from the generator)" % (path))
+        report=cost_model.report(outputs)
+
+    for line in cost_model.summary(report, args.top):
+        print(line)
+    if args.json is not None:
+        fh=open(args.json, 'w')
+        fh.write(json.dumps(report, indent=1, sort_keys=True)+"\n")
+        fh.close()
+
+    if args.no_baseline:
+        return
+    if not os.path.isfile(args.baseline):
+        print("Error: baseline %s not found, pass --no-baseline to only report the counts. \n" % (args.baseline))
+        sys.exit(1)
+    fh=open(args.baseline)
+    baseline=json.load(fh)
+    fh.close()
+    found=cost_model.regressions(report, baseline)
+    for (section, key, name, old, new) in found:
+        print("regression: %s %s %d -> %d" % (key, name, old, new))
+    if len(found) > 0:
+        print("Error: %d regressions against %s. \n" % (len(found), args.baseline))
+        sys.exit(1)
+    print("no regressions against %s" % (args.baseline))
+
+def main(argv=None):
+    parser, args = parse_args(argv)
+    if args.command == "oei":
+        run_oei(parser, args)
+    elif args.command == "validate":
+        run_validate(parser, args)
+    elif args.command == "bench":
+        run_bench(parser, args)
+    elif args.command == "tune":
+        run_tune(parser, args)
+    elif args.command == "cost":
+        run_cost(parser, args)
+
+if __name__ == "__main__":
+    main()
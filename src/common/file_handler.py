@@ -13,15 +13,27 @@
 #! This source file contains classes for handling output files.        !
 #!---------------------------------------------------------------------!
 
-from datetime import date
+import os
+import re
+import json
+import hashlib
+import tempfile
+from datetime import date, datetime, timezone
 
 class fhandler:
     def __init__(self, fname):
         self.fname=fname
         pass
 
-def write_license(fh):
-    today = date.today()
+# date stamped into generated files. SOURCE_DATE_EPOCH is honored so that builds are reproducible.
+def build_date():
+    if "SOURCE_DATE_EPOCH" in os.environ:
+        return datetime.fromtimestamp(int(os.environ["SOURCE_DATE_EPOCH"]), tz=timezone.utc).date()
+    return date.today()
+
+def write_license(fh, today=None):
+    if today is None:
+        today = build_date()
     dt = today.strftime("%d/%m/%Y")
     fh.write("/*\n")
     fh.write(" !---------------------------------------------------------------------!\n")
@@ -34,4 +46,117 @@ def write_license(fh):
     fh.write(" ! License, v. 2.0. If a copy of the MPL was not distributed with this !\n")
     fh.write(" ! file, You can obtain one at http://mozilla.org/MPL/2.0/.            !\n")
     fh.write(" !_____________________________________________________________________!\n")
-    fh.write("*/\n\n")
\ No newline at end of file
+    fh.write("*/\n\n")
+
+# write license info as python comments
+def write_py_license(fh, today=None):
+    if today is None:
+        today = build_date()
+    dt = today.strftime("%d/%m/%Y")
+    fh.write("#!---------------------------------------------------------------------!\n")
+    fh.write("#! Written by QUICK-GenInt code generator on %s                !\n" % (dt))
+    fh.write("#!                                                                     !\n")
+    fh.write("#! Copyright (C) 2020-2021 Merz lab                                    !\n")
+    fh.write("#! Copyright (C) 2020-2021 Götz lab                                    !\n")
+    fh.write("#!                                                                     !\n")
+    fh.write("#! This Source Code Form is subject to the terms of the Mozilla Public !\n")
+    fh.write("#! License, v. 2.0. If a copy of the MPL was not distributed with this !\n")
+    fh.write("#! file, You can obtain one at http://mozilla.org/MPL/2.0/.            !\n")
+    fh.write("#!_____________________________________________________________________!\n\n")
+
+# write text into file fname. The text is first written into a temporary file with a unique name
+# in the same folder, which then replaces fname in a single step, so fname is never left
+# partially written and concurrent runs do not share a temporary file. The temporary file is
+# removed if writing fails. The file gets the permissions of a newly created file.
+def write_atomic(fname, text):
+    fh=tempfile.NamedTemporaryFile('w', dir=os.path.dirname(os.path.abspath(fname)), prefix=os.path.basename(fname)+".", suffix=".tmp", delete=False)
+    try:
+        with fh:
+            fh.write(text)
+        umask=os.umask(0)
+        os.umask(umask)
+        os.chmod(fh.name, 0o666 & ~umask)
+        os.replace(fh.name, fname)
+    except BaseException:
+        os.unlink(fh.name)
+        raise
+
+# remove the date stamp of write_license from text
+def strip_date(text):
+    return re.sub(r"Written by QUICK-GenInt code generator on \S+", "", text, count=1)
+
+# write text into file fname unless the file already holds the same text apart from the date
+# stamp. Unchanged files are left untouched, including their modification time. Returns True
+# if the file was written.
+def write_if_changed(fname, text):
+    if os.path.isfile(fname):
+        fh=open(fname,'r')
+        old_text=fh.read()
+        fh.close()
+        if strip_date(old_text) == strip_date(text):
+            return False
+
+    write_atomic(fname, text)
+    return True
+
+# name of the file that records the cache key and the hashes of the generated files
+cache_fname=".genint_cache.json"
+
+def file_hash(fname):
+    fh=open(fname,'rb')
+    h=hashlib.sha256(fh.read()).hexdigest()
+    fh.close()
+    return h
+
+# hash of all python source files of the generator below path
+def source_hash(path):
+    h=hashlib.sha256()
+    for root, dirs, files in sorted(os.walk(path)):
+        dirs.sort()
+        for fname in sorted(files):
+            if fname.endswith(".py"):
+                h.update(os.path.relpath(os.path.join(root, fname), path).encode())
+                fh=open(os.path.join(root, fname),'rb')
+                h.update(fh.read())
+                fh.close()
+    return h.hexdigest()
+
+# return True if the files in outdir were generated with the given cache key and have not been
+# modified since
+def cache_valid(outdir, key):
+    cache=read_cache(outdir)
+    if cache is None:
+        return False
+
+    if cache.get("key") != key:
+        return False
+    for (name, h) in cache.get("files", {}).items():
+        if not os.path.isfile(os.path.join(outdir, name)) or file_hash(os.path.join(outdir, name)) != h:
+            return False
+    return True
+
+# Return the contents of the cache file in outdir, or None if there is none
+def read_cache(outdir):
+    fname=os.path.join(outdir, cache_fname)
+    if not os.path.isfile(fname):
+        return None
+    fh=open(fname,'r')
+    try:
+        return json.load(fh)
+    except ValueError:
+        return None
+    finally:
+        fh.close()
+
+# Record the cache key, the hashes of the given files in outdir and the generation settings.
+# The cache file is the manifest of the files of the last run: files listed by the previous
+# cache file but not by this run belong to other settings and are removed.
+def write_cache(outdir, key, names, settings=None):
+    old=read_cache(outdir)
+    if old is not None:
+        for name in old.get("files", {}):
+            if name not in names and os.path.isfile(os.path.join(outdir, name)):
+                os.remove(os.path.join(outdir, name))
+
+    cache={"key": key, "files": dict([(name, file_hash(os.path.join(outdir, name))) for name in names]), "settings": settings}
+    write_atomic(os.path.join(outdir, cache_fname), json.dumps(cache, indent=1, sort_keys=True)+"\n")
@@ -45,6 +45,37 @@ Mcal=((0,0,0),\
     (2,2,0), (2,0,2), (0,2,2), (2,1,1), (1,2,1), (1,1,2), (3,0,1), (1,0,3), (3,1,0), (1,3,0), (0,3,1), (0,1,3), (4,0,0), (0,4,0), (0,0,4)\
     )
 
+# labels of basis functions in the store array, used to improve the readability of generated code
+lbl=("S", "Px", "Py", "Pz", "Dxy", "Dyz", "Dxz", "Dxx", "Dyy", "Dzz", "Fxyz", "Fxxy", "Fxyy", "Fxxz", "Fxzz", "Fyyz", "Fyzz", "Fxxx", "Fyyy", "Fzzz",\
+    "Gxxyy", "Gxxzz", "Gyyzz", "Gxxyz", "Gxyyz", "Gxyzz", "Gxxxz", "Gxzzz", "Gxxxy", "Gxyyy", "Gyyyz", "Gyzzz", "Gxxxx", "Gyyyy", "Gzzzz")
+
+# labels of shells with angular momentum 0, 1, 2, 3 and 4
+shell_lbl=("S", "P", "D", "F", "G")
+
+# angular momentum of the basis function located at index i of the store array
+def ang_mom(i):
+    return Mcal[i][0]+Mcal[i][1]+Mcal[i][2]
+
+# store array index of the basis function with cartesian exponents x, y and z
+def cart_idx(x, y, z):
+    return trans[x][y][z]-1
+
+# store array indices of all basis functions with angular momentum l
+def shell_idx(l):
+    return range(l*(l+1)*(l+2)//6, (l+1)*(l+2)*(l+3)//6)
+
+# store array index of the function at index idx lowered by n along cartesian direction k
+def lower_idx(idx, k, n=1):
+    tmp_mcal=[Mcal[idx][0], Mcal[idx][1], Mcal[idx][2]]
+    tmp_mcal[k] -= n
+    return cart_idx(tmp_mcal[0], tmp_mcal[1], tmp_mcal[2])
+
+# store array index of the function at index idx raised by n along cartesian direction k
+def raise_idx(idx, k, n=1):
+    tmp_mcal=[Mcal[idx][0], Mcal[idx][1], Mcal[idx][2]]
+    tmp_mcal[k] += n
+    return cart_idx(tmp_mcal[0], tmp_mcal[1], tmp_mcal[2])
+
 # compare stored values with fortran code, print in the same order
 def print_trans():
 
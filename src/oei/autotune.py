@@ -0,0 +1,223 @@
+#!---------------------------------------------------------------------!
+#! Written by Madu Manathunga on 07/01/2021                            !
+#!                                                                     !
+#! Copyright (C) 2020-2021 Merz lab                                    !
+#! Copyright (C) 2020-2021 Götz lab                                    !
+#!                                                                     !
+#! This source file is a part of QUICK-GenInt code generator and       !
+#! is subjected to the terms of the Mozilla Public License, v. 2.0.    !
+#! If a copy of the MPL was not distributed with this file, you can    !
+#! obtain one at http://mozilla.org/MPL/2.0/.                          !
+#!_____________________________________________________________________!
+
+#!---------------------------------------------------------------------!
+#! This source file contains an empirical tuner of the switches of the !
+#! generated headers, i.e. the macros tested with #ifdef and #ifndef   !
+#! such as REG_DD (integrals in registers instead of LOCSTOREFULL) or  !
+#! USE_PARTIAL_DP (partial classes). The switches of an integral class !
+#! form a group whose variants are all combinations of its switches,   !
+#! e.g. registers or LOCSTOREFULL with partial or full classes for FP. !
+#! Starting from the switches of the host driver, the variants of each !
+#! class are timed in turn with the benchmark harness of benchmark.py  !
+#! on the branches whose headers contain them, and the fastest is      !
+#! kept. Variants that do not compile or change the integrals are      !
+#! rejected. The winning variant of each class is written into a       !
+#! config header.                                                      !
+#!---------------------------------------------------------------------!
+
+import os
+import re
+import src.common.file_handler as file_handler
+import src.oei.benchmark as benchmark
+import src.oei.validate as validate
+
+# macros tested by the generated headers that do not select a code variant
+ignored=("DEBUG_OEI",)
+
+# largest relative change of the store checksum accepted for a variant
+checksum_tol=1e-10
+
+# switches of the generated headers in outdir, sorted
+def switches(outdir):
+    names=set()
+    for fname in sorted(os.listdir(outdir)):
+        if fname.endswith(".h"):
+            fh=open(os.path.join(outdir, fname))
+            names.update(re.findall(r"^#ifn?def\s+(\w+)", fh.read(), re.M))
+            fh.close()
+    return sorted([name for name in names if name not in ignored])
+
+# switches defined by the host drivers of validate.py and benchmark.py
+def default_config():
+    return set(re.findall(r"^#define (REG_\w+)", validate.stub, re.M))
+
+# integral class a switch belongs to, e.g. DD for REG_DD and USE_PARTIAL_DP
+def switch_class(name):
+    return name.split("_")[-1]
+
+# prefixes of the switches with the variants they select when defined and when undefined
+variant_names=(("REG_", "registers", "LOCSTOREFULL"), ("USE_PARTIAL_", "partial classes", "full class"))
+
+# Group switches by their integral class. Returns a list of (class, switches), sorted by class.
+def switch_groups(every):
+    groups={}
+    for name in every:
+        groups.setdefault(switch_class(name), []).append(name)
+    return [(cls, sorted(groups[cls])) for cls in sorted(groups)]
+
+# variants of a group of switches, i.e. the sets of its switches that are defined
+def variants(names):
+    out=[frozenset()]
+    for name in names:
+        out += [variant | set([name]) for variant in out]
+    return out
+
+# description of a variant of a group of switches, e.g. "LOCSTOREFULL, partial classes"
+def variant_label(names, variant):
+    words=[]
+    for name in names:
+        word=None
+        for (prefix, on, off) in variant_names:
+            if name.startswith(prefix):
+                word = on if name in variant else off
+        if word is None:
+            word = name if name in variant else "no %s" % (name)
+        words.append(word)
+    return ", ".join(words)
+
+# Time the branches in outdirs, a list of ((I, J), folder) as in benchmark.bench, with the switches in
+# config and return the time per call summed over both kinds and branches, and the checksums of
+# the store arrays, or None if a driver does not compile. measured caches the results of each
+# branch by the switches of config its headers contain.
+def measure(outdirs, config, names, measured, npairs, seed, cxx, cxxflags, min_time):
+    total=0.0
+    checksums={}
+    for ((I, J), outdir) in outdirs:
+        defines=frozenset([name for name in config if name in names[outdir]])
+        key=(outdir, defines)
+        if key not in measured:
+            try:
+                measured[key]=[benchmark.bench_function(outdir, I, J, kind, function, header, npairs, seed, cxx, cxxflags, min_time, defines)\
+                    for (kind, function, header) in benchmark.kinds]
+            except RuntimeError:
+                measured[key]=None
+        if measured[key] is None:
+            return None
+        for r in measured[key]:
+            total += r["ns_per_call"]
+            checksums[(outdir, r["kind"])]=r["checksum"]
+    return (total, checksums)
+
+# Coordinate search over the switch groups of every (see switch_groups) from the switches in
+# config: the variants of each class are timed in turn on the branches whose headers contain
+# its switches, with the switches of the other classes fixed, and the fastest variant that
+# compiles and keeps the checksums of reference replaces the current one if it is faster by
+# more than the fraction margin. Sweeps are repeated until none changes a class, at most passes
+# times. Returns the switches and the log of the last sweep, a list of (class, switches,
+# branches, results, chosen variant, status) with results a list of (variant, time, note) for
+# each variant, where time is None if the variant does not compile, note is None or the reason
+# the variant is rejected and status is "kept" or "changed".
+def search(outdirs, config, every, names, measured, reference, margin, passes, *bench_args):
+    for n in range(0, passes):
+        log=[]
+        for (cls, group) in switch_groups(every):
+            affected=[(IJ, outdir) for (IJ, outdir) in outdirs if any([name in names[outdir] for name in group])]
+            branches=[benchmark.shells[I]+benchmark.shells[J] for ((I, J), outdir) in affected]
+            current=frozenset(config & set(group))
+
+            results=[]
+            times={}
+            for variant in variants(group):
+                result=measure(affected, (config - set(group)) | variant, names, measured, *bench_args)
+                note=None
+                if result is None:
+                    note="fails to compile"
+                elif any([abs(result[1][k]-reference[1][k]) > checksum_tol*abs(reference[1][k]) for k in result[1]]):
+                    note="changes the integrals"
+                else:
+                    times[variant]=result[0]
+                results.append((variant, None if result is None else result[0], note))
+
+            chosen=current
+            best=min(times, key=lambda variant: times[variant])
+            if best != current and times[best] < (1.0-margin)*times[current]:
+                chosen=best
+                config=(config - set(group)) | best
+            log.append((cls, group, branches, results, chosen, "kept" if chosen == current else "changed"))
+        if all([entry[5] != "changed" for entry in log]):
+            break
+    return (config, log)
+
+# Tune the switches of the headers in outdirs, a list of ((I, J), folder) as in benchmark.bench.
+# The switches of different classes depend on each other, e.g. REG_FS can only be undefined
+# together with the REG_* switches of the classes built from FS, so changing the variant of one
+# class at a time does not reach all combinations. The coordinate search of search therefore starts from two combinations, the switches
+# of default_config and none at all, and the faster result over all branches wins. Returns the
+# switches, the log of search and a list of (start, switches, time over all branches) of the
+# starts that compile.
+def tune(outdirs, npairs=64, seed=0, cxx=None, cxxflags="-O2", min_time=0.1, margin=0.03, passes=3):
+    if cxx is None:
+        cxx=os.environ.get("CXX", "g++")
+    bench_args=(npairs, seed, cxx, cxxflags, min_time)
+    names=dict([(outdir, switches(outdir)) for (IJ, outdir) in outdirs])
+    every=sorted(set([name for outdir in names for name in names[outdir]]))
+
+    measured={}
+    reference=None
+    results=[]
+    starts=[]
+    for (start, config) in (("default", set([name for name in default_config() if name in every])), ("none", set())):
+        initial=measure(outdirs, config, names, measured, *bench_args)
+        if initial is None or config in starts:
+            continue
+        starts.append(config)
+        if reference is None:
+            reference=initial
+        config, log = search(outdirs, config, every, names, measured, reference, margin, passes, *bench_args)
+        results.append((measure(outdirs, config, names, measured, *bench_args)[0], start, config, log))
+    if len(results) == 0:
+        raise RuntimeError("the headers compile neither with the default switches nor without switches")
+
+    best=min(results, key=lambda r: r[0])
+    return (best[2], best[3], [(start, config, total) for (total, start, config, log) in results])
+
+# report lines of the log and the starts of tune
+def report(log, starts):
+    lines=[]
+    for (start, config, total) in starts:
+        lines.append("search from %-8s %12.1f ns with %s" % (start, total, " ".join(sorted(config)) if config else "no switches"))
+    lines.append("%-5s %-32s %12s  %s" % ("class", "variant", "ns", "result"))
+    for (cls, group, branches, results, chosen, status) in log:
+        for (variant, time, note) in results:
+            if note is None and variant == chosen:
+                note="chosen, %s (%s)" % (status, ",".join(branches))
+            lines.append("%-5s %-32s %12s  %s" % (cls, variant_label(group, variant), "-" if time is None else "%.1f" % (time), note or ""))
+    return lines
+
+# Write the config header with the switches of config to fname. The switches of each class are
+# defined or undefined as its chosen variant, with a comment on the times of all variants, the
+# compiler and flags they were measured with and the times of the starts of tune.
+def write_config(fname, config, log, starts, cxx, cxxflags):
+    if cxx is None:
+        cxx=os.environ.get("CXX", "g++")
+    fh=open(fname, 'w')
+    file_handler.write_license(fh)
+    fh.write("/* switches of the generated one electron integral headers chosen by python -m genint tune \n")
+    fh.write("   compiler: %s, flags: %s \n" % (benchmark.compiler_version(cxx), cxxflags))
+    fh.write("   times are ns per call of OEint_vertical and oei_grad_vertical summed over the branches \n")
+    for (start, switches, total) in starts:
+        fh.write("   search from %s switches: %.1f ns \n" % (start, total))
+    fh.write("*/ \n\n")
+    fh.write("#ifndef GPU_OEI_CONFIG_H \n")
+    fh.write("#define GPU_OEI_CONFIG_H \n")
+    for (cls, group, branches, results, chosen, status) in log:
+        fmt=lambda time, note: "does not compile" if time is None else "%.1f ns%s" % (time, "" if note is None else ", "+note)
+        fh.write("\n/* %s class, branches %s: %s, chosen %s */ \n" % (cls, ",".join(branches),\
+            "; ".join(["%s %s" % (variant_label(group, variant), fmt(time, note)) for (variant, time, note) in results]), variant_label(group, chosen)))
+        for name in group:
+            if name in config:
+                fh.write("#define %s \n" % (name))
+            else:
+                fh.write("#undef %s \n" % (name))
+    fh.write("\n#endif \n")
+    fh.close()
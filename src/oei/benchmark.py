@@ -0,0 +1,202 @@
+#!---------------------------------------------------------------------!
+#! Written by Madu Manathunga on 07/01/2021                            !
+#!                                                                     !
+#! Copyright (C) 2020-2021 Merz lab                                    !
+#! Copyright (C) 2020-2021 Götz lab                                    !
+#!                                                                     !
+#! This source file is a part of QUICK-GenInt code generator and       !
+#! is subjected to the terms of the Mozilla Public License, v. 2.0.    !
+#! If a copy of the MPL was not distributed with this file, you can    !
+#! obtain one at http://mozilla.org/MPL/2.0/.                          !
+#!_____________________________________________________________________!
+
+#!---------------------------------------------------------------------!
+#! This source file contains a host benchmark of the generated         !
+#! assemblers. Each branch is generated into its own folder, so that   !
+#! the compile time of a driver covers the classes of that branch      !
+#! only. The driver calls OEint_vertical or oei_grad_vertical for      !
+#! random primitive pairs of validate.py until a minimum time has      !
+#! passed and reports the integrals per second, the time per call and  !
+#! the compile time. Results are stored as json and can be compared    !
+#! with those of an earlier run.                                       !
+#!---------------------------------------------------------------------!
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+import src.common.params as params
+import src.oei.validate as validate
+from src.oei.iclass.OEint import grad_classes
+
+# timed functions with the header that defines them
+kinds=(("vertical", "OEint_vertical", "gpu_oei_assembler.h"), ("grad", "oei_grad_vertical", "gpu_oei_grad_assembler.h"))
+
+# shells of the assembler branches, e.g. branch DD is (2, 2)
+shells="SPD"
+
+# validate.stub with its REG_* switches replaced by the macros in defines
+def config_stub(defines):
+    lines=[line for line in validate.stub.split("\n") if not line.startswith("#define REG_")]
+    return "\n".join(lines)+"".join(["#define %s\n" % (name) for name in sorted(defines)])
+
+# Integral classes saved into the store array by the function of kind for branch (I, J). In
+# horizontal recurrence mode (hrr), OEint_vertical saves the [e|s] integrals, e=I,...,I+J, that
+# OEint_horizontal transfers into [I|J] after contraction, see save_int_hrr.
+def saved_classes(kind, I, J, hrr=0):
+    if kind == "grad":
+        return grad_classes(I, J)
+    if hrr == 1:
+        return [(l, 0) for l in range(I, I+J+1)]
+    return [(I, J)]
+
+# 1 if the headers in outdir were generated in horizontal recurrence mode, as in validate.validate
+def hrr_mode(outdir):
+    fh=open(os.path.join(outdir, "gpu_oei_assembler.h"))
+    hrr=int("OEint_horizontal" in fh.read())
+    fh.close()
+    return hrr
+
+# Return the source of the driver of function of kind for branch (I, J). It reads n pairs from
+# stdin as in validate.driver_source, without the values the function does not take, and calls
+# the function for all pairs in rounds, doubling the number of rounds until min_time seconds have
+# passed. It prints the number of calls, the elapsed seconds of the last measurement, the number
+# of nonzero store entries of the saved classes after one call, i.e. the integrals it computes,
+# and their checksum; other entries may hold values spilled by the classes. If defines is set,
+# the switches of the generated headers are those macros instead of the REG_* switches of
+# validate.stub. hrr selects the saved classes of horizontal recurrence mode, see saved_classes.
+def driver_source(I, J, kind, function, header, min_time, defines=None, hrr=0):
+    # loops over the store entries of the saved classes with the given body
+    def loops(body):
+        code=""
+        for (la, lb) in saved_classes(kind, I, J, hrr):
+            code += "  for(int i=%d; i<%d; i++) for(int j=%d; j<%d; j++) %s\n" % (params.shell_idx(la)[0], params.shell_idx(la)[-1]+1,\
+                params.shell_idx(lb)[0], params.shell_idx(lb)[-1]+1, body)
+        return code
+
+    src=validate.stub if defines is None else config_stub(defines)
+    for name in ("gpu_oei_classes.h", "gpu_oei_definitions.h", header):
+        src += '#include "%s"\n' % (name)
+    src += '''#include <chrono>
+
+static QUICKDouble store[STOREDIM*STOREDIM*8];
+
+int main(){
+  int n;
+  if(scanf("%%d", &n) != 1) return 1;
+  double* in=new double[n*(10+%d)];
+  for(int k=0; k<n*(10+%d); k++) if(scanf("%%lf", &in[k]) != 1) return 1;
+
+  %s(%d, %d, 0, 1, in[0], in[1], in[2], in[3], in[4], in[5], in[6], in[7], in[8], in[9], store, in+10);
+  int integrals=0;
+%s
+  long rounds=1;
+  double elapsed=0;
+  while(true){
+    std::chrono::steady_clock::time_point t0=std::chrono::steady_clock::now();
+    for(long r=0; r<rounds; r++){
+      for(int p=0; p<n; p++){
+        double* q=in+p*(10+%d);
+        %s(%d, %d, 0, 1, q[0], q[1], q[2], q[3], q[4], q[5], q[6], q[7], q[8], q[9], store, q+10);
+        // the store array counts as read after each call, so calls are neither merged nor removed
+        asm volatile("" : : "r"(store) : "memory");
+      }
+    }
+    elapsed=std::chrono::duration<double>(std::chrono::steady_clock::now()-t0).count();
+    if(elapsed >= %.17e) break;
+    rounds *= 2;
+  }
+
+  double checksum=0;
+%s  printf("%%ld %%.17e %%d %%.17e\\n", rounds*n, elapsed, integrals, checksum);
+  return 0;
+}
+''' % (validate.nboys, validate.nboys, function, I, J, loops("if(LOCSTORE(store, i, j, STOREDIM, STOREDIM) != 0) integrals++;"),\
+        validate.nboys, function, I, J, min_time, loops("checksum += LOCSTORE(store, i, j, STOREDIM, STOREDIM);"))
+    return src
+
+# Compile the driver of function for branch (I, J) with the headers in outdir and time it for
+# npairs random pairs. Returns a dictionary with the measured values, raises RuntimeError if the
+# driver does not compile.
+def bench_function(outdir, I, J, kind, function, header, npairs, seed, cxx, cxxflags, min_time, defines=None):
+    A, B, T, prefactor, q, exponents = validate.random_pairs(npairs, seed)
+    tmpdir=tempfile.mkdtemp(prefix="genint_bench_")
+    try:
+        for name in os.listdir(outdir):
+            if name.endswith(".h"):
+                shutil.copy(os.path.join(outdir, name), tmpdir)
+        fh=open(os.path.join(tmpdir, "driver.cpp"), 'w')
+        fh.write(driver_source(I, J, kind, function, header, min_time, defines, hrr_mode(outdir)))
+        fh.close()
+
+        exe=os.path.join(tmpdir, "driver")
+        start=time.perf_counter()
+        proc=subprocess.run([cxx]+cxxflags.split()+["-w", "-o", exe, os.path.join(tmpdir, "driver.cpp")], capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError("the %s driver of branch %s does not compile:\n%s" % (kind, shells[I]+shells[J], proc.stderr))
+        compile_time=time.perf_counter()-start
+
+        lines=["%d" % (npairs)]
+        for p in range(0, npairs):
+            values=[q[k][p] for k in range(0, 10)]+list(q[10][:,p])
+            lines.append(" ".join(["%.17e" % (v) for v in values]))
+        proc=subprocess.run([exe], input="\n".join(lines)+"\n", capture_output=True, text=True, check=True)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    calls, elapsed, integrals, checksum = proc.stdout.split()
+    calls=int(calls)
+    elapsed=float(elapsed)
+    integrals=int(integrals)
+    return {"branch": shells[I]+shells[J], "kind": kind, "integrals_per_call": integrals, "calls": calls,\
+        "ns_per_call": 1e9*elapsed/calls, "integrals_per_second": integrals*calls/elapsed, "compile_seconds": compile_time,\
+        "checksum": float(checksum)}
+
+# Benchmark the branches in outdirs, a list of ((I, J), folder) where folder holds the headers
+# generated for that branch only. Returns the results of bench_function for every branch and kind.
+def bench(outdirs, npairs=64, seed=0, cxx=None, cxxflags="-O2", min_time=0.2):
+    if cxx is None:
+        cxx=os.environ.get("CXX", "g++")
+    results=[]
+    for ((I, J), outdir) in outdirs:
+        for (kind, function, header) in kinds:
+            results.append(bench_function(outdir, I, J, kind, function, header, npairs, seed, cxx, cxxflags, min_time))
+    return results
+
+# first line of the version of the C++ compiler cxx, stored with the results
+def compiler_version(cxx):
+    proc=subprocess.run([cxx, "--version"], capture_output=True, text=True)
+    return proc.stdout.split("\n")[0]
+
+# Return the report lines of results. If baseline holds the results of an earlier run, the time
+# per call of each branch and kind it also measured is compared, speedups above 1 are faster.
+def report(results, baseline=None):
+    old={}
+    if baseline is not None:
+        old=dict([((r["branch"], r["kind"]), r) for r in baseline])
+    lines=["%-6s %-8s %9s %14s %12s %10s%s" % ("branch", "kind", "integrals", "integrals/s", "ns/call", "compile s", "   speedup" if old else "")]
+    for r in results:
+        line="%-6s %-8s %9d %14.4e %12.2f %10.2f" % (r["branch"], r["kind"], r["integrals_per_call"], r["integrals_per_second"], r["ns_per_call"], r["compile_seconds"])
+        if (r["branch"], r["kind"]) in old:
+            line += " %9.2fx" % (old[(r["branch"], r["kind"])]["ns_per_call"]/r["ns_per_call"])
+        lines.append(line)
+    return lines
+
+# Write results with the compiler, its flags and the random pairs to fname as json
+def write_json(fname, results, cxx, cxxflags, npairs, seed, min_time):
+    if cxx is None:
+        cxx=os.environ.get("CXX", "g++")
+    data={"compiler": compiler_version(cxx), "cxxflags": cxxflags, "pairs": npairs, "seed": seed, "min_time": min_time, "results": results}
+    fh=open(fname, 'w')
+    json.dump(data, fh, indent=2)
+    fh.write("\n")
+    fh.close()
+
+# Return the results stored in fname by write_json
+def read_json(fname):
+    fh=open(fname)
+    data=json.load(fh)
+    fh.close()
+    return data["results"]
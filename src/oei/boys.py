@@ -0,0 +1,172 @@
+#!---------------------------------------------------------------------!
+#! Written by Madu Manathunga on 07/01/2021                            !
+#!                                                                     !
+#! Copyright (C) 2020-2021 Merz lab                                    !
+#! Copyright (C) 2020-2021 Götz lab                                    !
+#!                                                                     !
+#! This source file is a part of QUICK-GenInt code generator and       !
+#! is subjected to the terms of the Mozilla Public License, v. 2.0.    !
+#! If a copy of the MPL was not distributed with this file, you can    !
+#! obtain one at http://mozilla.org/MPL/2.0/.                          !
+#!_____________________________________________________________________!
+
+#!---------------------------------------------------------------------!
+#! This source file contains a printer for the Boys function producer  !
+#! that fills YVerticalTemp. For T below boys_switch, the highest      !
+#! order is evaluated from a Taylor expansion around the nearest point !
+#! of a grid tabulated at generation time and lower orders follow from !
+#! the downward recursion. For larger T, F_0 is given by the           !
+#! asymptotic formula and higher orders by the upward recursion.       !
+#!---------------------------------------------------------------------!
+
+import math
+
+# spacing of the Taylor grid and number of Taylor terms after the constant one. With the nearest
+# grid point, |dT| <= boys_delta/2 and the truncation error is below 2e-13 relative to F_M.
+boys_delta=0.1
+boys_taylor=6
+
+# name of the function that computes the Boys function values up to order M
+def boys_name(M):
+    return "oei_boys_%d" % (M)
+
+# Taylor grid T_k = k*boys_delta, k=0,...,ngrid-1, covering [0, switch]. Row k holds F_m(T_k) for
+# m = 0,...,ncol-1, computed with the reference implementation at generation time.
+def boys_table(mmax, switch):
+    import numpy as np
+    import src.oei.reference as reference
+
+    ngrid=int(math.ceil(switch/boys_delta))+1
+    return reference.boys(boys_ncol(mmax)-1, np.arange(0, ngrid)*boys_delta).T
+
+# Write the statements that compute prefactor*F_m(T) for m = 0,...,M and assign them to
+# target(m). T and prefactor are the names of the argument and prefactor, where prefactor may
+# also be a function of m, ncol is the row length of the table written by write_boys. Locals e,
+# k, dT, F, f and invT are declared in a new scope.
+def write_boys_body(fh, M, ncol, switch, target, T="T", prefactor="prefactor", indent="  "):
+    if not callable(prefactor):
+        prefactor=(lambda name: lambda m: name)(prefactor)
+    fh.write("%s{ \n" % (indent))
+    fh.write("%s  const QUICKDouble e = exp(-%s); \n" % (indent, T))
+    fh.write("%s  if(%s < %.1f){ \n" % (indent, T, switch))
+
+    # Taylor expansion F_M(T) = sum_j F_M+j(T_k) (T_k-T)^j / j! in Horner form
+    fh.write("%s    const int k = (int)(%s * %.17e + 0.5); \n" % (indent, T, 1.0/boys_delta))
+    fh.write("%s    const QUICKDouble dT = k * %.17e - %s; \n" % (indent, boys_delta, T))
+    fh.write("%s    const QUICKDouble* F = oei_boys_table + k * %d + %d; \n" % (indent, ncol, M))
+    fh.write("%s    QUICKDouble f = F[%d]; \n" % (indent, boys_taylor))
+    for j in range(boys_taylor-1, 0, -1):
+        fh.write("%s    f = F[%d] + %.17e * dT * f; \n" % (indent, j, 1.0/(j+1)))
+    fh.write("%s    f = F[0] + dT * f; \n" % (indent))
+    fh.write("%s    %s = %s * f; \n" % (indent, target(M), prefactor(M)))
+    for m in range(M-1, -1, -1):
+        fh.write("%s    f = (2.0 * %s * f + e) * %.17e; \n" % (indent, T, 1.0/(2*m+1)))
+        fh.write("%s    %s = %s * f; \n" % (indent, target(m), prefactor(m)))
+
+    fh.write("%s  }else{ \n" % (indent))
+    fh.write("%s    const QUICKDouble invT = 1.0 / %s; \n" % (indent, T))
+    fh.write("%s    QUICKDouble f = %.17e * sqrt(invT); \n" % (indent, 0.5*math.sqrt(math.pi)))
+    fh.write("%s    %s = %s * f; \n" % (indent, target(0), prefactor(0)))
+    for m in range(0, M):
+        fh.write("%s    f = (%.1f * f - e) * 0.5 * invT; \n" % (indent, 2*m+1))
+        fh.write("%s    %s = %s * f; \n" % (indent, target(m+1), prefactor(m+1)))
+    fh.write("%s  } \n" % (indent))
+    fh.write("%s} \n" % (indent))
+
+# write the function that computes VY(0, 0, m) = prefactor*F_m(T) for m = 0,...,M
+def write_boys_function(fh, M, ncol, switch, func_qualifier):
+    fh.write("\n/* Boys function values F_m(T) times prefactor, m=0,...,%d */ \n" % (M))
+    fh.write("%s void %s(QUICKDouble T, QUICKDouble prefactor, QUICKDouble* YVerticalTemp){ \n" % (func_qualifier, boys_name(M)))
+    write_boys_body(fh, M, ncol, switch, lambda m: "VY(0, 0, %d)" % (m))
+    fh.write("} \n")
+
+# operators of the attenuated variants. The Boys function values of erf(omega r)/r are those of
+# 1/r at kappa*T, times sqrt(kappa)*kappa^m with kappa = omega^2/(omega^2+Zeta), so the vertical
+# recurrence is unchanged; erfc(omega r)/r = 1/r - erf(omega r)/r.
+operators=("erf", "erfc")
+
+# name of the function that computes the Boys function values of an attenuated operator
+def operator_name(op, M):
+    return "oei_boys_%s_%d" % (op, M)
+
+# Write the statements that compute the Boys function values of operator op ("coulomb", "erf" or
+# "erfc") for m = 0,...,M and assign them to target(m). The prefactor is named prefactor, or
+# qprefactor if charge is given, which must then hold the charge times the prefactor. For erf and
+# erfc, kappa and skappa_m (see write_kappa) must be defined; erfc uses locals ve_m.
+def write_operator_body(fh, op, M, ncol, switch, target, T, charge, indent):
+    pref = "prefactor" if charge is None else "qprefactor"
+    scaled=lambda m: "skappa_%d" % (m) if charge is None else "%s * skappa_%d" % (charge, m)
+    if op == "coulomb":
+        write_boys_body(fh, M, ncol, switch, target, T, pref, indent)
+    elif op == "erf":
+        fh.write("%sconst QUICKDouble kT = kappa * %s; \n" % (indent, T))
+        write_boys_body(fh, M, ncol, switch, target, "kT", scaled, indent)
+    else:
+        fh.write("%sconst QUICKDouble kT = kappa * %s; \n" % (indent, T))
+        fh.write("%sQUICKDouble %s; \n" % (indent, ", ".join(["ve_%d" % (m) for m in range(0, M+1)])))
+        write_boys_body(fh, M, ncol, switch, target, T, pref, indent)
+        write_boys_body(fh, M, ncol, switch, lambda m: "ve_%d" % (m), "kT", scaled, indent)
+        for m in range(0, M+1):
+            fh.write("%s%s -= ve_%d; \n" % (indent, target(m), m))
+
+# Write the definitions of kappa and skappa_m = prefactor*sqrt(kappa)*kappa^m, m=0,...,M, for an
+# attenuated operator, where Zeta and omega are the names of the exponent and attenuation parameter
+def write_kappa(fh, M, Zeta, omega, prefactor, indent):
+    fh.write("%sconst QUICKDouble kappa = %s * %s / (%s * %s + %s); \n" % (indent, omega, omega, omega, omega, Zeta))
+    fh.write("%sconst QUICKDouble skappa_0 = %s * sqrt(kappa); \n" % (indent, prefactor))
+    for m in range(1, M+1):
+        fh.write("%sconst QUICKDouble skappa_%d = skappa_%d * kappa; \n" % (indent, m, m-1))
+
+# write the function that fills VY(0, 0, m), m = 0,...,M, with the Boys function values of the
+# attenuated operator op for a pair with exponent Zeta
+def write_operator_function(fh, op, M, ncol, switch, func_qualifier):
+    fh.write("\n/* Boys function values of %s(omega r)/r times prefactor, m=0,...,%d */ \n" % (op, M))
+    fh.write("%s void %s(QUICKDouble T, QUICKDouble prefactor, QUICKDouble Zeta, QUICKDouble omega, QUICKDouble* YVerticalTemp){ \n" % \
+        (func_qualifier, operator_name(op, M)))
+    write_kappa(fh, M, "Zeta", "omega", "prefactor", "  ")
+    write_operator_body(fh, op, M, ncol, switch, lambda m: "VY(0, 0, %d)" % (m), "T", None, "  ")
+    fh.write("} \n")
+
+# number of columns of the Boys function table for orders up to mmax
+def boys_ncol(mmax):
+    return mmax+boys_taylor+1
+
+# Write the Boys function producer for the given orders, i.e. a function oei_boys_M for every M
+# in orders and oei_boys(M, T, prefactor, YVerticalTemp) that dispatches to them. The table is
+# placed in device memory if the functions are device functions. If attenuated is set, the
+# producers oei_boys_erf and oei_boys_erfc(M, T, prefactor, Zeta, omega, YVerticalTemp) of the
+# attenuated operators are written too.
+def write_boys(fh, orders, func_qualifier, attenuated=0):
+    import src.oei.reference as reference
+
+    switch=reference.boys_switch
+    table=boys_table(max(orders), switch)
+    ngrid, ncol = table.shape
+
+    fh.write("/* Boys function table, row k holds F_m(%.2f*k) for m=0,...,%d */ \n" % (boys_delta, ncol-1))
+    fh.write("%sstatic const QUICKDouble oei_boys_table[%d] = { \n" % ("__device__ " if "__device__" in func_qualifier else "", ngrid*ncol))
+    for k in range(0, ngrid):
+        fh.write("  %s%s \n" % (", ".join(["%.17e" % (v) for v in table[k]]), "," if k < ngrid-1 else ""))
+    fh.write("}; \n")
+
+    for M in orders:
+        write_boys_function(fh, M, ncol, switch, func_qualifier)
+
+    fh.write("\n%s void oei_boys(int M, QUICKDouble T, QUICKDouble prefactor, QUICKDouble* YVerticalTemp){ \n" % (func_qualifier))
+    for M in orders:
+        fh.write("  if(M == %d){ \n" % (M))
+        fh.write("    %s(T, prefactor, YVerticalTemp); \n" % (boys_name(M)))
+        fh.write("  } \n")
+    fh.write("} \n")
+
+    if attenuated == 1:
+        for op in operators:
+            for M in orders:
+                write_operator_function(fh, op, M, ncol, switch, func_qualifier)
+
+            fh.write("\n%s void oei_boys_%s(int M, QUICKDouble T, QUICKDouble prefactor, QUICKDouble Zeta, QUICKDouble omega, QUICKDouble* YVerticalTemp){ \n" % (func_qualifier, op))
+            for M in orders:
+                fh.write("  if(M == %d){ \n" % (M))
+                fh.write("    %s(T, prefactor, Zeta, omega, YVerticalTemp); \n" % (operator_name(op, M)))
+                fh.write("  } \n")
+            fh.write("} \n")
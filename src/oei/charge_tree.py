@@ -0,0 +1,359 @@
+#!---------------------------------------------------------------------!
+#! Written by Madu Manathunga on 07/01/2021                            !
+#!                                                                     !
+#! Copyright (C) 2020-2021 Merz lab                                    !
+#! Copyright (C) 2020-2021 Götz lab                                    !
+#!                                                                     !
+#! This source file is a part of QUICK-GenInt code generator and       !
+#! is subjected to the terms of the Mozilla Public License, v. 2.0.    !
+#! If a copy of the MPL was not distributed with this file, you can    !
+#! obtain one at http://mozilla.org/MPL/2.0/.                          !
+#!_____________________________________________________________________!
+
+#!---------------------------------------------------------------------!
+#! This source file contains a printer for host code that sums one     !
+#! electron integrals over many point charges with an octree. Charges  !
+#! in leaves close to the weighted center P go through the point       !
+#! charge assemblers of gpu_oei_charges.h. A node that is far from P   !
+#! is replaced by the cartesian moments of its charges about the node  !
+#! center, which give the Taylor coefficients of their potential at P. !
+#! Beyond the switch of the Boys function, a primitive pair interacts  !
+#! with an external potential through its Hermite expansion only,      !
+#! [a|b] = sqrt(pi/p)/2 prefactor sum_tuv E_t E_u E_v d^tuv/dP^tuv 1/R,!
+#! so the pair side of the far field is exact and the error is set by  !
+#! the truncation of the node moments, controlled by theta.            !
+#!---------------------------------------------------------------------!
+
+import src.common.params as params
+import src.oei.printer as printer
+
+# highest order of the cartesian moments kept for each node. The relative error of a far node is
+# of order theta^(tree_order+1).
+tree_order=3
+
+# Hermite and moment indices (t, u, v) with t+u+v <= n, ordered by t+u+v. Arrays indexed this way
+# for a smaller n are prefixes of those for a larger n.
+def hermite_index(n):
+    return [(t, s-t-w, w) for s in range(0, n+1) for t in range(s, -1, -1) for w in range(0, s-t+1)]
+
+def factorial(n):
+    return 1 if n <= 1 else n*factorial(n-1)
+
+# name of the function that adds the Taylor coefficients of a node potential up to order L
+def phi_name(L):
+    return "oei_tree_phi_%d" % (L)
+
+# name of the function that contracts the Taylor coefficients with the Hermite expansion of [la|lb]
+def far_name(la, lb):
+    return "oei_tree_far_%s" % (printer.class_lbl(la, lb))
+
+# name of the assembler branch that sums the [I|J] integral over the charges of a tree
+def tree_name(I, J, grad):
+    return "oei_%s_%s" % ("grad_vertical_tree" if grad else "vertical_tree", printer.class_lbl(I, J))
+
+# Write the function that computes the node moments mc[k] = sum_c q_c (-s_c)^k / k! for the
+# multi-indices k of hermite_index(tree_order), where s_c is the position of charge c relative
+# to the node center Z.
+def write_moments(fh):
+    fh.write("\n/* moments of the charges of a node about its center, see hermite_index */ \n")
+    fh.write("inline void oei_tree_moments(int n, const QUICKDouble* Cx, const QUICKDouble* Cy, const QUICKDouble* Cz, const QUICKDouble* q,\n\
+        QUICKDouble Zx, QUICKDouble Zy, QUICKDouble Zz, QUICKDouble* mc){ \n")
+    fh.write("    for(int k=0; k<%d; k++) mc[k]=0.0; \n" % (len(hermite_index(tree_order))))
+    fh.write("    for(int c=0; c<n; c++){ \n")
+    fh.write("        const QUICKDouble sx = Zx - Cx[c]; \n")
+    fh.write("        const QUICKDouble sy = Zy - Cy[c]; \n")
+    fh.write("        const QUICKDouble sz = Zz - Cz[c]; \n")
+    for (k, (t, u, v)) in enumerate(hermite_index(tree_order)):
+        factors=["q[c]"]+["sx"]*t+["sy"]*u+["sz"]*v
+        coeff=1.0/(factorial(t)*factorial(u)*factorial(v))
+        fh.write("        mc[%d] += %s%s; \n" % (k, "" if coeff == 1.0 else "%.17e * " % (coeff), " * ".join(factors)))
+    fh.write("    } \n")
+    fh.write("} \n")
+
+# Write the function that adds the Taylor coefficients phi[h] = sum_k mc[k] d^(tuv+k)/dR 1/|R|,
+# (t,u,v) = hermite_index(L)[h], of the potential of a node at R = P-Z. The derivatives of 1/|R|
+# follow from the Hermite recurrence of McMurchie and Davidson with the Boys function values of a
+# point charge, R_000^n = (-1)^n (2n-1)!! / |R|^(2n+1).
+def write_phi(fh, L):
+    N=L+tree_order
+    fh.write("\n/* Taylor coefficients of a node potential up to order %d */ \n" % (L))
+    fh.write("inline void %s(QUICKDouble Rx, QUICKDouble Ry, QUICKDouble Rz, const QUICKDouble* mc, QUICKDouble* phi){ \n" % (phi_name(L)))
+    fh.write("    const QUICKDouble invR = 1.0 / sqrt(Rx * Rx + Ry * Ry + Rz * Rz); \n")
+    fh.write("    const QUICKDouble invR2 = invR * invR; \n")
+    fh.write("    const QUICKDouble R_0_0_0_0 = invR; \n")
+    for n in range(1, N+1):
+        fh.write("    const QUICKDouble R_0_0_0_%d = %.1f * invR2 * R_0_0_0_%d; \n" % (n, -(2*n-1), n-1))
+
+    for s in range(1, N+1):
+        for n in range(0, N-s+1):
+            for (t, u, v) in hermite_index(s)[len(hermite_index(s-1)):]:
+                if t > 0:
+                    X, a, b = "Rx", (t-1, u, v), (t-2, u, v)
+                    c=t-1
+                elif u > 0:
+                    X, a, b = "Ry", (t, u-1, v), (t, u-2, v)
+                    c=u-1
+                else:
+                    X, a, b = "Rz", (t, u, v-1), (t, u, v-2)
+                    c=v-1
+                expr="%s * R_%d_%d_%d_%d" % ((X,)+a+(n+1,))
+                if c > 0:
+                    expr += " + %.1f * R_%d_%d_%d_%d" % ((c,)+b+(n+1,))
+                fh.write("    const QUICKDouble R_%d_%d_%d_%d = %s; \n" % (t, u, v, n, expr))
+
+    moments=hermite_index(tree_order)
+    for (h, (t, u, v)) in enumerate(hermite_index(L)):
+        terms=["mc[%d] * R_%d_%d_%d_0" % (k, t+a, u+b, v+c) for (k, (a, b, c)) in enumerate(moments)]
+        fh.write("    phi[%d] += %s; \n" % (h, " + ".join(terms)))
+    fh.write("} \n")
+
+# Write the function that adds scale * sum_tuv E_t E_u E_v phi_tuv, the far field contribution,
+# to the store entries of the [la|lb] integral. The Hermite expansion coefficients E of each
+# direction are built with the recurrence E^(a+1,b)_t = TwoZetaInv E^(a,b)_t-1 + PA E^(a,b)_t +
+# (t+1) E^(a,b)_t+1 and likewise with PB for b.
+def write_far(fh, la, lb):
+    fh.write("\n/* far field contribution to the %s integral */ \n" % (printer.class_lbl(la, lb)))
+    fh.write("inline void %s(QUICKDouble PAx, QUICKDouble PAy, QUICKDouble PAz, QUICKDouble PBx, QUICKDouble PBy, QUICKDouble PBz,\n\
+        QUICKDouble TwoZetaInv, QUICKDouble scale, const QUICKDouble* phi, QUICKDouble* store){ \n" % (far_name(la, lb)))
+
+    for d in ("x", "y", "z"):
+        fh.write("    const QUICKDouble E%s_0_0_0 = 1.0; \n" % (d))
+        for a in range(0, la+1):
+            for b in range(0, lb+1):
+                if a == 0 and b == 0:
+                    continue
+                if b == 0:
+                    X, src = "PA%s" % (d), (a-1, b)
+                else:
+                    X, src = "PB%s" % (d), (a, b-1)
+                n=src[0]+src[1]
+                for t in range(0, a+b+1):
+                    terms=[]
+                    if t > 0:
+                        terms.append("TwoZetaInv * E%s_%d_%d_%d" % (d, src[0], src[1], t-1))
+                    if t <= n:
+                        terms.append("%s * E%s_%d_%d_%d" % (X, d, src[0], src[1], t))
+                    if t+1 <= n:
+                        terms.append("%.1f * E%s_%d_%d_%d" % (t+1, d, src[0], src[1], t+1))
+                    fh.write("    const QUICKDouble E%s_%d_%d_%d = %s; \n" % (d, a, b, t, " + ".join(terms)))
+
+    index=dict([(tuv, h) for (h, tuv) in enumerate(hermite_index(la+lb))])
+    for i in params.shell_idx(la):
+        for j in params.shell_idx(lb):
+            a=params.Mcal[i]
+            b=params.Mcal[j]
+            terms=[]
+            for t in range(0, a[0]+b[0]+1):
+                for u in range(0, a[1]+b[1]+1):
+                    for v in range(0, a[2]+b[2]+1):
+                        terms.append("Ex_%d_%d_%d * Ey_%d_%d_%d * Ez_%d_%d_%d * phi[%d]" % \
+                            (a[0], b[0], t, a[1], b[1], u, a[2], b[2], v, index[(t, u, v)]))
+            fh.write("    LOCSTORE(store, %d, %d, STOREDIM, STOREDIM) += scale * (%s);\n" % (i, j, " + ".join(terms)))
+    fh.write("} \n")
+
+# Write the tree and its construction. Nodes are stored with their children next to each other
+# and the charges of a node are contiguous in the sorted charge arrays of the tree.
+def write_tree(fh):
+    nmom=len(hermite_index(tree_order))
+    fh.write('''
+#include <vector>
+#include <algorithm>
+
+#ifndef OEI_TREE_LEAF
+#define OEI_TREE_LEAF 16
+#endif
+#define OEI_TREE_MAXDEPTH 24
+#define OEI_TREE_NMOM %d
+
+struct oei_tree_node{
+    QUICKDouble Zx, Zy, Zz, radius;
+    int first, count, child, nchild;
+    QUICKDouble mc[OEI_TREE_NMOM];
+};
+
+struct oei_charge_tree{
+    std::vector<QUICKDouble> Cx, Cy, Cz, q;
+    std::vector<oei_tree_node> nodes;
+};
+''' % (nmom))
+
+    write_moments(fh)
+
+    fh.write('''
+/* set center, radius and moments of node k and split it into octants if it holds more than
+   leaf charges */
+inline void oei_tree_split(oei_charge_tree& tree, int k, int leaf, int depth){
+    oei_tree_node node=tree.nodes[k];
+    QUICKDouble lo[3]={tree.Cx[node.first], tree.Cy[node.first], tree.Cz[node.first]};
+    QUICKDouble hi[3]={lo[0], lo[1], lo[2]};
+    for(int c=node.first; c<node.first+node.count; c++){
+        lo[0]=std::min(lo[0], tree.Cx[c]); hi[0]=std::max(hi[0], tree.Cx[c]);
+        lo[1]=std::min(lo[1], tree.Cy[c]); hi[1]=std::max(hi[1], tree.Cy[c]);
+        lo[2]=std::min(lo[2], tree.Cz[c]); hi[2]=std::max(hi[2], tree.Cz[c]);
+    }
+    node.Zx=0.5*(lo[0]+hi[0]);
+    node.Zy=0.5*(lo[1]+hi[1]);
+    node.Zz=0.5*(lo[2]+hi[2]);
+    node.radius=0.0;
+    for(int c=node.first; c<node.first+node.count; c++){
+        const QUICKDouble dx=tree.Cx[c]-node.Zx, dy=tree.Cy[c]-node.Zy, dz=tree.Cz[c]-node.Zz;
+        node.radius=std::max(node.radius, sqrt(dx*dx+dy*dy+dz*dz));
+    }
+    oei_tree_moments(node.count, &tree.Cx[node.first], &tree.Cy[node.first], &tree.Cz[node.first], &tree.q[node.first], node.Zx, node.Zy, node.Zz, node.mc);
+    node.child=0;
+    node.nchild=0;
+
+    if(node.count <= leaf || node.radius == 0.0 || depth == OEI_TREE_MAXDEPTH){
+        tree.nodes[k]=node;
+        return;
+    }
+
+    /* sort the charges of the node by octant */
+    std::vector<int> octant(node.count), order(node.count);
+    for(int c=0; c<node.count; c++){
+        const int g=node.first+c;
+        octant[c]=(tree.Cx[g] > node.Zx)+2*(tree.Cy[g] > node.Zy)+4*(tree.Cz[g] > node.Zz);
+        order[c]=c;
+    }
+    std::stable_sort(order.begin(), order.end(), [&](int a, int b){ return octant[a] < octant[b]; });
+    std::vector<QUICKDouble> buf(4*node.count);
+    for(int c=0; c<node.count; c++){
+        const int g=node.first+order[c];
+        buf[4*c]=tree.Cx[g]; buf[4*c+1]=tree.Cy[g]; buf[4*c+2]=tree.Cz[g]; buf[4*c+3]=tree.q[g];
+    }
+    for(int c=0; c<node.count; c++){
+        const int g=node.first+c;
+        tree.Cx[g]=buf[4*c]; tree.Cy[g]=buf[4*c+1]; tree.Cz[g]=buf[4*c+2]; tree.q[g]=buf[4*c+3];
+    }
+
+    /* children of the node are appended next to each other */
+    node.child=(int)tree.nodes.size();
+    int first=node.first;
+    for(int o=0; o<8; o++){
+        int count=0;
+        for(int c=0; c<node.count; c++) count += (octant[c] == o);
+        if(count == 0) continue;
+        oei_tree_node child;
+        child.first=first;
+        child.count=count;
+        tree.nodes.push_back(child);
+        node.nchild++;
+        first += count;
+    }
+    tree.nodes[k]=node;
+    for(int c=0; c<node.nchild; c++) oei_tree_split(tree, node.child+c, leaf, depth+1);
+}
+
+/* build the tree over ncharges point charges at Cx, Cy, Cz with magnitudes q */
+inline void oei_tree_build(oei_charge_tree& tree, int ncharges, const QUICKDouble* Cx, const QUICKDouble* Cy, const QUICKDouble* Cz,
+        const QUICKDouble* q, int leaf=OEI_TREE_LEAF){
+    tree.Cx.assign(Cx, Cx+ncharges);
+    tree.Cy.assign(Cy, Cy+ncharges);
+    tree.Cz.assign(Cz, Cz+ncharges);
+    tree.q.assign(q, q+ncharges);
+    tree.nodes.clear();
+    if(ncharges == 0) return;
+    oei_tree_node root;
+    root.first=0;
+    root.count=ncharges;
+    tree.nodes.push_back(root);
+    oei_tree_split(tree, 0, leaf, 0);
+}
+''')
+
+# Write the traversal of the tree, which adds Taylor coefficients up to order Lmax
+def write_walk(fh, Lmax):
+    fh.write("\n/* add the Taylor coefficients of a node potential up to order L */ \n")
+    fh.write("inline void oei_tree_phi(int L, QUICKDouble Rx, QUICKDouble Ry, QUICKDouble Rz, const QUICKDouble* mc, QUICKDouble* phi){ \n")
+    for L in range(0, Lmax+1):
+        fh.write("  if(L == %d){ \n" % (L))
+        fh.write("    %s(Rx, Ry, Rz, mc, phi); \n" % (phi_name(L)))
+        fh.write("  } \n")
+    fh.write("} \n")
+
+    fh.write('''
+/* Visit the nodes of the tree for a primitive pair with weighted center P and exponent Zeta. A
+   node is far if its radius is below theta times its distance from P and all its charges are
+   beyond the switch of the Boys function, i.e. Zeta*(distance-radius)^2 >= switch; its Taylor
+   coefficients up to order L are added to phi. near(first, count) is called for the charges of
+   every other leaf. theta=0 makes all charges near. */
+template<class Near>
+inline void oei_tree_walk(const oei_charge_tree& tree, QUICKDouble theta, QUICKDouble Px, QUICKDouble Py, QUICKDouble Pz,
+        QUICKDouble Zeta, QUICKDouble swtch, int L, QUICKDouble* phi, Near near){
+    if(tree.nodes.size() == 0) return;
+    int stack[7*OEI_TREE_MAXDEPTH+8];
+    int top=0;
+    stack[top++]=0;
+    while(top > 0){
+        const oei_tree_node& node=tree.nodes[stack[--top]];
+        const QUICKDouble Rx=Px-node.Zx, Ry=Py-node.Zy, Rz=Pz-node.Zz;
+        const QUICKDouble R=sqrt(Rx*Rx+Ry*Ry+Rz*Rz);
+        if(node.radius < theta*R && Zeta*(R-node.radius)*(R-node.radius) >= swtch){
+            oei_tree_phi(L, Rx, Ry, Rz, node.mc, phi);
+        }else if(node.nchild == 0){
+            near(node.first, node.count);
+        }else{
+            for(int c=0; c<node.nchild; c++) stack[top++]=node.child+c;
+        }
+    }
+}
+''')
+
+# Write the assembler branch that adds the [I|J] integral of a primitive pair summed over the
+# charges of a tree to store. near_classes are the classes written by the point charge assembler
+# and far_classes those that receive the far field.
+def write_tree_branch(fh, I, J, grad, far_classes, switch):
+    L=max([la+lb for (la, lb) in far_classes])
+    params_str=", ".join(["const oei_charge_tree& tree", "QUICKDouble theta"]+\
+        ["QUICKDouble %s" % (name) for name in ("PAx", "PAy", "PAz", "PBx", "PBy", "PBz", "Px", "Py", "Pz", "TwoZetaInv", "prefactor")]+\
+        ["QUICKDouble* store"])
+
+    fh.write("\n/* %s %s, m=%d, summed over the charges of a tree */ \n" % (printer.class_lbl(I, J), "integral gradient" if grad else "integral", 0))
+    fh.write("inline void %s(%s){ \n" % (tree_name(I, J, grad), params_str))
+    fh.write("    QUICKDouble phi[%d]; \n" % (len(hermite_index(L))))
+    fh.write("    for(int h=0; h<%d; h++) phi[h]=0.0; \n" % (len(hermite_index(L))))
+    fh.write("    oei_tree_walk(tree, theta, Px, Py, Pz, 0.5 / TwoZetaInv, %.1f, %d, phi, [&](int first, int count){ \n" % (switch, L))
+    fh.write("        %s(PAx, PAy, PAz, PBx, PBy, PBz, Px, Py, Pz, TwoZetaInv, prefactor, count, &tree.Cx[first], &tree.Cy[first], &tree.Cz[first], &tree.q[first], store); \n" % \
+        (printer.charges_name(I, J, grad)))
+    fh.write("    }); \n")
+
+    # the Hermite expansion holds the factor sqrt(pi/p)/2 of the asymptotic Boys function
+    fh.write("    const QUICKDouble scale = prefactor * 0.5 * sqrt(%.17e * TwoZetaInv); \n" % (2.0*3.14159265358979323846))
+    for (la, lb) in far_classes:
+        fh.write("    %s(PAx, PAy, PAz, PBx, PBy, PBz, TwoZetaInv, scale, phi, store); \n" % (far_name(la, lb)))
+    fh.write("} \n")
+
+# write the function that calls the tree branch of each (I, J) in branches
+def write_tree_dispatch(fh, branches, grad):
+    names=("PAx", "PAy", "PAz", "PBx", "PBy", "PBz", "Px", "Py", "Pz", "TwoZetaInv", "prefactor")
+    fh.write("\ninline void %s(const oei_charge_tree& tree, QUICKDouble theta, int I, int J, int II, int JJ, %s, QUICKDouble* store){ \n" % \
+        ("oei_grad_vertical_tree" if grad else "OEint_vertical_tree", ", ".join(["QUICKDouble %s" % (name) for name in names])))
+    for (I, J) in branches:
+        fh.write("  if(I == %d && J == %d){ \n" % (I, J))
+        fh.write("    %s(tree, theta, %s, store); \n" % (tree_name(I, J, grad), ", ".join(names)))
+        fh.write("  } \n")
+    fh.write("} \n")
+
+# Write cpu_oei_tree.h. branches and grad_branches hold ((I, J), classes) of the assemblers, where
+# classes are the integral classes saved by the branch.
+def write_charge_tree(fh, branches, grad_branches, switch):
+    classes=[]
+    for (IJ, cl) in branches+grad_branches:
+        for lalb in cl:
+            if lalb not in classes:
+                classes.append(lalb)
+    Lmax=max([la+lb for (la, lb) in classes])
+
+    write_tree(fh)
+    for L in range(0, Lmax+1):
+        write_phi(fh, L)
+    write_walk(fh, Lmax)
+    for (la, lb) in classes:
+        write_far(fh, la, lb)
+
+    for ((I, J), cl) in branches:
+        write_tree_branch(fh, I, J, False, cl, switch)
+    write_tree_dispatch(fh, [IJ for (IJ, cl) in branches], False)
+    for ((I, J), cl) in grad_branches:
+        write_tree_branch(fh, I, J, True, cl, switch)
+    write_tree_dispatch(fh, [IJ for (IJ, cl) in grad_branches], True)
@@ -0,0 +1,483 @@
+#!---------------------------------------------------------------------!
+#! Written by Madu Manathunga on 07/01/2021                            !
+#!                                                                     !
+#! Copyright (C) 2020-2021 Merz lab                                    !
+#! Copyright (C) 2020-2021 Götz lab                                    !
+#!                                                                     !
+#! This source file is a part of QUICK-GenInt code generator and       !
+#! is subjected to the terms of the Mozilla Public License, v. 2.0.    !
+#! If a copy of the MPL was not distributed with this file, you can    !
+#! obtain one at http://mozilla.org/MPL/2.0/.                          !
+#!_____________________________________________________________________!
+
+#!---------------------------------------------------------------------!
+#! This source file contains a static cost model of the generated      !
+#! code. For each class constructor, flat function and assembler       !
+#! branch it counts the multiplications, additions, fused multiply-    !
+#! adds, divisions, VY loads, store reads and writes, nested           !
+#! constructors and the peak number of live temporaries. Code lowered  !
+#! from the recurrence graph is counted by the printers while they     !
+#! write it (see Counter), from the same expression trees; the hand    !
+#! written class layout of the default mode is counted from the        !
+#! generated text, which also cross-checks the printer counts. The     !
+#! report is kept as json and compared against a baseline, where any   !
+#! increase counts as a regression.                                    !
+#!---------------------------------------------------------------------!
+
+import re
+import json
+
+# counted quantities of a function, see count_statement
+metrics=("mul", "add", "fma", "div", "vy", "store_reads", "store_writes", "constructors")
+
+# quantities compared against the baseline. Instructions are mul+add+fma+div, so that fusing a
+# multiplication and an addition is not reported as an increase of fma.
+checked=("instructions", "vy", "store_reads", "store_writes", "constructors", "temporaries")
+
+# functions that dispatch to the assembler branches with if(I == a && J == b)
+dispatchers=("OEint_vertical", "oei_grad_vertical", "OEint_horizontal")
+
+# shells of the assembler branches, e.g. branch DD is (2, 2)
+shells="SPDFG"
+
+# prefixes of the macros taken as defined, as in the host stub of validate.py. USE_PARTIAL_* and
+# DEBUG_OEI are taken as undefined.
+defined=("REG_",)
+
+# Remove comments from header text and resolve its #ifdef, #ifndef, #else and #endif lines with
+# the macros in defined
+def strip(text):
+    text=re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    text=re.sub(r"//[^\n]*", "", text)
+    lines=[]
+    active=[True]
+    for line in text.split("\n"):
+        words=line.split()
+        if len(words) == 0 or not words[0].startswith("#"):
+            if all(active):
+                lines.append(line)
+        elif words[0] in ("#ifdef", "#ifndef"):
+            isdef=any([words[1].startswith(prefix) for prefix in defined])
+            active.append(isdef if words[0] == "#ifdef" else not isdef)
+        elif words[0] == "#else":
+            active[-1]=not active[-1]
+        elif words[0] == "#endif":
+            active.pop()
+    return "\n".join(lines)
+
+# Return the position after the bracket that closes the one at text[start]
+def closing(text, start):
+    pairs={"(": ")", "{": "}"}
+    depth=0
+    for k in range(start, len(text)):
+        if text[k] == text[start]:
+            depth += 1
+        elif text[k] == pairs[text[start]]:
+            depth -= 1
+            if depth == 0:
+                return k+1
+    raise ValueError("unbalanced %s" % (text[start]))
+
+# Return the function definitions of header text as a list of (name, body). Constructors are
+# named like PDint_0::PDint_0.
+def functions(text):
+    text=strip(text)
+    found=[]
+    pos=0
+    pattern=re.compile(r"([A-Za-z_]\w*(?:::\w+)?)\s*\(")
+    while True:
+        m=pattern.search(text, pos)
+        if m is None:
+            break
+        end=closing(text, m.end()-1)
+        rest=text[end:].lstrip()
+        if rest.startswith("{"):
+            start=len(text)-len(rest)
+            stop=closing(text, start)
+            found.append((m.group(1), text[start+1:stop-1]))
+            pos=stop
+        else:
+            pos=end
+    return found
+
+# Return the branches of a dispatch function body as a list of ((I, J), body)
+def branches(body):
+    found=[]
+    for m in re.finditer(r"if\s*\(\s*I\s*==\s*(\d+)\s*&&\s*J\s*==\s*(\d+)\s*\)\s*\{", body):
+        start=m.end()-1
+        found.append(((int(m.group(1)), int(m.group(2))), body[start+1:closing(body, start)-1]))
+    return found
+
+# Return the statements of a function body. Control flow heads (if, else) and braces are
+# dropped, so both paths of a branch are counted. The body of a for loop with a constant bound,
+# such as the loops of compact classes, is counted once per iteration. Array initializers
+# {a, b} are read as a call init(a, b).
+def statements(body):
+    out=[]
+    pos=0
+    body=re.sub(r"\belse\b", ";", body)
+    body=re.sub(r"=\s*\{([^{}]*)\}", r"= init(\1)", body)
+    while True:
+        m=re.search(r"\b(if|for|while)\s*\(", body[pos:])
+        if m is None:
+            out.append(body[pos:])
+            break
+        out.append(body[pos:pos+m.start()])
+        head=pos+m.end()-1
+        pos=closing(body, head)
+        bound=re.search(r";\s*\w+\s*<\s*(\d+)\s*;", body[head:pos])
+        rest=body[pos:].lstrip()
+        if m.group(1) == "for" and bound is not None and rest.startswith("{"):
+            start=len(body)-len(rest)
+            stop=closing(body, start)
+            out.append(";".join(statements(body[start+1:stop-1])*int(bound.group(1))))
+            out.append(";")
+            pos=stop
+    text=" ".join(out).replace("{", ";").replace("}", ";")
+    return [s.strip() for s in text.split(";") if s.strip() != ""]
+
+# tokens of expressions: numbers, names with members, operators, brackets and subscripts
+token=re.compile(r"\s*(\d+\.\d*(?:[eE][-+]?\d+)?|\d+(?:[eE][-+]?\d+)?|[A-Za-z_][\w.]*|\+|-|\*|/|\(|\)|\[|\]|,)")
+
+def tokenize(expr):
+    tokens=[]
+    pos=0
+    expr=expr.strip()
+    while pos < len(expr):
+        m=token.match(expr, pos)
+        if m is None:
+            raise ValueError("cannot parse %s" % (expr))
+        tokens.append(m.group(1))
+        pos=m.end()
+    return tokens
+
+# Recursive descent parser of arithmetic expressions. Nodes are ("+", a, b), ("-", a, b),
+# ("*", a, b), ("/", a, b), ("neg", a), ("name", name), ("number", text), ("vy",), ("store",)
+# and ("call", name, [args]).
+class Parser:
+    def __init__(self, tokens):
+        self.tokens=tokens
+        self.pos=0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self):
+        self.pos += 1
+        return self.tokens[self.pos-1]
+
+    def expr(self):
+        node=self.term()
+        while self.peek() in ("+", "-"):
+            op=self.take()
+            node=(op, node, self.term())
+        return node
+
+    def term(self):
+        node=self.unary()
+        while self.peek() in ("*", "/"):
+            op=self.take()
+            node=(op, node, self.unary())
+        return node
+
+    def unary(self):
+        if self.peek() == "-":
+            self.take()
+            return ("neg", self.unary())
+        if self.peek() == "+":
+            self.take()
+            return self.unary()
+        return self.atom()
+
+    def atom(self):
+        tok=self.take()
+        if tok == "(":
+            node=self.expr()
+            self.take()
+            return node
+        if tok[0].isdigit():
+            return ("number", tok)
+        if self.peek() == "(":
+            self.take()
+            args=[]
+            while self.peek() != ")":
+                args.append(self.expr())
+                if self.peek() == ",":
+                    self.take()
+            self.take()
+            if tok == "VY":
+                return ("vy",)
+            if tok in ("LOCSTORE", "LOCSTOREFULL"):
+                return ("store",)
+            return ("call", tok, args)
+        # subscripts read the array, e.g. ff.x[12] reads ff.x, and the names of the index
+        node=("name", tok)
+        while self.peek() == "[":
+            self.take()
+            node=("index", node, self.expr())
+            self.take()
+        return node
+
+def parse(expr):
+    return Parser(tokenize(expr)).expr()
+
+# Count the operations of an expression tree into counts and add the names it reads to uses.
+# Returns True if the node is a multiplication that was not fused, which an enclosing addition
+# or subtraction fuses into one fma.
+def count_node(node, counts, uses):
+    kind=node[0]
+    if kind == "name":
+        uses.append(node[1])
+    elif kind == "vy":
+        counts["vy"] += 1
+    elif kind == "store":
+        counts["store_reads"] += 1
+    elif kind == "neg":
+        count_node(node[1], counts, uses)
+    elif kind == "index":
+        count_node(node[1], counts, uses)
+        count_node(node[2], counts, [])
+    elif kind == "call":
+        for arg in node[2]:
+            count_node(arg, counts, uses)
+    elif kind in ("*", "/"):
+        count_node(node[1], counts, uses)
+        count_node(node[2], counts, uses)
+        counts["mul" if kind == "*" else "div"] += 1
+        return kind == "*"
+    elif kind in ("+", "-"):
+        fused=count_node(node[1], counts, uses)
+        fused=count_node(node[2], counts, uses) or fused
+        if fused:
+            counts["mul"] -= 1
+            counts["fma"] += 1
+        else:
+            counts["add"] += 1
+    return False
+
+# Count one statement into counts. Returns (defined names, used names, callee) where callee is the
+# class of a nested constructor or the called function, or None.
+def count_statement(stmt, counts, members):
+    m=re.match(r"^(\w+int_\d+(?:_\d+)?)\s+(\w+)\s*\((.*)\)$", stmt, flags=re.S)
+    if m is not None:
+        counts["constructors"] += 1
+        uses=[]
+        for arg in tokenize(m.group(3)):
+            if re.match(r"[A-Za-z_]", arg):
+                uses.append(arg)
+        return (["%s.%s" % (m.group(2), x) for x in members.get(m.group(1), [])], uses, m.group(1))
+
+    m=re.match(r"^(?:const\s+)?(?:QUICKDouble\s*\*?\s*)?(LOCSTORE(?:FULL)?\s*\(.*?\)|[A-Za-z_][\w.]*)(?:\s*\[\w*\])?\s*(=|\+=|-=)\s*(.*)$", stmt, flags=re.S)
+    if m is not None:
+        uses=[]
+        lhs=m.group(1)
+        node=parse(m.group(3))
+        if m.group(2) != "=":
+            node=("+", ("store",) if lhs.startswith("LOCSTORE") else ("name", lhs), node)
+        count_node(node, counts, uses)
+        if lhs.startswith("LOCSTORE"):
+            counts["store_writes"] += 1
+            return ([], uses, None)
+        return ([lhs], uses, None)
+
+    m=re.match(r"^(\w+)\s*\((.*)\)$", stmt, flags=re.S)
+    if m is not None:
+        uses=[]
+        count_node(parse(stmt), counts, uses)
+        return ([], uses, m.group(1))
+
+    # declarations without initializer
+    return ([], [], None)
+
+# Peak number of values live at once in a straight line sequence of (defs, uses). A value lives
+# from its first definition to its last use; outputs, the members a constructor assigns, live to
+# the end.
+def peak_live(seq, outputs):
+    first={}
+    last={}
+    for (k, (defs, uses)) in enumerate(seq):
+        for name in uses:
+            if name in first:
+                last[name]=k
+        for name in defs:
+            first.setdefault(name, k)
+            last.setdefault(name, k)
+    for name in outputs:
+        if name in first:
+            last[name]=len(seq)
+    delta=[0]*(len(seq)+2)
+    for name in first:
+        delta[first[name]] += 1
+        delta[last[name]+1] -= 1
+    peak=0
+    live=0
+    for d in delta:
+        live += d
+        peak=max(peak, live)
+    return peak
+
+# Counts of a function recorded by a printer while it writes the function, see printer.py.
+# Expressions are given as the trees parse returns for the text the printer writes, so the counts
+# do not depend on the generated text. Statements are recorded in the order they are written, as
+# (defs, uses) for the peak of live temporaries.
+class Counter:
+    def __init__(self):
+        self.counts=dict([(name, 0) for name in metrics])
+        self.seq=[]
+        self.callees=[]
+
+    # construction of a nested object of class cname, which defines the members in defs and
+    # reads the names in args
+    def construct(self, cname, defs, args):
+        self.counts["constructors"] += 1
+        self.seq.append((list(defs), list(args)))
+        self.callees.append(cname)
+
+    # call of the function func with the names in args
+    def call(self, func, args):
+        self.seq.append(([], list(args)))
+        self.callees.append(func)
+
+    # assignment of an expression tree to name, or to the store array if name is None
+    def assign(self, name, tree):
+        uses=[]
+        count_node(tree, self.counts, uses)
+        if name is None:
+            self.counts["store_writes"] += 1
+            self.seq.append(([], uses))
+        else:
+            self.seq.append(([name], uses))
+
+    # the direct counts with the peak of live temporaries and the list of callees, as returned by
+    # analyze. outputs are the members of a constructor, which live to its end.
+    def entry(self, outputs=()):
+        counts=dict(self.counts)
+        counts["temporaries"]=peak_live(self.seq, outputs)
+        return (counts, list(self.callees))
+
+# Analyze one function body. Returns the direct counts with the peak of live temporaries and the
+# list of callees.
+def analyze(body, members, own=None):
+    counts=dict([(name, 0) for name in metrics])
+    seq=[]
+    callees=[]
+    for stmt in statements(body):
+        defs, uses, callee = count_statement(stmt, counts, members)
+        seq.append((defs, uses))
+        if callee is not None:
+            callees.append(callee)
+    outputs=[] if own is None else members.get(own, [])
+    counts["temporaries"]=peak_live(seq, outputs)
+    return (counts, callees)
+
+# members of each class in the text of gpu_oei_classes.h
+def class_members(text):
+    members={}
+    for m in re.finditer(r"class\s+(\w+)\s*\{(.*?)\};", strip(text), flags=re.S):
+        members[m.group(1)]=re.findall(r"QUICKDouble\s+(\w+)\s*(?:\[\d+\])?\s*;", m.group(2))
+    return members
+
+# Analyze the functions of the generated headers, given as a dictionary of file name and text.
+# Returns a dictionary of entry name and analyze result, and a dictionary of entry name and
+# report section.
+def parse_entries(outputs):
+    members=class_members(outputs.get("gpu_oei_classes.h", ""))
+    entries={}
+    kinds={}
+    for name in ("gpu_oei_definitions.h", "gpu_oei_assembler.h", "gpu_oei_grad_assembler.h"):
+        for (func, body) in functions(outputs.get(name, "")):
+            if func in dispatchers:
+                for ((I, J), branch) in branches(body):
+                    key="%s %s%s" % (func, shells[I], shells[J])
+                    entries[key]=analyze(branch, members)
+                    kinds[key]="branches"
+            elif "::" in func:
+                cls=func.split("::")[0]
+                entries[cls]=analyze(body, members, cls)
+                kinds[cls]="classes"
+            else:
+                entries[func]=analyze(body, members)
+                kinds[func]="functions"
+    return (entries, kinds)
+
+# Return the cost report of the generated headers, given as a dictionary of file name and text.
+# counted holds the entries recorded by the printers, {section: {name: Counter.entry()}}, which
+# replace those read from the text. Each entry holds the direct counts and the peak of live
+# temporaries of its own body and, under total, the counts including the nested constructors and
+# called functions, whose temporaries are the largest peak of the body and its callees.
+def report(outputs, counted=None):
+    entries, kinds = parse_entries(outputs)
+    if counted is not None:
+        for section in counted:
+            for key in counted[section]:
+                entries[key]=counted[section][key]
+                kinds[key]=section
+
+    totals={}
+    def total(key):
+        if key not in totals:
+            counts, callees = entries[key]
+            t=dict([(name, counts[name]) for name in metrics+("temporaries",)])
+            for callee in callees:
+                if callee in entries:
+                    sub=total(callee)
+                    for name in metrics:
+                        t[name] += sub[name]
+                    t["temporaries"]=max(t["temporaries"], sub["temporaries"])
+            t["instructions"]=t["mul"]+t["add"]+t["fma"]+t["div"]
+            totals[key]=t
+        return totals[key]
+
+    out={"classes": {}, "functions": {}, "branches": {}}
+    for key in entries:
+        counts=dict(entries[key][0])
+        counts["total"]=total(key)
+        out[kinds[key]][key]=counts
+    return out
+
+def report_json(outputs, counted=None):
+    return json.dumps(report(outputs, counted), indent=1, sort_keys=True)+"\n"
+
+# Compare the direct counts of a report with those read from the text of the generated headers.
+# Returns a list of (entry, quantity, report value, text value) for every quantity that differs,
+# with quantity None for entries that are missing from the text. Temporaries are not compared,
+# since the text does not tell the members of compact classes apart.
+def cross_check(rep, outputs):
+    entries=parse_entries(outputs)[0]
+    found=[]
+    for section in ("classes", "functions", "branches"):
+        for key in sorted(rep.get(section, {})):
+            if key not in entries:
+                found.append((key, None, 0, 0))
+                continue
+            for name in metrics:
+                if rep[section][key][name] != entries[key][0][name]:
+                    found.append((key, name, rep[section][key][name], entries[key][0][name]))
+    return found
+
+# Compare a report with a baseline report. Entries of the baseline that are missing are ignored,
+# since they depend on the generated branches. Returns a list of (section, entry, quantity,
+# baseline value, value) for every quantity that increased.
+def regressions(rep, baseline):
+    found=[]
+    for section in ("classes", "functions", "branches"):
+        for key in sorted(rep.get(section, {})):
+            if key not in baseline.get(section, {}):
+                continue
+            new=rep[section][key]
+            old=baseline[section][key]
+            for name in checked:
+                if new["total"][name] > old["total"][name]:
+                    found.append((section, key, name, old["total"][name], new["total"][name]))
+    return found
+
+# Report lines of the most expensive branches and classes, ordered by instructions
+def summary(rep, count=10):
+    lines=["%-28s %8s %8s %8s %8s %6s %6s %6s %8s %6s" % ("entry", "instr", "mul", "add", "fma", "vy", "reads", "writes", "constr", "temps")]
+    for section in ("branches", "classes"):
+        keys=sorted(rep[section], key=lambda k: -rep[section][k]["total"]["instructions"])
+        for key in keys[0:count]:
+            t=rep[section][key]["total"]
+            lines.append("%-28s %8d %8d %8d %8d %6d %6d %6d %8d %6d" % (key, t["instructions"], t["mul"], t["add"], t["fma"], t["vy"],\
+                t["store_reads"], t["store_writes"], t["constructors"], t["temporaries"]))
+    return lines
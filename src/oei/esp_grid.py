@@ -0,0 +1,74 @@
+#!---------------------------------------------------------------------!
+#! Written by Madu Manathunga on 07/01/2021                            !
+#!                                                                     !
+#! Copyright (C) 2020-2021 Merz lab                                    !
+#! Copyright (C) 2020-2021 Götz lab                                    !
+#!                                                                     !
+#! This source file is a part of QUICK-GenInt code generator and       !
+#! is subjected to the terms of the Mozilla Public License, v. 2.0.    !
+#! If a copy of the MPL was not distributed with this file, you can    !
+#! obtain one at http://mozilla.org/MPL/2.0/.                          !
+#!_____________________________________________________________________!
+
+#!---------------------------------------------------------------------!
+#! This source file contains a printer for the host driver that        !
+#! evaluates the electrostatic potential of a density on a grid with   !
+#! the grid point functions of gpu_oei_esp.h. The pair quantities are !
+#! computed once for all primitive pairs, and the grid is streamed in  !
+#! blocks so that the potential of a block stays in cache while all   !
+#! pairs add to it.                                                    !
+#!---------------------------------------------------------------------!
+
+import math
+
+# Write cpu_oei_esp.h. oei_esp_make_pair sets up the quantities of a primitive pair with
+# exponents alpha and beta on centers A and B, whose contraction coefficients are folded into coef,
+# and oei_esp_grid adds the contribution of all pairs to each grid point.
+def write_esp_grid(fh):
+    fh.write('''
+#include <algorithm>
+
+#ifndef OEI_ESP_BLOCK
+#define OEI_ESP_BLOCK 256
+#endif
+
+/* primitive pair of shells with angular momenta I and J; D is the offset of its density block,
+   ordered like the store entries of the [I|J] class */
+struct oei_esp_pair{
+    int I, J, D;
+    QUICKDouble PAx, PAy, PAz, PBx, PBy, PBz, Px, Py, Pz, TwoZetaInv, prefactor;
+};
+
+inline oei_esp_pair oei_esp_make_pair(int I, int J, int D, QUICKDouble Ax, QUICKDouble Ay, QUICKDouble Az,
+        QUICKDouble Bx, QUICKDouble By, QUICKDouble Bz, QUICKDouble alpha, QUICKDouble beta, QUICKDouble coef){
+    oei_esp_pair s;
+    const QUICKDouble Zeta=alpha+beta;
+    const QUICKDouble ABx=Ax-Bx, ABy=Ay-By, ABz=Az-Bz;
+    s.I=I;
+    s.J=J;
+    s.D=D;
+    s.Px=(alpha*Ax+beta*Bx)/Zeta;
+    s.Py=(alpha*Ay+beta*By)/Zeta;
+    s.Pz=(alpha*Az+beta*Bz)/Zeta;
+    s.PAx=s.Px-Ax; s.PAy=s.Py-Ay; s.PAz=s.Pz-Az;
+    s.PBx=s.Px-Bx; s.PBy=s.Py-By; s.PBz=s.Pz-Bz;
+    s.TwoZetaInv=0.5/Zeta;
+    s.prefactor=coef*%.17e/Zeta*exp(-alpha*beta/Zeta*(ABx*ABx+ABy*ABy+ABz*ABz));
+    return s;
+}
+
+/* add sum_ij D_ij [i|1/r_g|j] of npairs primitive pairs to esp[g] for each of npoints grid points.
+   Blocks of OEI_ESP_BLOCK points are independent and run in parallel with OpenMP. */
+inline void oei_esp_grid(int npairs, const oei_esp_pair* pairs, const QUICKDouble* D, int npoints,
+        const QUICKDouble* Gx, const QUICKDouble* Gy, const QUICKDouble* Gz, QUICKDouble* esp){
+#pragma omp parallel for schedule(dynamic)
+    for(int g0=0; g0<npoints; g0+=OEI_ESP_BLOCK){
+        const int n=std::min(OEI_ESP_BLOCK, npoints-g0);
+        for(int k=0; k<npairs; k++){
+            const oei_esp_pair& s=pairs[k];
+            oei_esp(s.I, s.J, s.PAx, s.PAy, s.PAz, s.PBx, s.PBy, s.PBz, s.Px, s.Py, s.Pz, s.TwoZetaInv, s.prefactor,
+                D+s.D, n, Gx+g0, Gy+g0, Gz+g0, esp+g0);
+        }
+    }
+}
+''' % (2.0*math.pi))
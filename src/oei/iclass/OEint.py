@@ -20,6 +20,18 @@
 
 import src.common.params as params
 import src.common.file_handler as file_handler
+import src.oei.vrr_graph as vrr_graph
+import src.oei.printer as printer
+import src.oei.numpy_printer as numpy_printer
+import src.oei.vrr_plan as vrr_plan
+
+# integral classes saved by the gradient assembler branch of the [la|lb] integral
+def grad_classes(la, lb):
+    classes=[]
+    for (cla, clb) in ((la-1, lb), (la, lb-1), (la+1, lb), (la, lb+1)):
+        if cla >= 0 and clb >= 0:
+            classes.append((cla, clb))
+    return classes
 
 # parent class for all one electron integrals
 class OEint:
@@ -28,7 +40,33 @@ class OEint:
     fhd = 0 # file handler for function implementations
     fha= 0  # file handler for integral assembler
     fhga= 0 # file handler for integral gradient assembler
+    fhb= 0  # file handler for host batch kernels
+    fhn= 0  # file handler for numpy functions
+    fhq= 0  # file handler for point charge assemblers
+    fhe= 0  # file handler for grid point functions
+    fhf= 0  # file handler for field and point dipole functions
     debug=1 # include debug info in generated code, 0=no, 1=yes 
+    cse=0   # evaluate each integral component only once per assembler branch, 0=no, 1=yes
+    ir=0    # lower classes and assemblers from the recurrence graph, 0=no, 1=yes
+    sym=0   # only generate [a|b] classes with a >= b and serve [b|a] by symmetry, 0=no, 1=yes
+    grad_dce=0 # only compute store entries consumed by the gradient code, 0=no, 1=yes
+    grad_entries=None # consumed store entries of each gradient branch, {(I,J): [(i,j), ...]}
+    ssa=0   # write each assembler branch as a flat function in single assignment form, 0=no, 1=yes
+    hrr=0   # build [a|b] from [e|s] integrals with the horizontal recurrence after contraction, 0=no, 1=yes
+    plan=0  # choose recurrence center and direction per component in cse, grad_dce, ssa and hrr modes, 0=no, 1=yes
+    batch=0 # also generate host kernels that compute a class for a batch of primitive pairs, 0=no, 1=yes
+    numpy=0 # also generate numpy functions that compute a class for arrays of primitive pairs, 0=no, 1=yes
+    boys=0  # also generate the Boys function producer of YVerticalTemp, 0=no, 1=yes
+    charges=0 # also generate assemblers that sum the integral over an array of point charges, 0=no, 1=yes
+    tree=0  # also generate host code that sums the integral over an octree of point charges, 0=no, 1=yes
+    attenuated=0 # also generate producers and point charge assemblers for erf and erfc attenuated operators, 0=no, 1=yes
+    esp=0   # also generate functions that contract the integral with a density block at grid points, 0=no, 1=yes
+    field=0 # also generate functions for the integral derivatives with respect to C and point dipoles, 0=no, 1=yes
+    pair_cache=0 # also generate a host cache of pair data and point charge sums for fixed QM geometries, 0=no, 1=yes
+    cost=0  # also write the static operation counts of the generated code, 0=no, 1=yes
+    reg_budget=0 # split classes whose estimated live values exceed this budget into partial classes, 0=off
+    compact=[] # labels of the classes written as table driven loops, e.g. ["FF", "FD"], []=none
+    costs={} # operation counts recorded by the printers, {section: {name: counts}}, see cost_model.report
 
     # set function qualifiers
     func_qualifier='__device__ __inline__'
@@ -65,3 +103,206 @@ class OEint:
     # save true integrals into store array
     def save_int(self):
         pass
+
+    # integral classes saved by the gradient assembler branch of this integral
+    def grad_classes(self):
+        return grad_classes(self.la, self.lb)
+
+    # record the operation counts returned by a printer for the assembler branch of this integral
+    # in the dispatch function func, or for the function func if branch is False
+    def record(self, func, counts, branch=True):
+        if branch:
+            OEint.costs.setdefault("branches", {})["%s %s" % (func, printer.class_lbl(self.la, self.lb))]=counts
+        else:
+            OEint.costs.setdefault("functions", {})[func]=counts
+
+    # build the graph of a flat assembler branch that saves the given store entries (i,j). If plan
+    # is set, the recurrence steps are chosen by the planner and a summary of the savings is
+    # returned, otherwise the default rule is used and the summary is None.
+    def branch_dag(self, entries):
+        step=vrr_graph.vrr_step
+        note=None
+        if OEint.plan == 1:
+            targets=[(i, j, 0) for (i, j) in entries]
+            p=vrr_plan.plan(targets)
+            step=p.step
+            note=vrr_plan.summary(targets, p)
+
+        dag=vrr_graph.Dag(step)
+        for (i, j) in entries:
+            dag.roots.append((("store", i, j), dag.vrr(i, j, 0)))
+        return (dag, note)
+
+    # store entries of the given integral classes, in the order they are saved
+    def class_entries(self, classes):
+        return [(i, j) for (la, lb) in classes for i in params.shell_idx(la) for j in params.shell_idx(lb)]
+
+    # generate code to save computed integral in common subexpression elimination mode. The
+    # branch computes every component exactly once in local variables.
+    def save_int_cse(self):
+        dag, note = self.branch_dag(self.class_entries([(self.la, self.lb)]))
+        self.record("OEint_vertical", printer.write_flat_branch(self.fha, dag, self.la, self.lb, [(self.la, self.lb)], "integral", OEint.debug, note))
+
+    # generate code to save integral gradients in common subexpression elimination mode. All
+    # integral classes required for the gradient share a single set of components.
+    def save_int_grad_cse(self):
+        dag, note = self.branch_dag(self.class_entries(self.grad_classes()))
+        self.record("oei_grad_vertical", printer.write_flat_branch(self.fhga, dag, self.la, self.lb, self.grad_classes(), "integral gradient", OEint.debug, note))
+
+    # store entries read by the gradient code for this integral, as listed in grad_entries. The
+    # derivatives of [a|b] with respect to A and B read every component of the gradient classes
+    # [a+1|b], [a-1|b], [a|b+1] and [a|b-1], so a branch missing from grad_entries keeps them all.
+    def consumed_grad_entries(self):
+        if OEint.grad_entries is not None and (self.la, self.lb) in OEint.grad_entries:
+            return sorted(set(OEint.grad_entries[(self.la, self.lb)]))
+        return self.class_entries(self.grad_classes())
+
+    # build the graph of a gradient branch in dead code elimination mode. Only the backward slice
+    # of the consumed store entries is computed, so unused components and lower classes are never
+    # built. Returns the graph, the integral classes it saves into and a summary of the savings.
+    def grad_dce_dag(self):
+        dag, plan_note = self.branch_dag(self.consumed_grad_entries())
+
+        # size of the graph if all gradient classes were computed, reported in the generated code
+        full=vrr_graph.Dag()
+        for (la, lb) in self.grad_classes():
+            full.add_store_roots(la, lb)
+        nslice=printer.count_int(dag, dag.reachable([nid for (name, nid) in dag.roots]))
+        nfull=printer.count_int(full, full.reachable([nid for (name, nid) in full.roots]))
+        note="backward slice of %d store entries: %d of %d components" % (len(dag.roots), nslice, nfull)
+        if len(dag.roots) == 0:
+            print("Warning: no store entries of the %s gradient branch are consumed, the branch is empty. \n" % (printer.class_lbl(self.la, self.lb)))
+        elif nslice == nfull and OEint.grad_entries is not None and (self.la, self.lb) in OEint.grad_entries:
+            print("Warning: the consumed store entries of the %s gradient branch need all %d components, dead code elimination removes nothing. \n" % (printer.class_lbl(self.la, self.lb), nfull))
+        if plan_note is not None:
+            note += "; " + plan_note
+
+        classes=sorted(set([(params.ang_mom(name[1]), params.ang_mom(name[2])) for (name, nid) in dag.roots]))
+        return (dag, classes, note)
+
+    # generate code to save integral gradients in dead code elimination mode
+    def save_int_grad_dce(self):
+        dag, classes, note = self.grad_dce_dag()
+        self.record("oei_grad_vertical", printer.write_flat_branch(self.fhga, dag, self.la, self.lb, classes, "integral gradient", OEint.debug, note))
+
+    # generate a function that saves computed integral in ssa mode. The assembler branch that
+    # calls it is written by save_int_ssa_call.
+    def save_int_ssa(self):
+        dag, note = self.branch_dag(self.class_entries([(self.la, self.lb)]))
+        self.record(printer.ssa_name(self.la, self.lb, False), printer.write_ssa_function(self.fha, dag, self.la, self.lb, False, [(self.la, self.lb)],\
+            "integral", self.func_qualifier, OEint.debug, note), False)
+        self.ssa_args=printer.ssa_args(dag)
+
+    def save_int_ssa_call(self):
+        self.record("OEint_vertical", printer.write_ssa_call(self.fha, self.la, self.lb, False, self.ssa_args, "integral"))
+
+    # generate a function that saves integral gradients in ssa mode. If grad_dce is set, only the
+    # consumed store entries are computed.
+    def save_int_grad_ssa(self):
+        if OEint.grad_dce == 1:
+            dag, classes, note = self.grad_dce_dag()
+        else:
+            classes=self.grad_classes()
+            dag, note = self.branch_dag(self.class_entries(classes))
+        self.record(printer.ssa_name(self.la, self.lb, True), printer.write_ssa_function(self.fhga, dag, self.la, self.lb, True, classes,\
+            "integral gradient", self.func_qualifier, OEint.debug, note), False)
+        self.ssa_grad_args=printer.ssa_args(dag)
+
+    def save_int_grad_ssa_call(self):
+        self.record("oei_grad_vertical", printer.write_ssa_call(self.fhga, self.la, self.lb, True, self.ssa_grad_args, "integral gradient"))
+
+    # generate code to save the [e|s] integrals, e=a,...,a+b, required by the horizontal
+    # recurrence for [a|b]. Only the first center is incremented, so the m ladder is that of an
+    # [a+b|s] integral. The transfer into [a|b] is written by save_int_hrr_transfer.
+    def save_int_hrr(self):
+        classes=[(l, 0) for l in range(self.la, self.la+self.lb+1)]
+        dag, plan_note = self.branch_dag(self.class_entries(classes))
+
+        # size of the graph if [a|b] was computed by the vertical recurrence only
+        full=vrr_graph.Dag()
+        full.add_store_roots(self.la, self.lb)
+        nvrr=printer.count_int(dag, dag.reachable([nid for (name, nid) in dag.roots]))
+        nfull=printer.count_int(full, full.reachable([nid for (name, nid) in full.roots]))
+        note="horizontal recurrence: %d vertical components (vertical recurrence only: %d)" % (nvrr, nfull)
+        if plan_note is not None:
+            note += "; " + plan_note
+
+        self.record("OEint_vertical", printer.write_flat_branch(self.fha, dag, self.la, self.lb, classes, "integral", OEint.debug, note))
+
+    # generate code to transfer contracted [e|s] integrals in the store array into [a|b]
+    def save_int_hrr_transfer(self):
+        dag=vrr_graph.Dag()
+        for i in params.shell_idx(self.la):
+            for j in params.shell_idx(self.lb):
+                dag.roots.append((("store", i, j), dag.hrr(i, j)))
+        self.record("OEint_horizontal", printer.write_flat_branch(self.fha, dag, self.la, self.lb, [(self.la, self.lb)], "integral transfer", 0))
+
+    # generate code to save computed integral from the classes of the recurrence graph dag
+    def save_int_ir(self, dag):
+        self.record("OEint_vertical", printer.write_class_branch(self.fha, dag, self.la, self.lb, [(self.la, self.lb)], "integral", OEint.debug,\
+            OEint.sym, OEint.reg_budget, printer.compact_classes(OEint.compact)))
+
+    # generate code to save integral gradients from the classes of the recurrence graph dag
+    def save_int_grad_ir(self, dag):
+        self.record("oei_grad_vertical", printer.write_class_branch(self.fhga, dag, self.la, self.lb, self.grad_classes(), "integral gradient", OEint.debug,\
+            OEint.sym, OEint.reg_budget, printer.compact_classes(OEint.compact)))
+
+    # generate a host kernel that computes the integral for a batch of primitive pairs in
+    # structure of arrays layout, vectorized over the pairs
+    def save_int_batch(self):
+        dag, note = self.branch_dag(self.class_entries([(self.la, self.lb)]))
+        printer.write_batch_kernel(self.fhb, dag, self.la, self.lb, note)
+
+    # generate a python function that computes the integral for arrays of primitive pairs with numpy
+    def save_int_numpy(self):
+        dag, note = self.branch_dag(self.class_entries([(self.la, self.lb)]))
+        numpy_printer.write_function(self.fhn, dag, self.la, self.lb, note)
+
+    # generate a function that adds the integral summed over point charges to the store array. In
+    # horizontal recurrence mode, the [e|s] integrals of OEint_vertical are computed instead. op
+    # selects the operator, 1/r ("coulomb") or one of the attenuated operators "erf" and "erfc".
+    def save_int_charges(self, ncol, switch, op="coulomb"):
+        if OEint.hrr == 1:
+            classes=[(l, 0) for l in range(self.la, self.la+self.lb+1)]
+        else:
+            classes=[(self.la, self.lb)]
+        dag, note = self.branch_dag(self.class_entries(classes))
+        printer.write_charges_function(self.fhq, dag, self.la, self.lb, False, classes, "integral", self.func_qualifier, ncol, switch, note, op)
+
+    # generate a function that adds integral gradients summed over point charges to the store
+    # array. If grad_dce is set, only the consumed store entries are computed.
+    def save_int_grad_charges(self, ncol, switch, op="coulomb"):
+        if OEint.grad_dce == 1:
+            dag, classes, note = self.grad_dce_dag()
+        else:
+            classes=self.grad_classes()
+            dag, note = self.branch_dag(self.class_entries(classes))
+        printer.write_charges_function(self.fhq, dag, self.la, self.lb, True, classes, "integral gradient", self.func_qualifier, ncol, switch, note, op)
+
+    # generate a function that adds the integral contracted with a density block to the values of
+    # grid points. The [a|b] components are computed directly in all modes, since the density is
+    # contracted per primitive pair.
+    def save_int_esp(self, ncol, switch):
+        dag, note = self.branch_dag(self.class_entries([(self.la, self.lb)]))
+        printer.write_esp_function(self.fhe, dag, self.la, self.lb, self.func_qualifier, ncol, switch, note)
+
+    # build the graph of the integral with the derivatives of its components with respect to C
+    # along the directions dirs (0, 1, 2 for x, y, z and 3 for a direction mu, see Dag.field)
+    def field_dag(self, dirs):
+        dag, note = self.branch_dag(self.class_entries([(self.la, self.lb)]))
+        for c in dirs:
+            for (i, j) in self.class_entries([(self.la, self.lb)]):
+                dag.roots.append((("field", c, i, j), dag.field(i, j, 0, c)))
+        return (dag, note)
+
+    # generate a function that saves the integral and its derivatives with respect to Cx, Cy and
+    # Cz into four slices of the store array
+    def save_int_field(self):
+        dag, note = self.field_dag((0, 1, 2))
+        printer.write_field_function(self.fhf, dag, self.la, self.lb, self.func_qualifier, note)
+
+    # generate a function that adds the integral summed over point charges and point dipoles to
+    # the store array
+    def save_int_dipoles(self, ncol, switch):
+        dag, note = self.field_dag((3,))
+        printer.write_dipoles_function(self.fhf, dag, self.la, self.lb, self.func_qualifier, ncol, switch, note)
@@ -24,6 +24,10 @@ from src.oei.iclass.OEint import OEint
 
 # [p|p] class, subclass of OEint
 class PPint(OEint):
+    # angular momenta of the first and second functions
+    la=1
+    lb=1
+
     def gen_int(self):
         # write code paths for integrals. Note that we use C++ classes here.
         for m in range(0,self.max_m+1):
@@ -24,6 +24,10 @@ from src.oei.iclass.OEint import OEint
 
 # [s|f] class, subclass of OEint
 class SFint(OEint):
+    # angular momenta of the first and second functions
+    la=0
+    lb=3
+
     def gen_int(self):
         # write code paths for integrals. Note that we use C++ classes here.
         for m in range(0,self.max_m+1):
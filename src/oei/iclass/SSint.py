@@ -24,6 +24,9 @@ from src.oei.iclass.OEint import OEint
 
 # [s|s] class, a subclass of OEint
 class SSint(OEint):
+    # angular momenta of the first and second functions
+    la=0
+    lb=0
 
     # generate code to save computed [s|s] integral
     def save_int(self):
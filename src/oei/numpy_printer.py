@@ -0,0 +1,77 @@
+#!---------------------------------------------------------------------!
+#! Written by Madu Manathunga on 07/01/2021                            !
+#!                                                                     !
+#! Copyright (C) 2020-2021 Merz lab                                    !
+#! Copyright (C) 2020-2021 Götz lab                                    !
+#!                                                                     !
+#! This source file is a part of QUICK-GenInt code generator and       !
+#! is subjected to the terms of the Mozilla Public License, v. 2.0.    !
+#! If a copy of the MPL was not distributed with this file, you can    !
+#! obtain one at http://mozilla.org/MPL/2.0/.                          !
+#!_____________________________________________________________________!
+
+#!---------------------------------------------------------------------!
+#! This source file contains printers that lower the recurrence graph  !
+#! (see vrr_graph.py) into python functions operating on numpy arrays. !
+#! Each function evaluates one integral class for N primitive pairs    !
+#! and returns an (N, na, nb) array.                                   !
+#!---------------------------------------------------------------------!
+
+import src.common.params as params
+import src.oei.printer as printer
+
+# name of the python function that computes the [la|lb] integral, e.g. oei_DD
+def function_name(la, lb):
+    return "oei_%s" % (printer.class_lbl(la, lb))
+
+# reference to a node in a numpy function. Primitive pair quantities are the function arguments,
+# Boys function values are rows vy_m of Y and integral components are local arrays x_i_j_m.
+def numpy_ref(dag, nid):
+    node=dag.nodes[nid]
+    if node.kind == "vy":
+        return "vy_%d" % (node.m)
+    return printer.flat_ref(dag, nid)
+
+def write_header(fh):
+    fh.write("# Integral functions for N primitive pairs. PAx, ..., TwoZetaInv are arrays of shape (N,)\n")
+    fh.write("# and Y is an array of shape (M, N) holding the Boys function values of order m = 0, ..., M-1\n")
+    fh.write("# (the YVerticalTemp array of the generated CUDA code). M must be at least la+lb+1. Each\n")
+    fh.write("# function returns an (N, na, nb) array whose element [p, i, j] is the store entry\n")
+    fh.write("# (params.shell_idx(la)[i], params.shell_idx(lb)[j]) of pair p.\n\n")
+    fh.write("import numpy as np\n")
+
+# write a python function that computes the store roots of the graph, i.e. the [la|lb] integral.
+# Every component is evaluated once for all pairs with vectorized numpy operations.
+def write_function(fh, dag, la, lb, note=None):
+    ids=[nid for (name, nid) in dag.roots]
+
+    fh.write("\n# %s integral, m=%d\n" % (printer.class_lbl(la, lb), 0))
+    fh.write("def %s(%s, Y):\n" % (function_name(la, lb), ", ".join(printer.input_order)))
+    if note is not None:
+        fh.write("    # %s\n" % (note))
+
+    ref=lambda nid: numpy_ref(dag, nid)
+    reach=dag.reachable(ids)
+    for nid in reach:
+        if dag.nodes[nid].kind == "vy":
+            fh.write("    %s = Y[%d]\n" % (ref(nid), dag.nodes[nid].m))
+    for nid in reach:
+        if dag.nodes[nid].kind == "int":
+            fh.write("    %s = %s\n" % (ref(nid), printer.expression(dag, nid, ref)))
+
+    names=[ref(nid) for nid in ids]
+    lines=[", ".join(names[n:n+8]) for n in range(0, len(names), 8)]
+    fh.write("    return np.stack([\n        %s], axis=-1).reshape(-1, %d, %d)\n" % \
+        (",\n        ".join(lines), len(params.shell_idx(la)), len(params.shell_idx(lb))))
+
+# write the table of functions by angular momenta and a function that dispatches to them
+def write_dispatch(fh, classes):
+    fh.write("\n# integral functions by angular momenta (la, lb)\n")
+    fh.write("functions={\n")
+    for (la, lb) in classes:
+        fh.write("    (%d, %d): %s,\n" % (la, lb, function_name(la, lb)))
+    fh.write("}\n")
+
+    fh.write("\n# [la|lb] integral for N primitive pairs, see the top of this file\n")
+    fh.write("def oei(la, lb, %s, Y):\n" % (", ".join(printer.input_order)))
+    fh.write("    return functions[(la, lb)](%s, Y)\n" % (", ".join(printer.input_order)))
@@ -18,106 +18,409 @@
 #!                                                                     !
 #!---------------------------------------------------------------------!
 
+import io
+import os
+import json
+import hashlib
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import src.common.params as params
 import src.common.file_handler as file_handler
-from src.oei.iclass.OEint import OEint
-from src.oei.iclass.SSint import SSint
-from src.oei.iclass.SPint import SPint
-from src.oei.iclass.PSint import PSint
-from src.oei.iclass.PPint import PPint
-from src.oei.iclass.DSint import DSint
-from src.oei.iclass.SDint import SDint
-from src.oei.iclass.DPint import DPint
-from src.oei.iclass.PDint import PDint
-from src.oei.iclass.DDint import DDint
-from src.oei.iclass.FSint import FSint
-from src.oei.iclass.SFint import SFint
-from src.oei.iclass.FPint import FPint
-from src.oei.iclass.PFint import PFint
-from src.oei.iclass.FDint import FDint
-from src.oei.iclass.DFint import DFint
-from src.oei.iclass.FFint import FFint
-
-def write_oei(outdir, func_qualifier='__device__ __inline__'):
-
-    # set files
-    OEint.fhc = open(outdir+"/gpu_oei_classes.h",'w')
-    OEint.fhd = open(outdir+"/gpu_oei_definitions.h",'w')
-    OEint.fha= open(outdir+"/gpu_oei_assembler.h",'w')
-    OEint.fhga= open(outdir+"/gpu_oei_grad_assembler.h",'w')
+import src.oei.vrr_graph as vrr_graph
+import src.oei.printer as printer
+import src.oei.numpy_printer as numpy_printer
+import src.oei.boys as boys_printer
+import src.oei.charge_tree as charge_tree
+import src.oei.esp_grid as esp_grid
+import src.oei.pair_cache as pair_cache_printer
+import src.oei.cost_model as cost_model
+from src.oei.iclass.OEint import OEint, grad_classes
+
+# integral classes in the order they are generated. [s|s] is trivial and saved directly from the
+# assembler, so it has no class.
+class_order=("PS", "SP", "PP", "DS", "SD", "DP", "PD", "DD", "FS", "SF", "FP", "PF", "FD", "DF", "FF")
+
+# max_m of each integral class when all classes are generated
+default_max_m={"PS": 5, "SP": 5, "PP": 2, "DS": 4, "SD": 4, "DP": 2, "PD": 2, "DD": 1,\
+    "FS": 3, "SF": 3, "FP": 2, "PF": 2, "FD": 1, "DF": 1, "FF": 0}
+
+# assembler branches in the order they are written into the integral and gradient assemblers
+oei_branches=("SS", "PS", "SP", "PP", "DS", "SD", "DP", "PD", "DD")
+grad_branches=("SS", "SP", "PS", "PP", "SD", "DS", "PD", "DP", "DD")
+
+# Load the integral class with label lbl (e.g. DD) from its module. Modules are only imported
+# when the class is needed.
+def load_iclass(lbl, max_m=0):
+    module=importlib.import_module("src.oei.iclass.%sint" % (lbl))
+    return getattr(module, "%sint" % (lbl))(max_m)
+
+# lower integral classes used by the recurrence of the [la|lb] class, as (la, lb, dm) tuples
+# where dm is the offset of their auxiliary index. This is the dependency table of the classes.
+def class_deps(la, lb):
+    deps=set()
+    for i in params.shell_idx(la):
+        for j in params.shell_idx(lb):
+            center, k, src, terms = vrr_graph.vrr_step(i, j)
+            for comp in [src]+[comp for (coeff, comp) in terms]:
+                cl=(params.ang_mom(comp[0]), params.ang_mom(comp[1]))
+                if cl != (0, 0):
+                    deps.add(cl+(0,))
+                    deps.add(cl+(1,))
+    return sorted(deps)
+
+# Return the integral classes required by the given assembler branches (integral class objects)
+# with the max_m of each, as a dictionary. A branch needs its own class for the integral and the
+# classes listed by grad_classes for the gradient with m=0, and every class needs the classes of
+# its recurrence. In symmetry mode only classes [a|b] with a >= b are required.
+def required_classes(branches, sym=0):
+    stack=[]
+    for iclass in branches:
+        for (la, lb) in [(iclass.la, iclass.lb)]+iclass.grad_classes():
+            stack.append((la, lb, 0))
+
+    max_m={}
+    while len(stack) > 0:
+        la, lb, m = stack.pop()
+        if (la, lb) == (0, 0):
+            continue
+        if sym == 1 and la < lb:
+            la, lb = lb, la
+
+        lbl=printer.class_lbl(la, lb)
+        if lbl in max_m and max_m[lbl] >= m:
+            continue
+        max_m[lbl]=m
+        for (cla, clb, dm) in class_deps(la, lb):
+            stack.append((cla, clb, m+dm))
+    return max_m
+
+# read the store entries consumed by each gradient branch from a json file of the form
+# {"2 1": [[i, j], ...], ...}, where the keys hold the angular momenta I and J of the branch
+def read_grad_entries(fname):
+    fh=open(fname,'r')
+    data=json.load(fh)
+    fh.close()
+
+    entries={}
+    for key in data:
+        I, J = [int(l) for l in key.split()]
+        entries[(I, J)]=[(ij[0], ij[1]) for ij in data[key]]
+    return entries
+
+# check the consumed store entries of each gradient branch. Every entry must be a store array
+# index pair below STOREDIM that belongs to one of the gradient classes of its branch, otherwise a
+# ValueError naming the entry is raised.
+def check_grad_entries(grad_entries):
+    storedim=len(params.Mcal)
+    for (I, J) in grad_entries:
+        lbl="%d %d" % (I, J)
+        if min(I, J) < 0 or max(I, J) >= len(params.shell_lbl) or printer.class_lbl(I, J) not in grad_branches:
+            raise ValueError("grad_entries lists the branch \"%s\", which is not a gradient assembler branch" % (lbl))
+        allowed=set([(i, j) for (la, lb) in grad_classes(I, J) for i in params.shell_idx(la) for j in params.shell_idx(lb)])
+        for ij in grad_entries[(I, J)]:
+            if len(ij) != 2 or not all([isinstance(k, int) and k >= 0 for k in ij]):
+                raise ValueError("grad_entries entry %s of branch \"%s\" is not a pair of store array indices" % (list(ij), lbl))
+            if max(ij) >= storedim:
+                raise ValueError("grad_entries entry %s of branch \"%s\" exceeds STOREDIM=%d" % (list(ij), lbl, storedim))
+            if tuple(ij) not in allowed:
+                raise ValueError("grad_entries entry %s of branch \"%s\" is not in the gradient classes %s of the branch"\
+                    % (list(ij), lbl, ", ".join([printer.class_lbl(la, lb) for (la, lb) in grad_classes(I, J)])))
+
+# class attributes of OEint that control code generation. These are passed to worker processes
+# explicitly, since they are not inherited when processes are spawned.
+settings=("func_qualifier", "debug", "cse", "ir", "sym", "grad_dce", "grad_entries", "plan", "ssa", "hrr", "batch", "numpy", "boys", "charges", "tree", "attenuated", "esp", "field", "pair_cache", "cost", "reg_budget", "compact")
+
+# class attributes of OEint that hold the memory buffers of the output files
+buffers=("fhc", "fhd", "fha", "fhga", "fhb", "fhn", "fhq", "fhe", "fhf")
+
+# Run a code generation method of an integral class in a worker process. The generated code is
+# collected in memory buffers instead of the output files and returned together with the
+# integral class object, whose state may be changed by the method, and the operation counts
+# recorded by the method.
+def run_task(task):
+    values, iclass, method, args = task
+    for name in values:
+        setattr(OEint, name, values[name])
+
+    for name in buffers:
+        setattr(OEint, name, io.StringIO())
+    OEint.costs={}
+    getattr(iclass, method)(*args)
+    return (tuple([getattr(OEint, name).getvalue() for name in buffers]), iclass, OEint.costs)
+
+# Call method on each integral class. With a process pool, the calls run in parallel and their
+# code is appended to the output buffers in the order of iclasses, so the result does not depend
+# on the number of processes. Without a pool, the calls write directly into the buffers.
+def run(pool, iclasses, method, *args):
+    if pool is None:
+        for iclass in iclasses:
+            getattr(iclass, method)(*args)
+        return
+
+    values=dict([(name, getattr(OEint, name)) for name in settings])
+    results=pool.map(run_task, [(values, iclass, method, args) for iclass in iclasses])
+    for (iclass, (code, result, costs)) in zip(iclasses, results):
+        for (name, text) in zip(buffers, code):
+            getattr(OEint, name).write(text)
+        iclass.__dict__.update(result.__dict__)
+        for section in costs:
+            OEint.costs.setdefault(section, {}).update(costs[section])
+
+# version of the generator, part of the cache key. The key also covers the generator source, so
+# this only needs to change if the meaning of the generated files changes in another way.
+version="1.0"
+
+# the generation settings of OEint in a form that can be written as json
+def setting_values():
+    values=dict([(name, getattr(OEint, name)) for name in settings])
+    if values["grad_entries"] is not None:
+        values["grad_entries"]=sorted([[list(key), sorted([list(ij) for ij in values["grad_entries"][key]])] for key in values["grad_entries"]])
+    return values
+
+# Return the cache key of the generated files. It combines the generator version and source,
+# the generation settings, the integral classes with their max_m and a hash of the recurrence
+# plan, i.e. the recurrence step taken for every component.
+def cache_key(iclasses, branches):
+    steps=[vrr_graph.vrr_step(i, j) for i in range(0,20) for j in range(0,20)]
+    plan_hash=hashlib.sha256(json.dumps(steps).encode()).hexdigest()
+
+    key={"version": version,
+         "source": file_handler.source_hash(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+         "settings": setting_values(),
+         "classes": [[type(iclass).__name__, iclass.max_m] for iclass in iclasses],
+         "branches": list(branches),
+         "plan": plan_hash}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+# Generate the one electron integral headers in outdir. The code is generated in memory and the
+# files are only written once generation has finished. nproc is the number of worker processes
+# used for generating integral classes and assembler branches, 0 uses all available cpus.
+# If cache is set, generation is skipped when the files in outdir were generated with the same
+# cache key, and files whose content did not change are not rewritten. Output files of earlier
+# runs that this run does not generate are removed, see file_handler.write_cache. The settings are keyword
+# only, see GenInt.py for their meaning.
+def write_oei(outdir, *, func_qualifier='__device__ __inline__', cse=0, ir=0, grad_dce=0, grad_entries=None, plan=0, ssa=0, hrr=0, sym=0,\
+    nproc=1, cache=0, branches=None, batch=0, numpy=0, boys=0, charges=0, tree=0, attenuated=0, esp=0, field=0, pair_cache=0, cost=0,\
+    reg_budget=0, compact=None):
+
+    # set memory buffers for the output files
+    OEint.fhc = io.StringIO()
+    OEint.fhd = io.StringIO()
+    OEint.fha= io.StringIO()
+    OEint.fhga= io.StringIO()
+    OEint.fhb= io.StringIO()
+    OEint.fhn= io.StringIO()
+    OEint.fhq= io.StringIO()
+    OEint.fhe= io.StringIO()
+    OEint.fhf= io.StringIO()
+    OEint.costs={}
 
     # set function qualifiers
     OEint.func_qualifier=func_qualifier
 
+    # set common subexpression elimination mode for assemblers
+    OEint.cse=cse
+
+    # set recurrence graph mode; class definitions and assemblers are lowered from an in-memory graph
+    OEint.ir=ir
+
+    # set permutation symmetry mode. Only [a|b] classes with a >= b are generated and [b|a] is
+    # served by exchanging centers A and B. This works on the class layout of the recurrence
+    # graph, so it enables ir mode.
+    OEint.sym=sym
+    if sym == 1:
+        ir=1
+        OEint.ir=ir
+
+    # set register budget. The live values of each class constructor are estimated and classes
+    # above the budget are split into row (or column) partial classes, which the assemblers and
+    # the classes built from them construct one part at a time. This works on the class layout of
+    # the recurrence graph, so it enables ir mode; 0 splits nothing.
+    OEint.reg_budget=reg_budget
+    if reg_budget > 0:
+        ir=1
+        OEint.ir=ir
+
+    # set compact classes, a list of class labels such as ["FF", "FD"]. Their constructors loop
+    # over a recurrence table instead of unrolling every component, which trades some speed for
+    # smaller code. This works on the class layout of the recurrence graph, so it enables ir mode.
+    OEint.compact=sorted(set(compact)) if compact else []
+    if len(OEint.compact) > 0:
+        ir=1
+        OEint.ir=ir
+
+    # set dead code elimination mode for the gradient assembler. grad_entries optionally holds the
+    # store entries consumed by each branch, either as a dictionary or the name of a json file.
+    OEint.grad_dce=grad_dce
+    if grad_dce == 1 and grad_entries is None:
+        raise ValueError("grad_dce requires grad_entries, the store entries read by the gradient code; without them every gradient class is consumed and nothing is removed")
+    if isinstance(grad_entries, str):
+        grad_entries=read_grad_entries(grad_entries)
+    if grad_entries is not None:
+        check_grad_entries(grad_entries)
+    OEint.grad_entries=grad_entries
+
+    # set recurrence planning for flat assemblers (cse, grad_dce, ssa and hrr modes). The savings
+    # over the default recurrence rule are reported in each branch.
+    OEint.plan=plan
+
+    # set ssa mode; each assembler branch is written as a flat function without integral classes
+    OEint.ssa=ssa
+
+    # set horizontal recurrence mode for the integral assembler. OEint_vertical then computes [e|s]
+    # integrals and OEint_horizontal transfers them into [a|b] after primitive contraction.
+    OEint.hrr=hrr
+
+    # set host batch mode; cpu_oei_batch.h holds a kernel for every integral class saved by the
+    # assemblers, which evaluates the class for n primitive pairs with vectorized loops
+    OEint.batch=batch
+
+    # set numpy mode; oei_numpy.py holds a python function for every integral class up to [f|f]
+    # that evaluates the class for arrays of primitive pairs
+    OEint.numpy=numpy
+
+    # set Boys function mode; gpu_oei_boys.h holds the producer of YVerticalTemp for the orders
+    # required by the assemblers
+    OEint.boys=boys
+
+    # set point charge mode; gpu_oei_charges.h holds assemblers that sum each branch over an array
+    # of point charges. They evaluate the Boys function with the table of the producer, so this
+    # enables the Boys function mode.
+    OEint.charges=charges
+    if charges == 1:
+        boys=1
+        OEint.boys=boys
+
+    # set tree mode; cpu_oei_tree.h sums the branches over point charges sorted into an octree,
+    # where near leaves are computed by the point charge assemblers and far nodes by their
+    # moments. This enables the point charge mode.
+    OEint.tree=tree
+    if tree == 1:
+        charges=1
+        boys=1
+        OEint.charges=charges
+        OEint.boys=boys
+
+    # set attenuated operator mode; gpu_oei_boys.h and gpu_oei_charges.h also hold the Boys
+    # function producers and point charge assemblers of erf(omega r)/r and erfc(omega r)/r. The
+    # vertical recurrence is the same for all operators, so OEint_vertical serves them with the
+    # values of oei_boys_erf or oei_boys_erfc. This enables the point charge mode.
+    OEint.attenuated=attenuated
+    if attenuated == 1:
+        charges=1
+        boys=1
+        OEint.charges=charges
+        OEint.boys=boys
+
+    # set grid mode; gpu_oei_esp.h holds functions that contract each branch with a density block
+    # at an array of grid points and cpu_oei_esp.h the host driver that streams the grid through
+    # them. They evaluate the Boys function with the table of the producer, so this enables the
+    # Boys function mode.
+    OEint.esp=esp
+    if esp == 1:
+        boys=1
+        OEint.boys=boys
+
+    # set field mode; gpu_oei_field.h holds functions that save each branch together with its
+    # derivatives with respect to C, and functions that sum it over point charges and dipoles.
+    # The latter evaluate the Boys function with the table of the producer, so this enables the
+    # Boys function mode.
+    OEint.field=field
+    if field == 1:
+        boys=1
+        OEint.boys=boys
+
+    # set pair cache mode; cpu_oei_pair_cache.h keeps the pair quantities and point charge sums
+    # of recent QM geometries and updates the sums for the charges that moved. This enables the
+    # point charge mode.
+    OEint.pair_cache=pair_cache
+    if pair_cache == 1:
+        charges=1
+        boys=1
+        OEint.charges=charges
+        OEint.boys=boys
+
+    # set cost report mode; oei_cost.json holds the static operation counts of every class
+    # constructor, flat function and assembler branch, see cost_model.py
+    OEint.cost=cost
+
     # write license info
     file_handler.write_license(OEint.fhc)
     file_handler.write_license(OEint.fhd)
     file_handler.write_license(OEint.fha)
     file_handler.write_license(OEint.fhga)
-
-    # generate integral classes for systems containing only s, p, d and f functions.
-    # generate [s|s], this is trivial and we will directly save the integral value from the driver. 
-    ss=SSint()
-
-    # generate [p|s]
-    ps=PSint(5)
-    ps.gen_int() 
-
-    # generate [s|p]
-    sp=SPint(5)
-    sp.gen_int()
-
-    # generate [p|p]
-    pp=PPint(2)
-    pp.gen_int()
-
-    # generate [d|s]
-    ds=DSint(4)
-    ds.gen_int()
-
-    # generate [s|d]
-    sd=SDint(4)
-    sd.gen_int() 
-
-    # generate [d|p]
-    dp=DPint(2)
-    dp.gen_int()
-
-    # generate [p|d]
-    pd=PDint(2)
-    pd.gen_int()
-
-    # generate [d|d]
-    dd=DDint(1)
-    dd.gen_int()
-
-    # generate [f|s]
-    fs=FSint(3)
-    fs.gen_int()
-
-    # generate [s|f]
-    sf=SFint(3)
-    sf.gen_int()
-
-    # generate [f|p]
-    fp=FPint(2)
-    fp.gen_int()
-
-    # generate [p|f]
-    pf=PFint(2)
-    pf.gen_int()
-
-    # generate [f|p]
-    fd=FDint(1)
-    fd.gen_int()    
-
-    # generate [d|f]
-    df=DFint(1)
-    df.gen_int() 
-
-    # generate [f|f]
-    ff=FFint(0)
-    ff.gen_int() 
+    file_handler.write_license(OEint.fhb)
+    file_handler.write_license(OEint.fhq)
+    file_handler.write_license(OEint.fhe)
+    file_handler.write_license(OEint.fhf)
+
+    # generate integral classes for systems containing only s, p, d and f functions. By default,
+    # all classes are generated with the assemblers for s, p and d functions. If branches is set
+    # (e.g. ["DD", "PD"]), only the classes required by these assembler branches are generated.
+    if branches is None:
+        branches=oei_branches
+        max_m=default_max_m
+    else:
+        max_m=required_classes([load_iclass(lbl) for lbl in branches], sym)
+
+    ic={}
+    for lbl in class_order:
+        if lbl in max_m:
+            ic[lbl]=load_iclass(lbl, max_m[lbl])
+    for lbl in branches:
+        if lbl not in ic:
+            ic[lbl]=load_iclass(lbl)
+
+    iclasses=tuple([ic[lbl] for lbl in class_order if lbl in max_m])
+    oei=tuple([ic[lbl] for lbl in oei_branches if lbl in branches])
+    grad=tuple([ic[lbl] for lbl in grad_branches if lbl in branches])
+
+    # skip generation if the output is up to date
+    key=cache_key(iclasses, branches)
+    if cache == 1 and file_handler.cache_valid(outdir, key):
+        print("Generated files in %s are up to date. \n" % (outdir))
+        return
+
+    # set process pool. Processes are forked where possible, so that the main script is not
+    # imported again by each worker.
+    if nproc == 0:
+        nproc=os.cpu_count()
+    pool=None
+    if nproc > 1:
+        if "fork" in multiprocessing.get_all_start_methods():
+            pool=ProcessPoolExecutor(max_workers=nproc, mp_context=multiprocessing.get_context("fork"))
+        else:
+            pool=ProcessPoolExecutor(max_workers=nproc)
+
+    if ir == 1:
+        # build the recurrence graph of all integral classes and lower it into the class layout.
+        # In symmetry mode, the canonical classes are closed under the recurrence.
+        if sym == 1:
+            iclasses=tuple([iclass for iclass in iclasses if iclass.la >= iclass.lb])
+
+        dag=vrr_graph.Dag()
+        for iclass in iclasses:
+            for m in range(0,iclass.max_m+1):
+                dag.add_class(iclass.la, iclass.lb, m)
+
+        OEint.costs["classes"]=printer.write_classes(OEint.fhc, OEint.fhd, dag, [(iclass.la, iclass.lb, iclass.max_m) for iclass in iclasses],\
+            func_qualifier, reg_budget, printer.compact_classes(OEint.compact))
+
+        # register the values saved by the assemblers as roots and write the graph for external tools
+        for iclass in oei:
+            for (la, lb) in [(iclass.la, iclass.lb)]+iclass.grad_classes():
+                branch = "oei" if (la, lb) == (iclass.la, iclass.lb) else "grad"
+                for i in params.shell_idx(la):
+                    for j in params.shell_idx(lb):
+                        dag.roots.append(((branch, iclass.la, iclass.lb, i, j), dag.vrr(i, j, 0)))
+
+        ir_json=dag.to_json()
+    elif ssa == 1:
+        OEint.fhc.write("\n/* integral classes are not used in ssa mode, see gpu_oei_assembler.h */ \n")
+        OEint.fhd.write("\n/* integral classes are not used in ssa mode, see gpu_oei_assembler.h */ \n")
+    else:
+        run(pool, iclasses, "gen_int")
 
     # Now we write the driver to save computed primitive integrals. The function parameters are as follows.
     # I, J - angular momentum of first and second shells (0, 1, 2, 3, and 4 for s, p, d, f and g respectively)
@@ -168,48 +471,187 @@ def write_oei(outdir, func_qualifier='__device__ __inline__'):
 
     # Yvertical - a 1D array holding boys function values,the size is Max_I+ Max_J+2.
 
+    # in ssa mode, write the branch functions ahead of the assembler
+    if OEint.ssa == 1 and OEint.hrr == 0:
+        run(pool, oei, "save_int_ssa")
+        OEint.fha.write("\n")
+
     OEint.fha.write("%s void OEint_vertical(int I, int J, int II, int JJ,QUICKDouble PAx, QUICKDouble PAy, QUICKDouble PAz,\n\
         QUICKDouble PBx, QUICKDouble PBy, QUICKDouble PBz, QUICKDouble PCx, QUICKDouble PCy, QUICKDouble PCz, QUICKDouble TwoZetaInv,\n\
         QUICKDouble* store, QUICKDouble* YVerticalTemp){ \n" % (func_qualifier))
-    ss.save_int()
-    ps.save_int()
-    sp.save_int()
-    pp.save_int()
-    ds.save_int()
-    sd.save_int()
-    dp.save_int()
-    pd.save_int()
-    dd.save_int()
-    #fs.save_int()
-    #sf.save_int()
-    #fp.save_int()
-    #pf.save_int()
-    #fd.save_int()
-    #df.save_int()
-    #ff.save_int()
+
+    # in cse mode, each branch computes the components it needs exactly once without integral classes
+    if OEint.hrr == 1:
+        run(pool, oei, "save_int_hrr")
+    elif OEint.ssa == 1:
+        run(pool, oei, "save_int_ssa_call")
+    elif OEint.cse == 1:
+        run(pool, oei, "save_int_cse")
+    elif OEint.ir == 1:
+        run(pool, oei, "save_int_ir", dag)
+    else:
+        run(pool, oei, "save_int")
 
     OEint.fha.write("\n } \n")
 
+    # Write the horizontal recurrence that transfers [e|s] integrals into [a|b]. It runs once per
+    # shell pair on the contracted store array, after the primitive integrals computed by
+    # OEint_vertical have been contracted. ABx, ABy, ABz - Ax-Bx, Ay-By and Az-Bz.
+    if OEint.hrr == 1:
+        OEint.fha.write("\n%s void OEint_horizontal(int I, int J, QUICKDouble ABx, QUICKDouble ABy, QUICKDouble ABz, QUICKDouble* store){ \n" % (func_qualifier))
+        run(pool, tuple([iclass for iclass in oei if iclass.lb > 0]), "save_int_hrr_transfer")
+        OEint.fha.write("\n } \n")
+
     # Write the driver to save computed primitive integrals required for gradient calculation. The parameters are the same that we reported above. 
+    if OEint.ssa == 1:
+        run(pool, grad, "save_int_grad_ssa")
+        OEint.fhga.write("\n")
+
     OEint.fhga.write("%s void oei_grad_vertical(int I, int J, int II, int JJ,QUICKDouble PAx, QUICKDouble PAy, QUICKDouble PAz,\n\
         QUICKDouble PBx, QUICKDouble PBy, QUICKDouble PBz, QUICKDouble PCx, QUICKDouble PCy, QUICKDouble PCz, QUICKDouble TwoZetaInv,\n\
         QUICKDouble* store, QUICKDouble* YVerticalTemp){ \n" % (func_qualifier))
 
-    ss.save_int_grad()
-    sp.save_int_grad()
-    ps.save_int_grad()
-    pp.save_int_grad()
-    sd.save_int_grad()
-    ds.save_int_grad()
-    pd.save_int_grad()
-    dp.save_int_grad()
-    dd.save_int_grad()
+    # in dead code elimination mode, each branch only computes the store entries read by the gradient code
+    if OEint.ssa == 1:
+        run(pool, grad, "save_int_grad_ssa_call")
+    elif OEint.grad_dce == 1:
+        run(pool, grad, "save_int_grad_dce")
+    elif OEint.cse == 1:
+        run(pool, grad, "save_int_grad_cse")
+    elif OEint.ir == 1:
+        run(pool, grad, "save_int_grad_ir", dag)
+    else:
+        run(pool, grad, "save_int_grad")
 
     OEint.fhga.write("\n } \n") 
 
-    OEint.fhc.close()
-    OEint.fhd.close()
-    OEint.fha.close()
-    OEint.fhga.close()
+    # Write the host batch kernels. The integral classes saved by the integral and gradient
+    # assemblers are evaluated for n primitive pairs at once; the arrays are described in
+    # printer.write_batch_kernel. oei_batch(I, J, ...) dispatches to the kernel of [I|J].
+    if batch == 1:
+        OEint.fhb.write("#ifndef OEI_RESTRICT \n#define OEI_RESTRICT __restrict__ \n#endif \n")
+        batch_classes=[]
+        for iclass in oei:
+            for (la, lb) in [(iclass.la, iclass.lb)]+iclass.grad_classes():
+                if (la, lb) not in batch_classes:
+                    batch_classes.append((la, lb))
+        run(pool, tuple([load_iclass(printer.class_lbl(la, lb)) for (la, lb) in batch_classes]), "save_int_batch")
+        printer.write_batch_dispatch(OEint.fhb, batch_classes)
+
+    # Write the numpy functions of all integral classes from [s|s] to [f|f], see numpy_printer.
+    if numpy == 1:
+        file_handler.write_py_license(OEint.fhn)
+        numpy_printer.write_header(OEint.fhn)
+        numpy_classes=tuple([load_iclass(lbl) for lbl in ("SS",)+class_order])
+        run(pool, numpy_classes, "save_int_numpy")
+        numpy_printer.write_dispatch(OEint.fhn, [(iclass.la, iclass.lb) for iclass in numpy_classes])
+
+    # Write the Boys function producer. A branch of OEint_vertical for [I|J] needs orders up to
+    # I+J and a branch of oei_grad_vertical up to I+J+1; the tables are computed here.
+    if boys == 1:
+        fhy=io.StringIO()
+        file_handler.write_license(fhy)
+        orders=sorted(set([iclass.la+iclass.lb for iclass in oei]+[iclass.la+iclass.lb+1 for iclass in grad]+\
+            [iclass.la+iclass.lb+1 for iclass in oei if field == 1]))
+        boys_printer.write_boys(fhy, orders, func_qualifier, attenuated)
+
+    # Write the point charge assemblers OEint_vertical_charges and oei_grad_vertical_charges. They
+    # take the parameters of OEint_vertical with PC and YVerticalTemp replaced by the weighted
+    # center P, the Boys function prefactor of the pair and the arrays of point charges, see
+    # printer.write_charges_function, and add to store. gpu_oei_boys.h must be included first.
+    if charges == 1 or esp == 1 or field == 1:
+        import src.oei.reference as reference
+        ncol=boys_printer.boys_ncol(max(orders))
+        switch=reference.boys_switch
+    if charges == 1:
+        for op in ("coulomb",)+(boys_printer.operators if attenuated == 1 else ()):
+            run(pool, oei, "save_int_charges", ncol, switch, op)
+            printer.write_charges_dispatch(OEint.fhq, [(iclass.la, iclass.lb) for iclass in oei], False, func_qualifier, op)
+            run(pool, grad, "save_int_grad_charges", ncol, switch, op)
+            printer.write_charges_dispatch(OEint.fhq, [(iclass.la, iclass.lb) for iclass in grad], True, func_qualifier, op)
+
+    # Write the octree over point charges, see charge_tree.py. gpu_oei_boys.h and gpu_oei_charges.h
+    # must be included first. The far field of a branch covers the classes it saves.
+    if tree == 1:
+        fht=io.StringIO()
+        file_handler.write_license(fht)
+        tree_oei=[((iclass.la, iclass.lb), [(l, 0) for l in range(iclass.la, iclass.la+iclass.lb+1)] if hrr == 1 else [(iclass.la, iclass.lb)]) for iclass in oei]
+        tree_grad=[((iclass.la, iclass.lb), iclass.grad_classes()) for iclass in grad]
+        charge_tree.write_charge_tree(fht, tree_oei, tree_grad, switch)
+
+    # Write the grid point functions oei_esp_IJ and their dispatcher oei_esp, see
+    # printer.write_esp_function, and the host driver, see esp_grid.py. gpu_oei_boys.h must be
+    # included first.
+    if esp == 1:
+        run(pool, oei, "save_int_esp", ncol, switch)
+        printer.write_esp_dispatch(OEint.fhe, [(iclass.la, iclass.lb) for iclass in oei], func_qualifier)
+        fhg=io.StringIO()
+        file_handler.write_license(fhg)
+        esp_grid.write_esp_grid(fhg)
+
+    # Write the field functions oei_field_vertical, which take the arguments of OEint_vertical
+    # with Boys function values up to order I+J+1, and the point dipole assemblers
+    # OEint_vertical_dipoles, see printer.write_field_function and printer.write_dipoles_function.
+    # gpu_oei_boys.h must be included first.
+    if field == 1:
+        run(pool, oei, "save_int_field")
+        printer.write_field_dispatch(OEint.fhf, [(iclass.la, iclass.lb) for iclass in oei], func_qualifier)
+        run(pool, oei, "save_int_dipoles", ncol, switch)
+        printer.write_dipoles_dispatch(OEint.fhf, [(iclass.la, iclass.lb) for iclass in oei], func_qualifier)
+
+    # Write the pair cache, see pair_cache.py. gpu_oei_boys.h and gpu_oei_charges.h must be
+    # included first. The cached block of a branch covers the classes it saves.
+    if pair_cache == 1:
+        fhp=io.StringIO()
+        file_handler.write_license(fhp)
+        cache_oei=[((iclass.la, iclass.lb), [(l, 0) for l in range(iclass.la, iclass.la+iclass.lb+1)] if hrr == 1 else [(iclass.la, iclass.lb)]) for iclass in oei]
+        pair_cache_printer.write_pair_cache(fhp, cache_oei)
+
+    if pool is not None:
+        pool.shutdown()
+
+    # write output files. With the cache, unchanged files keep their content, date stamp and
+    # modification time.
+    outputs=[("gpu_oei_classes.h", OEint.fhc.getvalue()), ("gpu_oei_definitions.h", OEint.fhd.getvalue()),\
+        ("gpu_oei_assembler.h", OEint.fha.getvalue()), ("gpu_oei_grad_assembler.h", OEint.fhga.getvalue())]
+    if ir == 1:
+        outputs.append(("gpu_oei_ir.json", ir_json))
+    if batch == 1:
+        outputs.append(("cpu_oei_batch.h", OEint.fhb.getvalue()))
+    if numpy == 1:
+        outputs.append(("oei_numpy.py", OEint.fhn.getvalue()))
+    if boys == 1:
+        outputs.append(("gpu_oei_boys.h", fhy.getvalue()))
+    if charges == 1:
+        outputs.append(("gpu_oei_charges.h", OEint.fhq.getvalue()))
+    if tree == 1:
+        outputs.append(("cpu_oei_tree.h", fht.getvalue()))
+    if esp == 1:
+        outputs.append(("gpu_oei_esp.h", OEint.fhe.getvalue()))
+        outputs.append(("cpu_oei_esp.h", fhg.getvalue()))
+    if field == 1:
+        outputs.append(("gpu_oei_field.h", OEint.fhf.getvalue()))
+    if pair_cache == 1:
+        outputs.append(("cpu_oei_pair_cache.h", fhp.getvalue()))
+    # Code lowered from the recurrence graph is counted by the printers, the hand written class
+    # layout is read from the text, which also cross-checks the printer counts
+    if cost == 1:
+        report=cost_model.report(dict(outputs), OEint.costs)
+        for (entry, name, counted, parsed) in cost_model.cross_check(report, dict(outputs)):
+            if name is None:
+                print("Warning: cost entry %s is not found in the generated code. \n" % (entry))
+            else:
+                print("Warning: cost entry %s counts %s=%d, the generated code %d. \n" % (entry, name, counted, parsed))
+        outputs.append(("oei_cost.json", json.dumps(report, indent=1, sort_keys=True)+"\n"))
+
+    for (name, text) in outputs:
+        if cache == 1:
+            file_handler.write_if_changed(outdir+"/"+name, text)
+        else:
+            file_handler.write_atomic(outdir+"/"+name, text)
+
+    # The cache file is written in any case, as the manifest of the files and settings of this
+    # run. Files of earlier runs that this run does not generate are removed.
+    file_handler.write_cache(outdir, key, [name for (name, text) in outputs], setting_values())
 
 
@@ -0,0 +1,211 @@
+#!---------------------------------------------------------------------!
+#! Written by Madu Manathunga on 07/01/2021                            !
+#!                                                                     !
+#! Copyright (C) 2020-2021 Merz lab                                    !
+#! Copyright (C) 2020-2021 Götz lab                                    !
+#!                                                                     !
+#! This source file is a part of QUICK-GenInt code generator and       !
+#! is subjected to the terms of the Mozilla Public License, v. 2.0.    !
+#! If a copy of the MPL was not distributed with this file, you can    !
+#! obtain one at http://mozilla.org/MPL/2.0/.                          !
+#!_____________________________________________________________________!
+
+#!---------------------------------------------------------------------!
+#! This source file contains a printer for a host cache of primitive   !
+#! pair data for QM/MM runs in which the QM region does not move. For  !
+#! each QM geometry, the pair quantities and the integrals of every    !
+#! pair summed over the point charges are kept, least recently used    !
+#! geometries are evicted. When only the charges change, the integrals !
+#! are updated with the point charge assemblers of gpu_oei_charges.h   !
+#! for the charges that moved by more than a threshold: their old      !
+#! contribution is subtracted and the new one added.                   !
+#!---------------------------------------------------------------------!
+
+import math
+import src.common.params as params
+
+# Write the function that returns the rectangle of store entries written by the point charge
+# assembler of each branch. branches holds ((I, J), classes) of the assemblers, where classes
+# are the integral classes saved by the branch.
+def write_block(fh, branches):
+    fh.write("\n/* first row i0, number of rows ni, first column j0 and number of columns nj of the store entries of a branch */ \n")
+    fh.write("inline void oei_cache_block(int I, int J, int* i0, int* ni, int* j0, int* nj){ \n")
+    fh.write("  *i0=0; *ni=0; *j0=0; *nj=0; \n")
+    for ((I, J), classes) in branches:
+        rows=[i for (la, lb) in classes for i in params.shell_idx(la)]
+        cols=[j for (la, lb) in classes for j in params.shell_idx(lb)]
+        fh.write("  if(I == %d && J == %d){ \n" % (I, J))
+        fh.write("    *i0=%d; *ni=%d; *j0=%d; *nj=%d; \n" % (min(rows), max(rows)-min(rows)+1, min(cols), max(cols)-min(cols)+1))
+        fh.write("  } \n")
+    fh.write("} \n")
+
+# Write cpu_oei_pair_cache.h for the assembler branches, see write_block
+def write_pair_cache(fh, branches):
+    fh.write('''
+#include <vector>
+#include <list>
+#include <cstring>
+#include <cstdint>
+
+#ifndef OEI_CACHE_CAPACITY
+#define OEI_CACHE_CAPACITY 4
+#endif
+
+/* quantities of a primitive pair of shells with angular momenta I and J; offset is the position
+   of its integral block in oei_cache_entry::values */
+struct oei_cache_pair{
+    int I, J, offset;
+    QUICKDouble PAx, PAy, PAz, PBx, PBy, PBz, Px, Py, Pz, TwoZetaInv, prefactor;
+};
+
+/* a QM geometry, i.e. the angular momenta IJ and the primitives prims (Ax, Ay, Az, Bx, By, Bz,
+   alpha, beta, coef) of each pair, with the pair quantities and the integrals summed over the
+   charges Cx, Cy, Cz, q at which they were last evaluated */
+struct oei_cache_entry{
+    uint64_t hash;
+    std::vector<int> IJ;
+    std::vector<QUICKDouble> prims;
+    std::vector<oei_cache_pair> pairs;
+    std::vector<QUICKDouble> values;
+    std::vector<QUICKDouble> Cx, Cy, Cz, q;
+};
+
+/* geometries ordered from the most to the least recently used, with counters of lookups that
+   found a geometry, lookups that did not, evicted geometries and charges that were updated */
+struct oei_pair_cache{
+    int capacity;
+    std::list<oei_cache_entry> entries;
+    long hits, misses, evictions, moved;
+    oei_pair_cache(int capacity=OEI_CACHE_CAPACITY): capacity(capacity), hits(0), misses(0), evictions(0), moved(0){}
+};
+''')
+
+    write_block(fh, branches)
+
+    fh.write('''
+/* FNV-1a hash of the angular momenta and primitives of npairs pairs */
+inline uint64_t oei_cache_hash(int npairs, const int* I, const int* J, const QUICKDouble* prims){
+    uint64_t h=14695981039346656037ULL;
+    const unsigned char* b=(const unsigned char*)prims;
+    for(size_t k=0; k<9*npairs*sizeof(QUICKDouble); k++) h=(h^b[k])*1099511628211ULL;
+    for(int k=0; k<npairs; k++) h=(h^(uint64_t)(16*I[k]+J[k]))*1099511628211ULL;
+    return h;
+}
+
+inline oei_cache_pair oei_cache_make_pair(int I, int J, const QUICKDouble* prim){
+    oei_cache_pair s;
+    const QUICKDouble alpha=prim[6], beta=prim[7], Zeta=alpha+beta;
+    const QUICKDouble ABx=prim[0]-prim[3], ABy=prim[1]-prim[4], ABz=prim[2]-prim[5];
+    s.I=I;
+    s.J=J;
+    s.Px=(alpha*prim[0]+beta*prim[3])/Zeta;
+    s.Py=(alpha*prim[1]+beta*prim[4])/Zeta;
+    s.Pz=(alpha*prim[2]+beta*prim[5])/Zeta;
+    s.PAx=s.Px-prim[0]; s.PAy=s.Py-prim[1]; s.PAz=s.Pz-prim[2];
+    s.PBx=s.Px-prim[3]; s.PBy=s.Py-prim[4]; s.PBz=s.Pz-prim[5];
+    s.TwoZetaInv=0.5/Zeta;
+    s.prefactor=prim[8]*%.17e/Zeta*exp(-alpha*beta/Zeta*(ABx*ABx+ABy*ABy+ABz*ABz));
+    return s;
+}
+
+/* Return the entry of a QM geometry and make it the most recently used one. A new entry gets the
+   pair quantities and no charges; the least recently used entry is evicted if the cache is full. */
+inline oei_cache_entry& oei_cache_lookup(oei_pair_cache& cache, int npairs, const int* I, const int* J, const QUICKDouble* prims){
+    const uint64_t h=oei_cache_hash(npairs, I, J, prims);
+    for(std::list<oei_cache_entry>::iterator e=cache.entries.begin(); e!=cache.entries.end(); ++e){
+        if(e->hash != h || (int)e->pairs.size() != npairs) continue;
+        if(memcmp(&e->prims[0], prims, 9*npairs*sizeof(QUICKDouble)) != 0) continue;
+        bool same=true;
+        for(int k=0; k<npairs && same; k++) same=(e->IJ[2*k] == I[k] && e->IJ[2*k+1] == J[k]);
+        if(!same) continue;
+        cache.hits++;
+        cache.entries.splice(cache.entries.begin(), cache.entries, e);
+        return cache.entries.front();
+    }
+
+    cache.misses++;
+    if((int)cache.entries.size() >= cache.capacity && cache.entries.size() > 0){
+        cache.entries.pop_back();
+        cache.evictions++;
+    }
+    cache.entries.push_front(oei_cache_entry());
+    oei_cache_entry& e=cache.entries.front();
+    e.hash=h;
+    e.prims.assign(prims, prims+9*npairs);
+    int offset=0;
+    for(int k=0; k<npairs; k++){
+        int i0, ni, j0, nj;
+        oei_cache_block(I[k], J[k], &i0, &ni, &j0, &nj);
+        e.IJ.push_back(I[k]);
+        e.IJ.push_back(J[k]);
+        e.pairs.push_back(oei_cache_make_pair(I[k], J[k], prims+9*k));
+        e.pairs.back().offset=offset;
+        offset += ni*nj;
+    }
+    e.values.assign(offset, 0.0);
+    return e;
+}
+
+/* add the integrals of every pair of an entry summed over n charges to its values */
+inline void oei_cache_accumulate(oei_cache_entry& e, int n, const QUICKDouble* Cx, const QUICKDouble* Cy, const QUICKDouble* Cz, const QUICKDouble* q){
+    std::vector<QUICKDouble> scratch(STOREDIM*STOREDIM);
+    QUICKDouble* store=&scratch[0];
+    for(size_t k=0; k<e.pairs.size(); k++){
+        const oei_cache_pair& s=e.pairs[k];
+        int i0, ni, j0, nj;
+        oei_cache_block(s.I, s.J, &i0, &ni, &j0, &nj);
+        for(int i=0; i<ni; i++) for(int j=0; j<nj; j++) LOCSTORE(store, i0+i, j0+j, STOREDIM, STOREDIM)=0.0;
+        OEint_vertical_charges(s.I, s.J, 0, 0, s.PAx, s.PAy, s.PAz, s.PBx, s.PBy, s.PBz, s.Px, s.Py, s.Pz, s.TwoZetaInv, s.prefactor,
+            n, Cx, Cy, Cz, q, store);
+        for(int i=0; i<ni; i++) for(int j=0; j<nj; j++) e.values[s.offset+i*nj+j] += LOCSTORE(store, i0+i, j0+j, STOREDIM, STOREDIM);
+    }
+}
+
+/* Return the entry of a QM geometry, see oei_cache_lookup, with the integrals of each pair summed
+   over ncharges point charges. If the entry holds the same number of charges, only charges whose
+   magnitude changed or that moved by more than threshold from the position of their last
+   evaluation are updated, the others keep their previous contribution. Otherwise all charges are
+   evaluated. */
+inline oei_cache_entry& oei_cache_update(oei_pair_cache& cache, int npairs, const int* I, const int* J, const QUICKDouble* prims,
+        int ncharges, const QUICKDouble* Cx, const QUICKDouble* Cy, const QUICKDouble* Cz, const QUICKDouble* q, QUICKDouble threshold){
+    oei_cache_entry& e=oei_cache_lookup(cache, npairs, I, J, prims);
+    if((int)e.q.size() != ncharges){
+        for(size_t k=0; k<e.values.size(); k++) e.values[k]=0.0;
+        oei_cache_accumulate(e, ncharges, Cx, Cy, Cz, q);
+        e.Cx.assign(Cx, Cx+ncharges);
+        e.Cy.assign(Cy, Cy+ncharges);
+        e.Cz.assign(Cz, Cz+ncharges);
+        e.q.assign(q, q+ncharges);
+        cache.moved += ncharges;
+        return e;
+    }
+
+    /* the moved charges at their new positions, followed by the same charges at their old
+       positions with opposite sign */
+    std::vector<int> moved;
+    for(int c=0; c<ncharges; c++){
+        const QUICKDouble dx=Cx[c]-e.Cx[c], dy=Cy[c]-e.Cy[c], dz=Cz[c]-e.Cz[c];
+        if(q[c] != e.q[c] || dx*dx+dy*dy+dz*dz > threshold*threshold) moved.push_back(c);
+    }
+    const int nm=(int)moved.size();
+    if(nm == 0) return e;
+    std::vector<QUICKDouble> delta(8*nm);
+    for(int k=0; k<nm; k++){
+        const int c=moved[k];
+        delta[k]=Cx[c]; delta[2*nm+k]=Cy[c]; delta[4*nm+k]=Cz[c]; delta[6*nm+k]=q[c];
+        delta[nm+k]=e.Cx[c]; delta[3*nm+k]=e.Cy[c]; delta[5*nm+k]=e.Cz[c]; delta[7*nm+k]=-e.q[c];
+        e.Cx[c]=Cx[c]; e.Cy[c]=Cy[c]; e.Cz[c]=Cz[c]; e.q[c]=q[c];
+    }
+    oei_cache_accumulate(e, 2*nm, &delta[0], &delta[2*nm], &delta[4*nm], &delta[6*nm]);
+    cache.moved += nm;
+    return e;
+}
+
+/* add the integrals of pair k of an entry to the store array, as OEint_vertical_charges would */
+inline void oei_cache_add(const oei_cache_entry& e, int k, QUICKDouble* store){
+    const oei_cache_pair& s=e.pairs[k];
+    int i0, ni, j0, nj;
+    oei_cache_block(s.I, s.J, &i0, &ni, &j0, &nj);
+    for(int i=0; i<ni; i++) for(int j=0; j<nj; j++) LOCSTORE(store, i0+i, j0+j, STOREDIM, STOREDIM) += e.values[s.offset+i*nj+j];
+}
+''' % (2.0*math.pi))
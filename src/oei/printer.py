@@ -0,0 +1,1075 @@
+#!---------------------------------------------------------------------!
+#! Written by Madu Manathunga on 07/01/2021                            !
+#!                                                                     !
+#! Copyright (C) 2020-2021 Merz lab                                    !
+#! Copyright (C) 2020-2021 Götz lab                                    !
+#!                                                                     !
+#! This source file is a part of QUICK-GenInt code generator and       !
+#! is subjected to the terms of the Mozilla Public License, v. 2.0.    !
+#! If a copy of the MPL was not distributed with this file, you can    !
+#! obtain one at http://mozilla.org/MPL/2.0/.                          !
+#!_____________________________________________________________________!
+
+#!---------------------------------------------------------------------!
+#! This source file contains printers that lower the recurrence graph  !
+#! (see vrr_graph.py) into C++/CUDA source code.                       !
+#!---------------------------------------------------------------------!
+
+import src.common.params as params
+import src.oei.boys as boys_printer
+import src.oei.cost_model as cost_model
+from src.oei.vrr_graph import node_class, field_ops
+
+# order of primitive pair quantities in generated function signatures
+input_order=("PAx", "PAy", "PAz", "PBx", "PBy", "PBz", "PCx", "PCy", "PCz", "TwoZetaInv")
+
+# label of the [la|lb] integral, e.g. DP
+def class_lbl(la, lb):
+    return params.shell_lbl[la]+params.shell_lbl[lb]
+
+# write the terms of an "int" node as a C++ expression. ref converts node ids into strings.
+# Pairs of terms that only differ in the sign and the last factor are written as
+# "factors * coeff * (a - b)".
+def format_terms(terms, ref):
+    expr=""
+    n=0
+    while n < len(terms):
+        coeff, factors = terms[n]
+        if n+1 < len(terms) and len(factors) > 1 and terms[n+1][0] == -coeff and terms[n+1][1][:-1] == factors[:-1]:
+            txt=" * ".join([ref(f) for f in factors[:-1]])
+            if abs(coeff) != 1.0:
+                txt += " * %f" % (abs(coeff))
+            txt += " * (%s - %s)" % (ref(factors[-1]), ref(terms[n+1][1][-1]))
+            n += 2
+        else:
+            txt=" * ".join([ref(f) for f in factors])
+            if abs(coeff) != 1.0:
+                txt = "%f * %s" % (abs(coeff), txt)
+            n += 1
+
+        if expr == "":
+            expr = txt if coeff > 0 else "-" + txt
+        else:
+            expr += (" + " if coeff > 0 else " - ") + txt
+    return expr
+
+# number of floating point operations in the expression written by format_terms
+def count_flops(terms):
+    if len(terms) == 0:
+        return 0
+
+    flops=len(terms)-1
+    n=0
+    while n < len(terms):
+        coeff, factors = terms[n]
+        flops += len(factors)-1
+        if abs(coeff) != 1.0:
+            flops += 1
+        if n+1 < len(terms) and len(factors) > 1 and terms[n+1][0] == -coeff and terms[n+1][1][:-1] == factors[:-1]:
+            n += 2
+        else:
+            n += 1
+    return flops
+
+# right hand side of the assignment of an "int" node
+def expression(dag, nid, ref):
+    node=dag.nodes[nid]
+    if node.op == "L":
+        return "LOCSTORE(store, %d, %d, STOREDIM, STOREDIM)" % (node.i, node.j)
+    return format_terms(node.terms, ref)
+
+# tree of the expression written by format_terms, in the form cost_model.parse returns for its
+# text. leaf converts node ids into trees, see node_leaf.
+def terms_tree(terms, leaf):
+    tree=None
+    n=0
+    while n < len(terms):
+        coeff, factors = terms[n]
+        if n+1 < len(terms) and len(factors) > 1 and terms[n+1][0] == -coeff and terms[n+1][1][:-1] == factors[:-1]:
+            chain=[leaf(f) for f in factors[:-1]]
+            if abs(coeff) != 1.0:
+                chain.append(("number", "%f" % (abs(coeff))))
+            chain.append(("-", leaf(factors[-1]), leaf(terms[n+1][1][-1])))
+            n += 2
+        else:
+            chain=[leaf(f) for f in factors]
+            if abs(coeff) != 1.0:
+                chain.insert(0, ("number", "%f" % (abs(coeff))))
+            n += 1
+
+        # a leading minus sign negates the first factor
+        if tree is None and coeff < 0:
+            chain[0]=("neg", chain[0])
+        txt=chain[0]
+        for f in chain[1:]:
+            txt=("*", txt, f)
+        tree = txt if tree is None else ("+" if coeff > 0 else "-", tree, txt)
+    return tree
+
+# tree of the right hand side written by expression, see terms_tree
+def expression_tree(dag, nid, leaf):
+    node=dag.nodes[nid]
+    if node.op == "L":
+        return ("store",)
+    return terms_tree(node.terms, leaf)
+
+# tree of a reference to a node written by ref. Boys function values are VY loads unless they
+# are hoisted into constants, as in ssa mode.
+def node_leaf(dag, nid, ref, hoisted=False):
+    if dag.nodes[nid].kind == "vy" and not hoisted:
+        return ("vy",)
+    return ("name", ref(nid))
+
+# reference to a node in flat mode, where integral components are local variables x_i_j_m and
+# their derivatives with respect to C local variables ex_i_j_m, ey_i_j_m and ez_i_j_m
+def flat_ref(dag, nid):
+    node=dag.nodes[nid]
+    if node.kind == "input":
+        return node.name
+    elif node.kind == "vy":
+        return "VY(0, 0, %d)" % (node.m)
+    elif node.op in field_ops:
+        return "%s_%d_%d_%d" % (node.op.lower(), node.i, node.j, node.m)
+    return "x_%d_%d_%d" % (node.i, node.j, node.m)
+
+# write the statements required to compute the given node ids in flat mode. done holds the ids
+# that were already written in the current scope. The statements are recorded in counter, if
+# given, see cost_model.Counter.
+def write_flat(fh, dag, ids, done=None, indent="    ", counter=None):
+    if done is None:
+        done=set()
+
+    ref=lambda nid: flat_ref(dag, nid)
+    for nid in dag.reachable(ids):
+        node=dag.nodes[nid]
+        if node.kind == "int" and nid not in done:
+            fh.write("%sQUICKDouble %s = %s; \n" % (indent, ref(nid), expression(dag, nid, ref)))
+            if counter is not None:
+                counter.assign(ref(nid), expression_tree(dag, nid, lambda f: node_leaf(dag, f, ref)))
+        done.add(nid)
+
+# write LOCSTORE assignments for the store roots of the graph, followed by debug info. The
+# assignments are recorded in counter, if given, with the trees of leaf (default node_leaf).
+def write_store(fh, dag, roots, lbl, debug, ref, indent="    ", counter=None, leaf=None):
+    if leaf is None:
+        leaf=lambda nid: node_leaf(dag, nid, ref)
+    for (name, nid) in roots:
+        fh.write("%sLOCSTORE(store, %d, %d, STOREDIM, STOREDIM) = %s;\n" % (indent, name[1], name[2], ref(nid)))
+        if counter is not None:
+            counter.assign(None, leaf(nid))
+
+    if debug == 1:
+        fh.write("\n#ifdef DEBUG_OEI \n")
+        for (name, nid) in roots:
+            fh.write("%sprintf(\"II %%d JJ %%d %s store[%d,%d] = %%f \\n\", II, JJ, LOCSTORE(store, %d, %d, STOREDIM, STOREDIM)); \n" % (indent, lbl, name[1], name[2], name[1], name[2]))
+        fh.write("#endif \n\n")
+
+# store roots of the graph that belong to the [la|lb] integral
+def class_roots(dag, la, lb):
+    return [(name, nid) for (name, nid) in dag.roots if name[0] == "store" and \
+        params.ang_mom(name[1]) == la and params.ang_mom(name[2]) == lb]
+
+# write an assembler branch in flat mode. Every component required by the store roots of the
+# graph is computed once into a local variable. Returns the operation counts of the branch, see
+# cost_model.Counter.
+def write_flat_branch(fh, dag, I, J, classes, comment, debug, note=None):
+    counter=cost_model.Counter()
+    fh.write("\n  /* %s %s, m=%d */ \n" % (class_lbl(I, J), comment, 0))
+    fh.write("  if(I == %d && J == %d){ \n" % (I, J))
+    if note is not None:
+        fh.write("    /* %s */ \n" % (note))
+
+    write_flat(fh, dag, [nid for (name, nid) in dag.roots], counter=counter)
+
+    ref=lambda nid: flat_ref(dag, nid)
+    for (la, lb) in classes:
+        write_store(fh, dag, class_roots(dag, la, lb), class_lbl(la, lb), debug, ref, counter=counter)
+
+    fh.write("  } \n")
+    return counter.entry()
+
+# reference to a node in ssa mode, where Boys function values are hoisted into constants vy_m
+def ssa_ref(dag, nid):
+    node=dag.nodes[nid]
+    if node.kind == "vy":
+        return "vy_%d" % (node.m)
+    return flat_ref(dag, nid)
+
+# name of the function that computes an assembler branch in ssa mode, e.g. oei_vertical_DD
+def ssa_name(I, J, grad):
+    return "oei_%s_%s" % ("grad_vertical" if grad else "vertical", class_lbl(I, J))
+
+# argument list passed from the assembler to an ssa function
+def ssa_args(dag):
+    return ", ".join(["II", "JJ"]+required_inputs(dag, [nid for (name, nid) in dag.roots])+["store", "YVerticalTemp"])
+
+# write an assembler branch as a single function in static single assignment form. Every
+# component is a local constant assigned exactly once and each Boys function value is loaded
+# once at the top, which leaves register allocation entirely to the compiler. Returns the
+# operation counts of the function, see cost_model.Counter.
+def write_ssa_function(fh, dag, I, J, grad, classes, comment, func_qualifier, debug, note=None):
+    counter=cost_model.Counter()
+    ids=[nid for (name, nid) in dag.roots]
+    params_str=", ".join(["int II", "int JJ"]+["QUICKDouble %s" % (name) for name in required_inputs(dag, ids)]+\
+        ["QUICKDouble* store", "QUICKDouble* YVerticalTemp"])
+
+    fh.write("\n/* %s %s, m=%d */ \n" % (class_lbl(I, J), comment, 0))
+    fh.write("%s void %s(%s){ \n" % (func_qualifier, ssa_name(I, J, grad), params_str))
+    if note is not None:
+        fh.write("    /* %s */ \n" % (note))
+
+    ref=lambda nid: ssa_ref(dag, nid)
+    leaf=lambda nid: node_leaf(dag, nid, ref, True)
+    reach=dag.reachable(ids)
+    for nid in reach:
+        if dag.nodes[nid].kind == "vy":
+            fh.write("    const QUICKDouble %s = VY(0, 0, %d); \n" % (ref(nid), dag.nodes[nid].m))
+            counter.assign(ref(nid), ("vy",))
+    for nid in reach:
+        if dag.nodes[nid].kind == "int":
+            fh.write("    const QUICKDouble %s = %s; \n" % (ref(nid), expression(dag, nid, ref)))
+            counter.assign(ref(nid), expression_tree(dag, nid, leaf))
+
+    for (la, lb) in classes:
+        write_store(fh, dag, class_roots(dag, la, lb), class_lbl(la, lb), debug, ref, counter=counter, leaf=leaf)
+
+    fh.write("} \n")
+    return counter.entry()
+
+# write the assembler branch that calls the ssa function of the [I|J] integral. Returns the
+# operation counts of the branch, see cost_model.Counter.
+def write_ssa_call(fh, I, J, grad, args, comment):
+    counter=cost_model.Counter()
+    fh.write("\n  /* %s %s, m=%d */ \n" % (class_lbl(I, J), comment, 0))
+    fh.write("  if(I == %d && J == %d){ \n" % (I, J))
+    fh.write("    %s(%s); \n" % (ssa_name(I, J, grad), args))
+    counter.call(ssa_name(I, J, grad), args.split(", "))
+    fh.write("  } \n")
+    return counter.entry()
+
+# number of integral component nodes among the given node ids
+def count_int(dag, ids):
+    return len([nid for nid in ids if dag.nodes[nid].kind == "int"])
+
+# primitive pair quantities required to compute the given node ids, in signature order
+def required_inputs(dag, ids):
+    names=set()
+    for nid in dag.reachable(ids):
+        if dag.nodes[nid].kind == "input":
+            names.add(dag.nodes[nid].name)
+    return [name for name in input_order if name in names]
+
+# "int" node ids of all components of the [la|lb] integral with auxiliary index m
+def class_members(dag, la, lb, m):
+    ids=[]
+    for i in params.shell_idx(la):
+        for j in params.shell_idx(lb):
+            ids.append(dag.ids[("int", "V", i, j, m)])
+    return ids
+
+# parameter list and argument list of a constructor that takes the primitive pair quantities names
+def input_signature(names):
+    params_str=", ".join(["QUICKDouble %s" % (name) for name in names]+["QUICKDouble* store", "QUICKDouble* YVerticalTemp"])
+    args_str=", ".join(names+["store", "YVerticalTemp"])
+    return (params_str, args_str)
+
+# index of the function whose component the recurrence keeps in the [la|lb] class, see vrr_step:
+# 0 (rows) if the second function is incremented and 1 (columns) if the first one is
+def split_axis(la, lb):
+    return 0 if lb > 0 and (la == 0 or la >= lb) else 1
+
+# components (i,j) of the [la|lb] class grouped into partial classes, one for each component of
+# the function kept by the recurrence, so that a part mostly reads the same row (or column) of
+# the classes it is built from
+def class_parts(la, lb):
+    axis=split_axis(la, lb)
+    parts=[]
+    for k in params.shell_idx(la if axis == 0 else lb):
+        parts.append([(i, j) for i in params.shell_idx(la) for j in params.shell_idx(lb) if (i, j)[axis] == k])
+    return parts
+
+# index of the partial class of the [la|lb] class that holds component (i,j)
+def part_index(la, lb, i, j):
+    axis=split_axis(la, lb)
+    return params.shell_idx(la if axis == 0 else lb).index((i, j)[axis])
+
+# "int" node ids of the components in part k of the [la|lb] integral with auxiliary index m
+def part_members(dag, la, lb, m, k):
+    return [dag.ids[("int", "V", i, j, m)] for (i, j) in class_parts(la, lb)[k]]
+
+# components of other classes read by the given "int" node ids, i.e. the values of constructed
+# objects that stay live in the constructor; those that are not read are removed once the
+# constructors are inlined
+def member_reads(dag, ids):
+    reads=set()
+    for nid in ids:
+        for (coeff, factors) in dag.nodes[nid].terms:
+            for f in factors:
+                if dag.nodes[f].kind == "int":
+                    reads.add(f)
+    return reads
+
+# object that holds component nid of another class: (la, lb, m, k) for part k of a class in split,
+# the classes split into partial classes, and (la, lb, m, None) for a whole class
+def node_object(dag, nid, split):
+    node=dag.nodes[nid]
+    la, lb = node_class(node)
+    k = part_index(la, lb, node.i, node.j) if (la, lb, node.m) in split else None
+    return (la, lb, node.m, k)
+
+# objects constructed to compute the given "int" node ids, see node_object
+def member_objects(dag, ids, split):
+    objs=set([node_object(dag, f, split) for f in member_reads(dag, ids)])
+    return sorted(objs, key=lambda c: (c[0]+c[1], c[0], c[2], -1 if c[3] is None else c[3]))
+
+# class name and object name of an object of member_objects, e.g. DPint_1 dp_1 or DPint_0_2 dp_0_2
+def object_names(obj):
+    la, lb, m, k = obj
+    lbl=class_lbl(la, lb)
+    if k is None:
+        return ("%sint_%d" % (lbl, m), "%s_%d" % (lbl.lower(), m))
+    return ("%sint_%d_%d" % (lbl, m, k+1), "%s_%d_%d" % (lbl.lower(), m, k+1))
+
+# "int" node ids of the components held by an object of member_objects
+def object_members(dag, obj):
+    la, lb, m, k = obj
+    if k is None:
+        return class_members(dag, la, lb, m)
+    return part_members(dag, la, lb, m, k)
+
+# Parameter list and argument list of the constructor of an object of member_objects. Besides the
+# quantities its own components require, it takes those passed on to the objects it constructs,
+# which may be more once partial classes are constructed. memo caches the inputs of each object.
+def object_signature(dag, obj, split, memo):
+    if obj not in memo:
+        names=set(required_inputs(dag, object_members(dag, obj)))
+        for child in member_objects(dag, object_members(dag, obj), split):
+            object_signature(dag, child, split, memo)
+            names.update(memo[child])
+        memo[obj]=[name for name in input_order if name in names]
+    return input_signature(memo[obj])
+
+# Split the members of the [la|lb] class in ids into the blocks in which a constructor computes
+# them. If the class reads partial classes, a block is written for each part of the class, so
+# that parts needed by one block only are constructed in that block and released afterwards.
+# Returns (objects, blocks, live): the objects constructed up front, a list of (objects, ids) for
+# the blocks and the estimated number of live values, i.e. the members, the values read from the
+# objects constructed up front and those read from the objects of the largest block.
+def constructor_blocks(dag, la, lb, ids, split):
+    groups={}
+    for nid in ids:
+        k=part_index(la, lb, dag.nodes[nid].i, dag.nodes[nid].j)
+        groups.setdefault(k, []).append(nid)
+    groups=[groups[k] for k in sorted(groups)]
+    objs=[member_objects(dag, group, split) for group in groups]
+
+    if len(groups) == 1 or all([obj[3] is None for group_objs in objs for obj in group_objs]):
+        objs=member_objects(dag, ids, split)
+        blocks=[([], ids)]
+    else:
+        # objects needed by more than one block, and whole classes, are constructed up front
+        count={}
+        for group_objs in objs:
+            for obj in group_objs:
+                count[obj]=count.get(obj, 0)+1
+        shared=[obj for obj in member_objects(dag, ids, split) if obj[3] is None or count[obj] > 1]
+        blocks=[([obj for obj in group_objs if obj not in shared], group) for (group_objs, group) in zip(objs, groups)]
+        objs=shared
+
+    # values read from the objects of a block, which are only live within the block
+    def block_reads(block_objs, block_ids):
+        return len([f for f in member_reads(dag, block_ids) if node_object(dag, f, split) in block_objs])
+
+    live=len(ids)+block_reads(objs, ids)+max([block_reads(block_objs, block_ids) for (block_objs, block_ids) in blocks])
+    return (objs, blocks, live)
+
+# Return the classes split into partial classes for the register budget, a dictionary that maps
+# (la, lb, m) to the estimated number of live values of the whole class constructor. The classes
+# are those of the graph, visited from the lowest; a class is split if the estimate exceeds the
+# budget and it has more than one part. budget=0 splits nothing, compact classes (see
+# write_compact_class) are never split.
+def split_classes(dag, budget, compact=()):
+    split={}
+    if budget <= 0:
+        return split
+
+    classes=set()
+    for key in dag.ids:
+        if key[0] == "int" and key[1] == "V":
+            classes.add((params.ang_mom(key[2]), params.ang_mom(key[3]), key[4]))
+
+    for (la, lb, m) in sorted(classes, key=lambda c: (c[0]+c[1], c[0], c[2])):
+        live=constructor_blocks(dag, la, lb, class_members(dag, la, lb, m), split)[2]
+        if live > budget and len(class_parts(la, lb)) > 1 and (la, lb) not in compact:
+            split[(la, lb, m)]=live
+    return split
+
+# (la, lb) of the classes with the labels lbls, e.g. (3, 2) for FD
+def compact_classes(lbls):
+    return set([(params.shell_lbl.index(lbl[0]), params.shell_lbl.index(lbl[1])) for lbl in lbls])
+
+# index of component (i,j) among the members of the [la|lb] class, see class_members
+def member_index(la, lb, i, j):
+    return (i-params.shell_idx(la)[0])*len(params.shell_idx(lb))+j-params.shell_idx(lb)[0]
+
+# member of an object that holds component nid of its class, e.g. ps.x_1_0, or ff.x[12] if the
+# class is in compact, see write_compact_class
+def object_member(dag, name, nid, compact=()):
+    node=dag.nodes[nid]
+    la, lb = node_class(node)
+    if (la, lb) in compact:
+        return "%s.x[%d]" % (name, member_index(la, lb, node.i, node.j))
+    return "%s.x_%d_%d" % (name, node.i, node.j)
+
+# reference to a node from the constructor of a class, where components of other classes are
+# members of objects named after the class, e.g. ps_1.x_1_0, or after the part of a class split
+# into partial classes (see split_classes), e.g. dp_0_2.x_5_1
+def class_ref(dag, nid, split={}, compact=()):
+    if dag.nodes[nid].kind == "int":
+        return object_member(dag, object_names(node_object(dag, nid, split))[1], nid, compact)
+    return flat_ref(dag, nid)
+
+# write the constructions of objects (see member_objects) into a constructor and record them in
+# counter, see cost_model.Counter
+def write_constructions(fhd, dag, objs, split, memo, indent, counter, compact=()):
+    for obj in objs:
+        la, lb, m, k = obj
+        lbl=class_lbl(la, lb)
+        cname, oname = object_names(obj)
+        part = "" if k is None else ", part %d" % (k+1)
+        args_str=object_signature(dag, obj, split, memo)[1]
+        fhd.write("%s%s %s(%s); // construct [%s|%s] for m=%d%s \n" % (indent, cname, oname, args_str,\
+            lbl[0].lower(), lbl[1].lower(), m, part))
+        counter.construct(cname, [object_member(dag, oname, nid, compact) for nid in object_members(dag, obj)], args_str.split(", "))
+
+# write the declaration and the constructor definition of the class of an object of member_objects,
+# i.e. of a whole class or of one of its parts. split holds the classes split into partial
+# classes, whose parts are constructed instead of the whole class, see constructor_blocks.
+# Returns the operation counts of the constructor, see cost_model.Counter.
+def write_class(fhc, fhd, dag, obj, split, memo, func_qualifier, compact=()):
+    counter=cost_model.Counter()
+    la, lb, m, k = obj
+    name=object_names(obj)[0]
+    ids=object_members(dag, obj)
+    params_str=object_signature(dag, obj, split, memo)[0]
+
+    fhc.write("class %s{ \n" % (name))
+    fhc.write("public: \n")
+    for nid in ids:
+        node=dag.nodes[nid]
+        fhc.write("  QUICKDouble x_%d_%d; // %s, %s \n" % (node.i, node.j, params.lbl[node.i], params.lbl[node.j]))
+    fhc.write("  %s %s(%s); \n" % (func_qualifier, name, params_str))
+    fhc.write("}; \n")
+
+    objs, blocks, live = constructor_blocks(dag, la, lb, ids, split)
+    fhd.write("%s %s::%s(%s){ \n\n" % (func_qualifier, name, name, params_str))
+    write_constructions(fhd, dag, objs, split, memo, "  ", counter, compact)
+    fhd.write("\n")
+
+    ref=lambda f: class_ref(dag, f, split, compact)
+    leaf=lambda f: node_leaf(dag, f, ref)
+    indent = "  " if len(blocks) == 1 else "    "
+    for (block_objs, block_ids) in blocks:
+        if len(blocks) > 1:
+            fhd.write("  { \n")
+        write_constructions(fhd, dag, block_objs, split, memo, indent, counter, compact)
+        for nid in block_ids:
+            node=dag.nodes[nid]
+            fhd.write("%sx_%d_%d = %s; \n" % (indent, node.i, node.j, format_terms(node.terms, ref)))
+            counter.assign("x_%d_%d" % (node.i, node.j), terms_tree(node.terms, leaf))
+        if len(blocks) > 1:
+            fhd.write("  } \n")
+    fhd.write("\n } \n")
+    return counter.entry(["x_%d_%d" % (dag.nodes[nid].i, dag.nodes[nid].j) for nid in ids])
+
+# Classes that the recurrence step of the components of the [la|lb] class reads, in compact
+# mode: the class of the source component multiplied by PA/PB and PC, the class of the
+# component lowered twice on the incremented center and the class of the component lowered on
+# both centers, or None if a class does not exist. Also returns the incremented center.
+def compact_sources(dag, la, lb):
+    center=dag.step(params.shell_idx(la)[0], params.shell_idx(lb)[0])[0]
+    if center == "B":
+        classes=[(la, lb-1), (la, lb-2), (la-1, lb-1)]
+    else:
+        classes=[(la-1, lb), (la-2, lb), (la-1, lb-1)]
+    return (center, [cls if min(cls) >= 0 else None for cls in classes])
+
+# Recurrence table of the [la|lb] class in compact mode, six entries for each component in member
+# order: the cartesian direction k, the index of the source component in the first class of
+# compact_sources and the coefficient and index of the component in the second and third class.
+# Missing terms have coefficient 0 and index 0.
+def compact_table(dag, la, lb):
+    sources=compact_sources(dag, la, lb)[1]
+    rows=[]
+    for i in params.shell_idx(la):
+        for j in params.shell_idx(lb):
+            center, k, src, terms = dag.step(i, j)
+            row=[k, member_index(sources[0][0], sources[0][1], src[0], src[1]), 0, 0, 0, 0]
+            for (coeff, comp) in terms:
+                cls=(params.ang_mom(comp[0]), params.ang_mom(comp[1]))
+                slot = 2 if cls == sources[1] else 4
+                row[slot]=int(coeff)
+                row[slot+1]=member_index(cls[0], cls[1], comp[0], comp[1])
+            rows.append(((i, j), row))
+    return rows
+
+# name of the recurrence table of the [la|lb] class, e.g. FF_vrr
+def table_name(la, lb):
+    return "%s_vrr" % (class_lbl(la, lb))
+
+# write the recurrence table of the [la|lb] class, see compact_table. Device code reads it from
+# constant memory.
+def write_compact_table(fhc, dag, la, lb, func_qualifier):
+    sources=compact_sources(dag, la, lb)[1]
+    lbls=["[%s|%s]" % (class_lbl(*cls)[0].lower(), class_lbl(*cls)[1].lower()) if cls is not None else "none" for cls in sources]
+    rows=compact_table(dag, la, lb)
+    qualifier = "__constant__" if "__device__" in func_qualifier else "static const"
+    fhc.write("\n/* recurrence table of the compact %s integral: for each component, the direction k, the component of %s \n" % (class_lbl(la, lb), lbls[0]))
+    fhc.write("   multiplied by PA/PB and PC, and the coefficient and component of %s and of %s */ \n" % (lbls[1], lbls[2]))
+    fhc.write("%s unsigned char %s[%d]={ \n" % (qualifier, table_name(la, lb), 6*len(rows)))
+    for ((i, j), row) in rows:
+        fhc.write("  %s, // %s, %s \n" % (", ".join(["%d" % (v) for v in row]), params.lbl[i], params.lbl[j]))
+    fhc.write("}; \n")
+
+# Write the [la|lb] class with auxiliary index m in compact mode. The members are an array x in
+# the order of class_members and the constructor walks the recurrence table of the class (see
+# write_compact_table) in a loop instead of unrolling every component. The classes it reads are
+# constructed as usual; compact classes are read through their arrays, components of other
+# classes are first copied into local arrays. Returns the operation counts of the constructor,
+# see cost_model.Counter, where the loop counts once per component.
+def write_compact_class(fhc, fhd, dag, la, lb, m, split, memo, func_qualifier, compact):
+    counter=cost_model.Counter()
+    obj=(la, lb, m, None)
+    name=object_names(obj)[0]
+    ids=class_members(dag, la, lb, m)
+    params_str=object_signature(dag, obj, split, memo)[0]
+
+    fhc.write("class %s{ \n" % (name))
+    fhc.write("public: \n")
+    fhc.write("  QUICKDouble x[%d]; // components in the order of %s \n" % (len(ids), table_name(la, lb)))
+    fhc.write("  %s %s(%s); \n" % (func_qualifier, name, params_str))
+    fhc.write("}; \n")
+
+    fhd.write("%s %s::%s(%s){ \n\n" % (func_qualifier, name, name, params_str))
+    write_constructions(fhd, dag, member_objects(dag, ids, split), split, memo, "  ", counter, compact)
+    fhd.write("\n")
+
+    # arrays of the classes read at m and m+1
+    center, sources = compact_sources(dag, la, lb)
+    rows=[row for (comp, row) in compact_table(dag, la, lb)]
+    reads=member_reads(dag, ids)
+    used=[True, any([row[2] != 0 for row in rows]), any([row[4] != 0 for row in rows])]
+    for (n, cls) in enumerate(sources):
+        if cls is None or not used[n]:
+            continue
+        for (suffix, cm) in ((0, m), (1, m+1)):
+            array="%s%d" % ("suv"[n], suffix)
+            if cls == (0, 0):
+                fhd.write("  const QUICKDouble %s[1]={VY(0, 0, %d)}; \n" % (array, cm))
+                counter.assign(array, ("call", "init", [("vy",)]))
+            elif cls in compact:
+                oname=object_names((cls[0], cls[1], cm, None))[1]
+                fhd.write("  const QUICKDouble* %s=%s.x; \n" % (array, oname))
+                counter.assign(array, ("call", "init", [("name", object_member(dag, oname, nid, compact))\
+                    for nid in class_members(dag, cls[0], cls[1], cm)]))
+            else:
+                # components that are never read are not constructed for split classes
+                values=[]
+                leaves=[]
+                for i in params.shell_idx(cls[0]):
+                    for j in params.shell_idx(cls[1]):
+                        nid=dag.ids.get(("int", "V", i, j, cm))
+                        values.append(class_ref(dag, nid, split, compact) if nid in reads else "0.0")
+                        leaves.append(("name", values[-1]) if nid in reads else ("number", "0.0"))
+                fhd.write("  const QUICKDouble %s[%d]={%s}; \n" % (array, len(values), ", ".join(values)))
+                counter.assign(array, ("call", "init", leaves))
+
+    P = "PB" if center == "B" else "PA"
+    fhd.write("  const QUICKDouble %s[3]={%sx, %sy, %sz}; \n" % (P, P, P, P))
+    fhd.write("  const QUICKDouble PC[3]={PCx, PCy, PCz}; \n\n")
+    counter.assign(P, ("call", "init", [("name", P+x) for x in "xyz"]))
+    counter.assign("PC", ("call", "init", [("name", "PC"+x) for x in "xyz"]))
+
+    # the loop body and its expression tree, see cost_model.parse
+    read=lambda array, k: ("index", ("name", array), ("index", ("name", "t"), ("number", "%d" % (k))))
+    expr="%s[t[0]] * s0[t[1]] - PC[t[0]] * s1[t[1]]" % (P)
+    tree=("-", ("*", read(P, 0), read("s0", 1)), ("*", read("PC", 0), read("s1", 1)))
+    terms=[]
+    trees=[]
+    if sources[1] is not None and used[1]:
+        terms.append("t[2] * (u0[t[3]] - u1[t[3]])")
+        trees.append(("*", read("t", 2)[2], ("-", read("u0", 3), read("u1", 3))))
+    if sources[2] is not None and used[2]:
+        terms.append("t[4] * (v0[t[5]] - v1[t[5]])")
+        trees.append(("*", read("t", 4)[2], ("-", read("v0", 5), read("v1", 5))))
+    if len(terms) > 0:
+        expr += " + TwoZetaInv * (%s)" % (" + ".join(terms))
+        tree=("+", tree, ("*", ("name", "TwoZetaInv"), trees[0] if len(trees) == 1 else ("+", trees[0], trees[1])))
+    fhd.write("  for(int k=0; k<%d; k++){ \n" % (len(ids)))
+    fhd.write("    const unsigned char* t=&%s[6*k]; \n" % (table_name(la, lb)))
+    fhd.write("    x[k] = %s; \n" % (expr))
+    fhd.write("  } \n")
+    fhd.write("\n } \n")
+    for k in range(0, len(ids)):
+        counter.assign("x[%d]" % (k), tree)
+    return counter.entry(["x[%d]" % (k) for k in range(0, len(ids))])
+
+# lower the graph into the class layout: a C++ class for each [la|lb] integral and auxiliary
+# index m, with one member per component. classes is a list of (la, lb, max_m); the graph must
+# hold all components of these classes. If budget is set, the live values of each constructor
+# are estimated and classes above the budget are also written as partial classes, e.g.
+# DDint_0_1, ..., DDint_0_6, which are constructed instead of the whole class, see split_classes.
+# Classes (la, lb) in compact are written in compact mode, see write_compact_class. Returns the
+# operation counts of the constructors by class name, see cost_model.Counter.
+def write_classes(fhc, fhd, dag, classes, func_qualifier, budget=0, compact=()):
+    split=split_classes(dag, budget, compact)
+    memo={}
+    counts={}
+    for (la, lb, max_m) in classes:
+        lbl=class_lbl(la, lb)
+        if (la, lb) in compact:
+            write_compact_table(fhc, dag, la, lb, func_qualifier)
+        for m in range(0, max_m+1):
+            kind = "true" if m == 0 else "auxilary"
+            note=""
+            if budget > 0:
+                note=", estimated live values %d" % (constructor_blocks(dag, la, lb, class_members(dag, la, lb, m), split)[2])
+            fhc.write("\n/* %s %s integral, m=%d%s */ \n" % (lbl, kind, m, note))
+            fhd.write("\n/* %s %s integral, m=%d%s */ \n" % (lbl, kind, m, note))
+            name=object_names((la, lb, m, None))[0]
+            if (la, lb) in compact:
+                counts[name]=write_compact_class(fhc, fhd, dag, la, lb, m, split, memo, func_qualifier, compact)
+            else:
+                counts[name]=write_class(fhc, fhd, dag, (la, lb, m, None), split, memo, func_qualifier, compact)
+
+            if (la, lb, m) not in split:
+                continue
+
+            # write partial classes
+            nparts=len(class_parts(la, lb))
+            axis = "row" if split_axis(la, lb) == 0 else "column"
+            fhc.write("\n/* %s %s integral, m=%d, split into %d %s partial classes: estimated live values %d > register budget %d */ \n" %\
+                (lbl, kind, m, nparts, axis, split[(la, lb, m)], budget))
+            for k in range(0, nparts):
+                note=", estimated live values %d" % (constructor_blocks(dag, la, lb, part_members(dag, la, lb, m, k), split)[2])
+                fhc.write("\n/* %s integral partial class - Part %d, m=%d%s */ \n" % (lbl, k+1, m, note))
+                fhd.write("\n/* %s integral partial class - Part %d, m=%d%s */ \n" % (lbl, k+1, m, note))
+                counts[object_names((la, lb, m, k))[0]]=write_class(fhc, fhd, dag, (la, lb, m, k), split, memo, func_qualifier, compact)
+    return counts
+
+# argument list of a class constructor with the quantities of centers A and B exchanged. By
+# symmetry, the [lb|la] integral built from these arguments holds component (j,i) of [la|lb].
+def swap_args(args_str):
+    swap={"PAx": "PBx", "PAy": "PBy", "PAz": "PBz", "PBx": "PAx", "PBy": "PAy", "PBz": "PAz"}
+    return ", ".join([swap.get(arg, arg) for arg in args_str.split(", ")])
+
+# write an assembler branch in the class layout. The [la|lb] integrals in classes are
+# constructed from their classes and saved into the store array. If sym is set, only classes
+# with la >= lb exist and [lb|la] is served by constructing [la|lb] with centers A and B
+# exchanged and transposing the store writes. For diagonal shell pairs (II == JJ) A and B
+# coincide, so the transposed integral is copied from the [la|lb] object of the same branch
+# when it is present instead of being constructed again. Classes split for the register budget
+# (see split_classes) are constructed and saved one partial class at a time, so their transposed
+# integrals are constructed from the whole class. Classes (la, lb) in compact are read through
+# the member arrays of write_compact_class. Returns the operation counts of the branch, see
+# cost_model.Counter, where both paths of II == JJ count.
+def write_class_branch(fh, dag, I, J, classes, comment, debug, sym=0, budget=0, compact=()):
+    counter=cost_model.Counter()
+    split=split_classes(dag, budget, compact)
+    memo={}
+
+    # construct the object oname of obj with the arguments args_str
+    def construct(obj, oname, args_str, indent):
+        cname=object_names(obj)[0]
+        fh.write("%s%s %s(%s); \n" % (indent, cname, oname, args_str))
+        counter.construct(cname, [object_member(dag, oname, nid, compact) for nid in object_members(dag, obj)], args_str.split(", "))
+
+    fh.write("\n  /* %s %s, m=%d */ \n" % (class_lbl(I, J), comment, 0))
+    fh.write("  if(I == %d && J == %d){ \n" % (I, J))
+
+    if sym == 1:
+        classes=[(la, lb) for (la, lb) in classes if la >= lb]+[(la, lb) for (la, lb) in classes if la < lb]
+
+    for (la, lb) in classes:
+        lbl=class_lbl(la, lb)
+        members=[(("store", i, j), dag.ids[("int", "V", i, j, 0)] if (i, j) != (0, 0) else dag.vy(0))\
+            for i in params.shell_idx(la) for j in params.shell_idx(lb)]
+
+        if sym == 1 and la < lb:
+            # members of the transposed integral, (j,i) refers to the [lb|la] object
+            members=[(("store", i, j), dag.ids[("int", "V", j, i, 0)])\
+                for i in params.shell_idx(la) for j in params.shell_idx(lb)]
+            tlbl=class_lbl(lb, la)
+            args_str=swap_args(object_signature(dag, (lb, la, 0, None), split, memo)[1])
+
+            if I == J and (lb, la) in classes and (lb, la, 0) not in split:
+                fh.write("    if(II == JJ){ \n")
+                ref=lambda nid: object_member(dag, tlbl.lower(), nid, compact)
+                write_store(fh, dag, members, lbl, debug, ref, counter=counter)
+                fh.write("    }else{ \n")
+                construct((lb, la, 0, None), lbl.lower(), args_str, "    ")
+                ref=lambda nid: object_member(dag, lbl.lower(), nid, compact)
+                write_store(fh, dag, members, lbl, debug, ref, counter=counter)
+                fh.write("    } \n")
+            else:
+                construct((lb, la, 0, None), lbl.lower(), args_str, "    ")
+                ref=lambda nid: object_member(dag, lbl.lower(), nid, compact)
+                write_store(fh, dag, members, lbl, debug, ref, counter=counter)
+            continue
+
+        ref=lambda nid: object_member(dag, lbl.lower(), nid, compact)
+        if (la, lb, 0) in split:
+            # construct and save one part at a time
+            for k in range(0, len(class_parts(la, lb))):
+                fh.write("    { \n")
+                construct((la, lb, 0, k), lbl.lower(), object_signature(dag, (la, lb, 0, k), split, memo)[1], "      ")
+                write_store(fh, dag, [(("store", i, j), dag.ids[("int", "V", i, j, 0)]) for (i, j) in class_parts(la, lb)[k]], lbl, debug, ref, "      ", counter)
+                fh.write("    } \n")
+            continue
+
+        if (la, lb) != (0, 0):
+            construct((la, lb, 0, None), lbl.lower(), object_signature(dag, (la, lb, 0, None), split, memo)[1], "    ")
+
+        ref=lambda nid: object_member(dag, lbl.lower(), nid, compact) if dag.nodes[nid].kind == "int" else flat_ref(dag, nid)
+        write_store(fh, dag, members, lbl, debug, ref, counter=counter)
+
+    fh.write("  } \n")
+    return counter.entry()
+
+# name of the host kernel that computes the [la|lb] integral for a batch of primitive pairs
+def batch_name(la, lb):
+    return "oei_batch_%s" % (class_lbl(la, lb))
+
+# parameter list and argument list shared by all batch kernels
+def batch_signature():
+    params_str=", ".join(["const int n"]+["const QUICKDouble* OEI_RESTRICT %s" % (name) for name in input_order]+\
+        ["const QUICKDouble* OEI_RESTRICT YVerticalTemp", "QUICKDouble* OEI_RESTRICT out"])
+    args_str=", ".join(["n"]+list(input_order)+["YVerticalTemp", "out"])
+    return (params_str, args_str)
+
+# reference to a node from the loop body of a batch kernel. Primitive pair quantities are read
+# from their arrays, Boys function values are hoisted into constants vy_m.
+def batch_ref(dag, nid):
+    node=dag.nodes[nid]
+    if node.kind == "input":
+        return "%s[p]" % (node.name)
+    return ssa_ref(dag, nid)
+
+# write a host kernel that computes the store roots of the graph, i.e. the [la|lb] integral, for
+# n primitive pairs in structure of arrays layout. The primitive pair quantities are arrays of
+# length n, the Boys function value of order m for pair p is YVerticalTemp[m*n+p] and component
+# (i,j) of pair p, with i and j counted from the first function of each shell, is written into
+# out[(i*nb+j)*n+p]. The loop over pairs carries no dependencies, so it is vectorized.
+def write_batch_kernel(fh, dag, la, lb, note=None):
+    ids=[nid for (name, nid) in dag.roots]
+    nb=len(params.shell_idx(lb))
+
+    fh.write("\n/* %s integral, m=%d, for n primitive pairs */ \n" % (class_lbl(la, lb), 0))
+    fh.write("inline void %s(%s){ \n" % (batch_name(la, lb), batch_signature()[0]))
+    if note is not None:
+        fh.write("    /* %s */ \n" % (note))
+    fh.write("#pragma omp simd \n")
+    fh.write("    for(int p=0; p<n; p++){ \n")
+
+    ref=lambda nid: batch_ref(dag, nid)
+    reach=dag.reachable(ids)
+    for nid in reach:
+        if dag.nodes[nid].kind == "vy":
+            fh.write("        const QUICKDouble %s = YVerticalTemp[%d*n+p]; \n" % (ref(nid), dag.nodes[nid].m))
+    for nid in reach:
+        if dag.nodes[nid].kind == "int":
+            fh.write("        const QUICKDouble %s = %s; \n" % (ref(nid), expression(dag, nid, ref)))
+
+    for (name, nid) in dag.roots:
+        i=params.shell_idx(la).index(name[1])
+        j=params.shell_idx(lb).index(name[2])
+        fh.write("        out[%d*n+p] = %s; \n" % (i*nb+j, ref(nid)))
+
+    fh.write("    } \n")
+    fh.write("} \n")
+
+# write the function that calls the batch kernel of the [la|lb] integral for each (la, lb) in classes
+def write_batch_dispatch(fh, classes):
+    params_str, args_str = batch_signature()
+    fh.write("\ninline void oei_batch(int I, int J, %s){ \n" % (params_str))
+    for (la, lb) in classes:
+        fh.write("  if(I == %d && J == %d){ \n" % (la, lb))
+        fh.write("    %s(%s); \n" % (batch_name(la, lb), args_str))
+        fh.write("  } \n")
+    fh.write("} \n")
+
+# name of the function that computes an assembler branch summed over point charges, e.g.
+# oei_vertical_charges_DD, or oei_vertical_charges_erf_DD for the attenuated operator erf
+def charges_name(I, J, grad, op="coulomb"):
+    return "oei_%s%s_%s" % ("grad_vertical_charges" if grad else "vertical_charges", "" if op == "coulomb" else "_"+op, class_lbl(I, J))
+
+# name of the assembler that dispatches to the point charge functions
+def charges_dispatch_name(grad, op="coulomb"):
+    return "%s%s" % ("oei_grad_vertical_charges" if grad else "OEint_vertical_charges", "" if op == "coulomb" else "_"+op)
+
+# parameter list and argument list shared by the point charge branch functions. Px, Py, Pz is the
+# weighted center P, prefactor the Boys function prefactor 2*pi/Zeta*exp(-a*b/Zeta*|AB|^2) of the
+# pair and Cx, Cy, Cz, q the positions and magnitudes of ncharges point charges. The attenuated
+# operators take omega and erfc also the cutoff distance rcut from P beyond which charges are skipped.
+def charges_signature(op="coulomb"):
+    names=["PAx", "PAy", "PAz", "PBx", "PBy", "PBz", "Px", "Py", "Pz", "TwoZetaInv", "prefactor"]
+    if op != "coulomb":
+        names.append("omega")
+    if op == "erfc":
+        names.append("rcut")
+    params_str=", ".join(["QUICKDouble %s" % (name) for name in names]+["int ncharges"]+\
+        ["const QUICKDouble* %s" % (name) for name in ("Cx", "Cy", "Cz", "q")]+["QUICKDouble* store"])
+    args_str=", ".join(names+["ncharges", "Cx", "Cy", "Cz", "q", "store"])
+    return (params_str, args_str)
+
+# Write a function that adds the store roots of the graph, summed over point charges and weighted
+# by their magnitudes, to the store array. Everything that does not depend on the charge is set up
+# once: the pair quantities are arguments, the attenuation factors of op are computed before the
+# loop and the sums are kept in local accumulators that are added to store after the loop. For
+# each charge, PC and T are formed and the Boys function values are evaluated into constants vy_m
+# with the charge magnitude folded into the prefactor, since every component is linear in them.
+# ncol and switch describe the Boys function table, see boys.py.
+def write_charges_function(fh, dag, I, J, grad, classes, comment, func_qualifier, ncol, switch, note=None, op="coulomb"):
+    ids=[nid for (name, nid) in dag.roots]
+    reach=dag.reachable(ids)
+    M=max([dag.nodes[nid].m for nid in reach if dag.nodes[nid].kind == "vy"])
+    roots=[(name, nid) for (la, lb) in classes for (name, nid) in class_roots(dag, la, lb)]
+
+    fh.write("\n/* %s %s, m=%d, summed over point charges%s */ \n" % (class_lbl(I, J), comment, 0, "" if op == "coulomb" else ", %s(omega r)/r" % (op)))
+    fh.write("%s void %s(%s){ \n" % (func_qualifier, charges_name(I, J, grad, op), charges_signature(op)[0]))
+    if note is not None:
+        fh.write("    /* %s */ \n" % (note))
+
+    fh.write("    const QUICKDouble Zeta = 0.5 / TwoZetaInv; \n")
+    if op != "coulomb":
+        boys_printer.write_kappa(fh, M, "Zeta", "omega", "prefactor", "    ")
+    if op == "erfc":
+        fh.write("    const QUICKDouble rcut2 = rcut * rcut; \n")
+    for (name, nid) in roots:
+        fh.write("    QUICKDouble acc_%d_%d = 0.0; \n" % (name[1], name[2]))
+
+    fh.write("    for(int c=0; c<ncharges; c++){ \n")
+    fh.write("        const QUICKDouble PCx = Px - Cx[c]; \n")
+    fh.write("        const QUICKDouble PCy = Py - Cy[c]; \n")
+    fh.write("        const QUICKDouble PCz = Pz - Cz[c]; \n")
+    fh.write("        const QUICKDouble PC2 = PCx * PCx + PCy * PCy + PCz * PCz; \n")
+    if op == "erfc":
+        fh.write("        if(PC2 > rcut2) continue; \n")
+    fh.write("        const QUICKDouble T = Zeta * PC2; \n")
+    if op != "erf":
+        fh.write("        const QUICKDouble qprefactor = q[c] * prefactor; \n")
+    fh.write("        QUICKDouble %s; \n" % (", ".join(["vy_%d" % (m) for m in range(0, M+1)])))
+    boys_printer.write_operator_body(fh, op, M, ncol, switch, lambda m: "vy_%d" % (m), "T", "q[c]", "        ")
+
+    ref=lambda nid: ssa_ref(dag, nid)
+    for nid in reach:
+        if dag.nodes[nid].kind == "int":
+            fh.write("        const QUICKDouble %s = %s; \n" % (ref(nid), expression(dag, nid, ref)))
+    for (name, nid) in roots:
+        fh.write("        acc_%d_%d += %s; \n" % (name[1], name[2], ref(nid)))
+    fh.write("    } \n")
+
+    for (name, nid) in roots:
+        fh.write("    LOCSTORE(store, %d, %d, STOREDIM, STOREDIM) += acc_%d_%d;\n" % (name[1], name[2], name[1], name[2]))
+    fh.write("} \n")
+
+# write the function that calls the point charge function of each branch in branches, a list of (I, J)
+def write_charges_dispatch(fh, branches, grad, func_qualifier, op="coulomb"):
+    params_str, args_str = charges_signature(op)
+    fh.write("\n%s void %s(int I, int J, int II, int JJ, %s){ \n" % (func_qualifier, charges_dispatch_name(grad, op), params_str))
+    for (I, J) in branches:
+        fh.write("  if(I == %d && J == %d){ \n" % (I, J))
+        fh.write("    %s(%s); \n" % (charges_name(I, J, grad, op), args_str))
+        fh.write("  } \n")
+    fh.write("} \n")
+
+# name of the function that contracts the [I|J] integral with a density block at grid points
+def esp_name(I, J):
+    return "oei_esp_%s" % (class_lbl(I, J))
+
+# parameter list and argument list shared by the grid point functions. The pair quantities are
+# those of charges_signature, D is the density block of the pair and Gx, Gy, Gz the positions of
+# npoints grid points whose values are added to esp.
+def esp_signature():
+    names=["PAx", "PAy", "PAz", "PBx", "PBy", "PBz", "Px", "Py", "Pz", "TwoZetaInv", "prefactor"]
+    params_str=", ".join(["QUICKDouble %s" % (name) for name in names]+["const QUICKDouble* D", "int npoints"]+\
+        ["const QUICKDouble* %s" % (name) for name in ("Gx", "Gy", "Gz")]+["QUICKDouble* esp"])
+    args_str=", ".join(names+["D", "npoints", "Gx", "Gy", "Gz", "esp"])
+    return (params_str, args_str)
+
+# Write a function that adds sum_ij D[i*nb+j] [i|j] of a primitive pair to esp[g] for each grid
+# point g, where i and j run over the components of classes I and J in store order. The density
+# block is read into registers once and the integral components of a point are contracted as soon
+# as they are computed, so no store array is written. Everything else follows
+# write_charges_function with the point charges replaced by grid points of unit charge.
+def write_esp_function(fh, dag, I, J, func_qualifier, ncol, switch, note=None):
+    ids=[nid for (name, nid) in dag.roots]
+    reach=dag.reachable(ids)
+    M=max([dag.nodes[nid].m for nid in reach if dag.nodes[nid].kind == "vy"])
+    roots=class_roots(dag, I, J)
+    nb=len(params.shell_idx(J))
+
+    fh.write("\n/* %s integral, m=%d, contracted with a density block at grid points */ \n" % (class_lbl(I, J), 0))
+    fh.write("%s void %s(%s){ \n" % (func_qualifier, esp_name(I, J), esp_signature()[0]))
+    if note is not None:
+        fh.write("    /* %s */ \n" % (note))
+
+    fh.write("    const QUICKDouble Zeta = 0.5 / TwoZetaInv; \n")
+    for (ii, i) in enumerate(params.shell_idx(I)):
+        for (jj, j) in enumerate(params.shell_idx(J)):
+            fh.write("    const QUICKDouble d_%d_%d = D[%d]; \n" % (i, j, ii*nb+jj))
+
+    fh.write("    for(int g=0; g<npoints; g++){ \n")
+    fh.write("        const QUICKDouble PCx = Px - Gx[g]; \n")
+    fh.write("        const QUICKDouble PCy = Py - Gy[g]; \n")
+    fh.write("        const QUICKDouble PCz = Pz - Gz[g]; \n")
+    fh.write("        const QUICKDouble T = Zeta * (PCx * PCx + PCy * PCy + PCz * PCz); \n")
+    fh.write("        QUICKDouble %s; \n" % (", ".join(["vy_%d" % (m) for m in range(0, M+1)])))
+    boys_printer.write_boys_body(fh, M, ncol, switch, lambda m: "vy_%d" % (m), "T", "prefactor", "        ")
+
+    ref=lambda nid: ssa_ref(dag, nid)
+    for nid in reach:
+        if dag.nodes[nid].kind == "int":
+            fh.write("        const QUICKDouble %s = %s; \n" % (ref(nid), expression(dag, nid, ref)))
+    fh.write("        QUICKDouble v = 0.0; \n")
+    for (name, nid) in roots:
+        fh.write("        v += d_%d_%d * %s; \n" % (name[1], name[2], ref(nid)))
+    fh.write("        esp[g] += v; \n")
+    fh.write("    } \n")
+    fh.write("} \n")
+
+# write the function oei_esp that calls the grid point function of each branch in branches, a
+# list of (I, J)
+def write_esp_dispatch(fh, branches, func_qualifier):
+    params_str, args_str = esp_signature()
+    fh.write("\n%s void oei_esp(int I, int J, %s){ \n" % (func_qualifier, params_str))
+    for (I, J) in branches:
+        fh.write("  if(I == %d && J == %d){ \n" % (I, J))
+        fh.write("    %s(%s); \n" % (esp_name(I, J), args_str))
+        fh.write("  } \n")
+    fh.write("} \n")
+
+# name of the function that computes the [I|J] integral and its derivatives with respect to C
+def field_name(I, J):
+    return "oei_field_vertical_%s" % (class_lbl(I, J))
+
+# name of the function that computes the [I|J] integral summed over point charges and dipoles
+def dipoles_name(I, J):
+    return "oei_vertical_dipoles_%s" % (class_lbl(I, J))
+
+# roots of the graph that hold the derivatives of the [la|lb] integral along direction c, named
+# ("field", c, i, j)
+def field_roots(dag, la, lb, c):
+    return [(name, nid) for (name, nid) in dag.roots if name[0] == "field" and name[1] == c and \
+        params.ang_mom(name[2]) == la and params.ang_mom(name[3]) == lb]
+
+# Write a function that saves the [I|J] integral and its derivatives with respect to Cx, Cy and
+# Cz into slices 0, 1, 2 and 3 of the store array. It takes the arguments of OEint_vertical,
+# YVerticalTemp must hold the Boys function values up to order I+J+1. All components are
+# computed in one pass as in ssa mode, where the derivatives share the components of the
+# integral and the Boys function values.
+def write_field_function(fh, dag, I, J, func_qualifier, note=None):
+    ids=[nid for (name, nid) in dag.roots]
+    params_str=", ".join(["int II", "int JJ"]+["QUICKDouble %s" % (name) for name in input_order]+\
+        ["QUICKDouble* store", "QUICKDouble* YVerticalTemp"])
+
+    fh.write("\n/* %s integral and derivatives with respect to C, m=%d */ \n" % (class_lbl(I, J), 0))
+    fh.write("%s void %s(%s){ \n" % (func_qualifier, field_name(I, J), params_str))
+    if note is not None:
+        fh.write("    /* %s */ \n" % (note))
+
+    fh.write("    const QUICKDouble TwoZeta = 1.0 / TwoZetaInv; \n")
+    ref=lambda nid: ssa_ref(dag, nid)
+    reach=dag.reachable(ids)
+    for nid in reach:
+        if dag.nodes[nid].kind == "vy":
+            fh.write("    const QUICKDouble %s = VY(0, 0, %d); \n" % (ref(nid), dag.nodes[nid].m))
+    for nid in reach:
+        if dag.nodes[nid].kind == "int":
+            fh.write("    const QUICKDouble %s = %s; \n" % (ref(nid), expression(dag, nid, ref)))
+
+    for (name, nid) in class_roots(dag, I, J):
+        fh.write("    LOCSTOREFULL(store, %d, %d, STOREDIM, STOREDIM, 0) = %s;\n" % (name[1], name[2], ref(nid)))
+    for c in range(0, 3):
+        for (name, nid) in field_roots(dag, I, J, c):
+            fh.write("    LOCSTOREFULL(store, %d, %d, STOREDIM, STOREDIM, %d) = %s;\n" % (name[2], name[3], c+1, ref(nid)))
+    fh.write("} \n")
+
+# write the function oei_field_vertical that calls the field function of each branch in
+# branches, a list of (I, J)
+def write_field_dispatch(fh, branches, func_qualifier):
+    names=["II", "JJ"]+list(input_order)+["store", "YVerticalTemp"]
+    fh.write("\n%s void oei_field_vertical(int I, int J, int II, int JJ, %s, QUICKDouble* store, QUICKDouble* YVerticalTemp){ \n" % \
+        (func_qualifier, ", ".join(["QUICKDouble %s" % (name) for name in input_order])))
+    for (I, J) in branches:
+        fh.write("  if(I == %d && J == %d){ \n" % (I, J))
+        fh.write("    %s(%s); \n" % (field_name(I, J), ", ".join(names)))
+        fh.write("  } \n")
+    fh.write("} \n")
+
+# parameter list and argument list shared by the point dipole functions, those of
+# charges_signature with the dipole moments Mx, My, Mz of the sites added
+def dipoles_signature():
+    names=["PAx", "PAy", "PAz", "PBx", "PBy", "PBz", "Px", "Py", "Pz", "TwoZetaInv", "prefactor"]
+    arrays=["Cx", "Cy", "Cz", "q", "Mx", "My", "Mz"]
+    params_str=", ".join(["QUICKDouble %s" % (name) for name in names]+["int nsites"]+\
+        ["const QUICKDouble* %s" % (name) for name in arrays]+["QUICKDouble* store"])
+    args_str=", ".join(names+["nsites"]+arrays+["store"])
+    return (params_str, args_str)
+
+# Write a function that adds the [I|J] integral of the potential of point charges q and point
+# dipoles M at sites C, sum_c q_c [a|b] + M_c . grad_C [a|b], to the store array. The dipole term
+# is a single directional derivative, whose recurrence (Dag.field with c = 3) shares the
+# components of the integral, so a site costs little more than a point charge. The loop follows
+# write_charges_function.
+def write_dipoles_function(fh, dag, I, J, func_qualifier, ncol, switch, note=None):
+    ids=[nid for (name, nid) in dag.roots]
+    reach=dag.reachable(ids)
+    M=max([dag.nodes[nid].m for nid in reach if dag.nodes[nid].kind == "vy"])
+    roots=class_roots(dag, I, J)
+    droots=dict([((name[2], name[3]), nid) for (name, nid) in field_roots(dag, I, J, 3)])
+
+    fh.write("\n/* %s integral, m=%d, summed over point charges and dipoles */ \n" % (class_lbl(I, J), 0))
+    fh.write("%s void %s(%s){ \n" % (func_qualifier, dipoles_name(I, J), dipoles_signature()[0]))
+    if note is not None:
+        fh.write("    /* %s */ \n" % (note))
+
+    fh.write("    const QUICKDouble Zeta = 0.5 / TwoZetaInv; \n")
+    fh.write("    const QUICKDouble TwoZeta = 2.0 * Zeta; \n")
+    for (name, nid) in roots:
+        fh.write("    QUICKDouble acc_%d_%d = 0.0; \n" % (name[1], name[2]))
+
+    fh.write("    for(int c=0; c<nsites; c++){ \n")
+    fh.write("        const QUICKDouble PCx = Px - Cx[c]; \n")
+    fh.write("        const QUICKDouble PCy = Py - Cy[c]; \n")
+    fh.write("        const QUICKDouble PCz = Pz - Cz[c]; \n")
+    fh.write("        const QUICKDouble mux = Mx[c]; \n")
+    fh.write("        const QUICKDouble muy = My[c]; \n")
+    fh.write("        const QUICKDouble muz = Mz[c]; \n")
+    fh.write("        const QUICKDouble muPC = mux * PCx + muy * PCy + muz * PCz; \n")
+    fh.write("        const QUICKDouble T = Zeta * (PCx * PCx + PCy * PCy + PCz * PCz); \n")
+    fh.write("        QUICKDouble %s; \n" % (", ".join(["vy_%d" % (m) for m in range(0, M+1)])))
+    boys_printer.write_boys_body(fh, M, ncol, switch, lambda m: "vy_%d" % (m), "T", "prefactor", "        ")
+
+    ref=lambda nid: ssa_ref(dag, nid)
+    for nid in reach:
+        if dag.nodes[nid].kind == "int":
+            fh.write("        const QUICKDouble %s = %s; \n" % (ref(nid), expression(dag, nid, ref)))
+    for (name, nid) in roots:
+        fh.write("        acc_%d_%d += q[c] * %s + %s; \n" % (name[1], name[2], ref(nid), ref(droots[(name[1], name[2])])))
+    fh.write("    } \n")
+
+    for (name, nid) in roots:
+        fh.write("    LOCSTORE(store, %d, %d, STOREDIM, STOREDIM) += acc_%d_%d;\n" % (name[1], name[2], name[1], name[2]))
+    fh.write("} \n")
+
+# write the function OEint_vertical_dipoles that calls the point dipole function of each branch
+# in branches, a list of (I, J)
+def write_dipoles_dispatch(fh, branches, func_qualifier):
+    params_str, args_str = dipoles_signature()
+    fh.write("\n%s void OEint_vertical_dipoles(int I, int J, int II, int JJ, %s){ \n" % (func_qualifier, params_str))
+    for (I, J) in branches:
+        fh.write("  if(I == %d && J == %d){ \n" % (I, J))
+        fh.write("    %s(%s); \n" % (dipoles_name(I, J), args_str))
+        fh.write("  } \n")
+    fh.write("} \n")
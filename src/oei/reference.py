@@ -0,0 +1,208 @@
+#!---------------------------------------------------------------------!
+#! Written by Madu Manathunga on 07/01/2021                            !
+#!                                                                     !
+#! Copyright (C) 2020-2021 Merz lab                                    !
+#! Copyright (C) 2020-2021 Götz lab                                    !
+#!                                                                     !
+#! This source file is a part of QUICK-GenInt code generator and       !
+#! is subjected to the terms of the Mozilla Public License, v. 2.0.    !
+#! If a copy of the MPL was not distributed with this file, you can    !
+#! obtain one at http://mozilla.org/MPL/2.0/.                          !
+#!_____________________________________________________________________!
+
+#!---------------------------------------------------------------------!
+#! This source file contains a reference implementation of nuclear     !
+#! attraction integrals over cartesian gaussians with numpy, used to   !
+#! validate generated code. It does not share code with the generator: !
+#! integrals are computed with the McMurchie-Davidson scheme (Hermite  !
+#! expansion coefficients E and Hermite integrals R, see J. Comput.    !
+#! Phys. 1978, 26, 218-231) instead of the Obara-Saika recurrence, and !
+#! the Boys function is evaluated here. Values follow the conventions  !
+#! of the store array: components are indexed by params.Mcal and the   !
+#! Boys function values hold the prefactor 2*pi/p*exp(-a*b/p*|AB|^2). !
+#!---------------------------------------------------------------------!
+
+import math
+import numpy as np
+import src.common.params as params
+
+# dimension of the store array, the number of cartesian functions up to g
+STOREDIM=len(params.Mcal)
+
+# T above which the Boys function is evaluated with the asymptotic formula. erfc(sqrt(36)) and
+# exp(-36) are below double precision relative to F_0.
+boys_switch=36.0
+
+# Boys function F_m(T) for m = 0, ..., mmax. T is an array of any shape and the result has the
+# shape (mmax+1,)+T.shape. For T < boys_switch, the series
+# F_mmax(T) = exp(-T) sum_k (2T)^k / ((2mmax+1)(2mmax+3)...(2mmax+2k+1)), whose terms are all
+# positive, is summed to convergence and lower orders follow from the downward recursion
+# F_m = (2T F_m+1 + exp(-T)) / (2m+1). Otherwise F_0 = sqrt(pi/T)/2 and higher orders follow
+# from the upward recursion F_m+1 = ((2m+1) F_m - exp(-T)) / (2T), which is stable for large T.
+def boys(mmax, T):
+    T=np.asarray(T, dtype=float)
+    F=np.empty((mmax+1,)+T.shape)
+    small=T < boys_switch
+
+    Ts=T[small]
+    e=np.exp(-Ts)
+    term=np.full(Ts.shape, 1.0/(2*mmax+1))
+    total=term.copy()
+    k=1
+    while Ts.size > 0 and np.any(term > 1e-17*total):
+        term=term*2.0*Ts/(2*mmax+2*k+1)
+        total += term
+        k += 1
+    Fs=[None]*(mmax+1)
+    Fs[mmax]=e*total
+    for m in range(mmax-1, -1, -1):
+        Fs[m]=(2.0*Ts*Fs[m+1]+e)/(2*m+1)
+
+    Tl=T[~small]
+    e=np.exp(-Tl)
+    Fl=[0.5*np.sqrt(math.pi/Tl)]
+    for m in range(0, mmax):
+        Fl.append(((2*m+1)*Fl[m]-e)/(2.0*Tl))
+
+    for m in range(0, mmax+1):
+        F[m][small]=Fs[m]
+        F[m][~small]=Fl[m]
+    return F
+
+# Boys function values of the operators 1/r ("coulomb"), erf(omega r)/r and erfc(omega r)/r for
+# pairs with exponents Zeta, an array like T or a scalar, without the prefactor. For erf, the
+# Gaussian charge distribution of the pair sees a point charge smeared with exponent omega^2,
+# which gives the values of 1/r with the exponent reduced to Zeta*kappa, kappa =
+# omega^2/(omega^2+Zeta), i.e. sqrt(kappa) kappa^m F_m(kappa T). erfc(omega r)/r = 1/r -
+# erf(omega r)/r.
+def boys_operator(mmax, T, Zeta, op="coulomb", omega=None):
+    F=boys(mmax, T)
+    if op == "coulomb":
+        return F
+    T=np.asarray(T, dtype=float)
+    kappa=np.broadcast_to(omega**2/(omega**2+np.asarray(Zeta, dtype=float)), T.shape)
+    Ferf=np.array([np.sqrt(kappa)*kappa**m for m in range(0, mmax+1)])*boys(mmax, kappa*T)
+    return Ferf if op == "erf" else F-Ferf
+
+# Primitive pair quantities of the generated code for gaussians with exponents alpha and beta on
+# centers A and B and a point charge on C. A, B and C are arrays of shape (N, 3), alpha and beta
+# arrays of shape (N,). Returns PAx, PAy, PAz, PBx, PBy, PBz, PCx, PCy, PCz, TwoZetaInv and the
+# (mmax+1, N) array of Boys function values with prefactor, i.e. YVerticalTemp of each pair.
+def pair_quantities(A, B, C, alpha, beta, mmax):
+    A=np.asarray(A, dtype=float)
+    B=np.asarray(B, dtype=float)
+    C=np.asarray(C, dtype=float)
+    p=alpha+beta
+    P=(alpha[:,None]*A+beta[:,None]*B)/p[:,None]
+    PA=P-A
+    PB=P-B
+    PC=P-C
+    T, prefactor = boys_args(A, B, C, alpha, beta)
+    Y=prefactor*boys(mmax, T)
+    return (PA[:,0], PA[:,1], PA[:,2], PB[:,0], PB[:,1], PB[:,2], PC[:,0], PC[:,1], PC[:,2], 0.5/p, Y)
+
+# argument T = p*|PC|^2 of the Boys function and the prefactor 2*pi/p*exp(-a*b/p*|AB|^2) of each
+# pair, with the arguments of pair_quantities
+def boys_args(A, B, C, alpha, beta):
+    A=np.asarray(A, dtype=float)
+    B=np.asarray(B, dtype=float)
+    C=np.asarray(C, dtype=float)
+    p=alpha+beta
+    P=(alpha[:,None]*A+beta[:,None]*B)/p[:,None]
+    T=p*np.sum((P-C)**2, axis=1)
+    prefactor=2.0*math.pi/p*np.exp(-alpha*beta/p*np.sum((A-B)**2, axis=1))
+    return (T, prefactor)
+
+# Hermite expansion coefficients E_t, t = 0, ..., i+j, of the product of cartesian components
+# x_A^i x_B^j along one direction, without the exponential factor, which is part of Y.
+def hermite(i, j, PA, PB, TwoZetaInv):
+    E=[np.ones_like(PA)]
+    for n in range(0, i+j):
+        X = PA if n < i else PB
+        new=[]
+        for t in range(0, n+2):
+            val = X*E[t] if t <= n else np.zeros_like(PA)
+            if t > 0:
+                val = val + TwoZetaInv*E[t-1]
+            if t+1 <= n:
+                val = val + (t+1)*E[t+1]
+            new.append(val)
+        E=new
+    return E
+
+# Hermite integrals R_tuv^0 for t+u+v <= L from the Boys function values Y, i.e. R_000^n =
+# (-2p)^n Y[n] and R_t+1,u,v^n = t R_t-1,u,v^n+1 + PCx R_t,u,v^n+1 (likewise for u and v).
+# Returns a dictionary keyed by (t, u, v).
+def hermite_integrals(L, PCx, PCy, PCz, TwoZetaInv, Y):
+    R={}
+    for n in range(0, L+1):
+        R[(0, 0, 0, n)]=(-1.0/TwoZetaInv)**n*Y[n]
+
+    for total in range(1, L+1):
+        for n in range(0, L-total+1):
+            for t in range(0, total+1):
+                for u in range(0, total-t+1):
+                    v=total-t-u
+                    if t > 0:
+                        val=PCx*R[(t-1, u, v, n+1)]
+                        if t > 1:
+                            val=val+(t-1)*R[(t-2, u, v, n+1)]
+                    elif u > 0:
+                        val=PCy*R[(t, u-1, v, n+1)]
+                        if u > 1:
+                            val=val+(u-1)*R[(t, u-2, v, n+1)]
+                    else:
+                        val=PCz*R[(t, u, v-1, n+1)]
+                        if v > 1:
+                            val=val+(v-1)*R[(t, u, v-2, n+1)]
+                    R[(t, u, v, n)]=val
+
+    return dict([((t, u, v), R[(t, u, v, n)]) for (t, u, v, n) in R if n == 0])
+
+# Store entry (i,j), i.e. the [i|j] integral component with m=0 of functions params.Mcal[i] and
+# params.Mcal[j], for arrays of primitive pair quantities. Y must hold the Boys function values up
+# to the total angular momentum of the component.
+def component(i, j, PAx, PAy, PAz, PBx, PBy, PBz, PCx, PCy, PCz, TwoZetaInv, Y, R=None):
+    a=params.Mcal[i]
+    b=params.Mcal[j]
+    if R is None:
+        R=hermite_integrals(sum(a)+sum(b), PCx, PCy, PCz, TwoZetaInv, Y)
+
+    Ex=hermite(a[0], b[0], PAx, PBx, TwoZetaInv)
+    Ey=hermite(a[1], b[1], PAy, PBy, TwoZetaInv)
+    Ez=hermite(a[2], b[2], PAz, PBz, TwoZetaInv)
+
+    val=np.zeros_like(PAx)
+    for t in range(0, len(Ex)):
+        for u in range(0, len(Ey)):
+            for v in range(0, len(Ez)):
+                val=val+Ex[t]*Ey[u]*Ez[v]*R[(t, u, v)]
+    return val
+
+# [la|lb] integral for arrays of N primitive pairs as an (N, na, nb) array in store order, i.e.
+# element [p, i, j] is store entry (params.shell_idx(la)[i], params.shell_idx(lb)[j]) of pair p
+def integral(la, lb, PAx, PAy, PAz, PBx, PBy, PBz, PCx, PCy, PCz, TwoZetaInv, Y):
+    R=hermite_integrals(la+lb, PCx, PCy, PCz, TwoZetaInv, Y)
+    blocks=[[component(i, j, PAx, PAy, PAz, PBx, PBy, PBz, PCx, PCy, PCz, TwoZetaInv, Y, R)\
+        for j in params.shell_idx(lb)] for i in params.shell_idx(la)]
+    return np.moveaxis(np.array(blocks), -1, 0)
+
+# derivative of the [la|lb] integral with respect to C along direction c (0, 1, 2 for x, y, z),
+# with the arguments and result of integral. R_tuv depends on C through PC only, so its
+# derivative is -R_t+1,u,v (likewise for u and v). Y must hold the Boys function values up to
+# la+lb+1.
+def field(la, lb, c, PAx, PAy, PAz, PBx, PBy, PBz, PCx, PCy, PCz, TwoZetaInv, Y):
+    R=hermite_integrals(la+lb+1, PCx, PCy, PCz, TwoZetaInv, Y)
+    d=[(1, 0, 0), (0, 1, 0), (0, 0, 1)][c]
+    Rc=dict([((t, u, v), -R[(t+d[0], u+d[1], v+d[2])]) for (t, u, v) in R if t+u+v <= la+lb])
+    blocks=[[component(i, j, PAx, PAy, PAz, PBx, PBy, PBz, PCx, PCy, PCz, TwoZetaInv, Y, Rc)\
+        for j in params.shell_idx(lb)] for i in params.shell_idx(la)]
+    return np.moveaxis(np.array(blocks), -1, 0)
+
+# store array of N primitive pairs after saving the [la|lb] integral, as an (N, STOREDIM,
+# STOREDIM) array where element [p, i, j] corresponds to LOCSTORE(store, i, j, STOREDIM, STOREDIM)
+def store(la, lb, PAx, PAy, PAz, PBx, PBy, PBz, PCx, PCy, PCz, TwoZetaInv, Y):
+    out=np.zeros((len(PAx), STOREDIM, STOREDIM))
+    block=integral(la, lb, PAx, PAy, PAz, PBx, PBy, PBz, PCx, PCy, PCz, TwoZetaInv, Y)
+    out[:, params.shell_idx(la)[0]:params.shell_idx(la)[-1]+1, params.shell_idx(lb)[0]:params.shell_idx(lb)[-1]+1]=block
+    return out
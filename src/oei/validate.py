@@ -0,0 +1,782 @@
+#!---------------------------------------------------------------------!
+#! Written by Madu Manathunga on 07/01/2021                            !
+#!                                                                     !
+#! Copyright (C) 2020-2021 Merz lab                                    !
+#! Copyright (C) 2020-2021 Götz lab                                    !
+#!                                                                     !
+#! This source file is a part of QUICK-GenInt code generator and       !
+#! is subjected to the terms of the Mozilla Public License, v. 2.0.    !
+#! If a copy of the MPL was not distributed with this file, you can    !
+#! obtain one at http://mozilla.org/MPL/2.0/.                          !
+#!_____________________________________________________________________!
+
+#!---------------------------------------------------------------------!
+#! This source file contains a harness that compiles generated headers !
+#! for the host, evaluates them for random primitive pairs and point   !
+#! charges and compares the store array against the reference          !
+#! implementation in reference.py. The host batch kernels and numpy    !
+#! functions are checked too when they were generated.                 !
+#!---------------------------------------------------------------------!
+
+import os
+import shutil
+import tempfile
+import subprocess
+import importlib.util
+import numpy as np
+import src.common.params as params
+import src.common.file_handler as file_handler
+import src.oei.reference as reference
+from src.oei.iclass.OEint import grad_classes
+
+# highest angular momentum of the assembler branches and of the batch and numpy classes
+max_branch_l=2
+max_class_l=3
+
+# number of Boys function values passed for each pair
+nboys=10
+
+# number of charges, half width of the box they are placed in and opening angle for the check of
+# the octree. Far field errors are relative to the largest value of each class summed over the
+# absolute magnitudes of the charges, since the sum itself may cancel.
+tree_charges=400
+tree_box=40.0
+tree_theta=0.3
+tree_tol=1e-4
+
+# attenuation parameter and cutoff radius of the attenuated operators and the exponent at which
+# their Boys function producers are checked
+op_omega=0.8
+op_rcut=4.0
+op_zeta=1.3
+
+# number of grid points for the check of the grid point functions, more than one block of the
+# host driver, and the size of the density block of each pair, that of the largest branch
+esp_points=300
+esp_dsize=((max_branch_l+1)*(max_branch_l+2)//2)**2
+
+# threshold of the pair cache below which moved charges keep their contribution, and the changes
+# (charge, row, delta) applied to the first set of charges for its update, where rows 0 to 2 are
+# the coordinates and row 3 the magnitude. The last one is below the threshold.
+cache_threshold=1e-8
+cache_moves=[(0, 0, 0.5), (1, 3, 0.3), (2, 1, 1e-12)]
+
+# definitions that the generated headers expect from QUICK, set for a host build
+stub='''#include <cstdio>
+#include <cmath>
+#define __device__
+#define __inline__ inline
+#define __constant__ static
+typedef double QUICKDouble;
+#define STOREDIM %d
+#define LOCSTORE(A,i1,i2,d1,d2) A[(i1)+(i2)*(d1)]
+#define LOCSTOREFULL(A,i1,i2,d1,d2,m) A[(i1)+(i2)*(d1)+(m)*(d1)*(d2)]
+#define VY(a,b,c) YVerticalTemp[c]
+#define REG_FS
+#define REG_SF
+#define REG_FP
+#define REG_PF
+#define REG_DD
+#define REG_FD
+#define REG_DF
+#define REG_FF
+''' % (reference.STOREDIM)
+
+# Return the source of the driver. It reads n pairs from stdin, each as PAx, ..., TwoZetaInv, ABx,
+# ABy, ABz, T, prefactor, nboys Boys function values and Px, Py, Pz, and prints the nonzero store
+# entries of every branch as "kind pair I J i j value", where kind is v (OEint_vertical), g
+# (oei_grad_vertical) or b (batch kernels). Shells II and JJ differ, so symmetry mode constructs
+# transposed classes. nd pairs with A == B follow in the same form; they are evaluated as
+# diagonal shell pairs (II == JJ), where symmetry mode copies transposed classes, and printed
+# with kinds vd and gd. With the Boys function producer, nt further lines of T and prefactor
+# follow and the values of oei_boys are printed as "y k M m value". With the point charge
+# assemblers, nc lines of Cx, Cy, Cz, q follow and the sums over the charges are printed with
+# kind c (OEint_vertical_charges) or h (oei_grad_vertical_charges). With the octree, a further set
+# of charges follows, which is summed with OEint_vertical_tree and oei_grad_vertical_tree for
+# theta=0 (kinds t and u, all charges near) and theta=tree_theta (kinds s and r). With the
+# attenuated operators, the producers oei_boys_erf and oei_boys_erfc are printed as "w k M m
+# value" and "x k M m value" and the point charge sums with kinds e and f (erf) and k and l (erfc).
+# With the grid point functions, ng grid points and a density block of esp_dsize values for each
+# pair follow. The values of oei_esp at point g are printed as "p pair I J g 0 value" and those
+# of oei_esp_grid for all pairs and branches as "o 0 0 0 g 0 value". With the field functions,
+# slices 0 to 3 of oei_field_vertical are printed with kinds fv, fx, fy and fz, and after ns
+# lines of Cx, Cy, Cz, q, Mx, My, Mz the sums of OEint_vertical_dipoles with kind d. With the pair
+# cache, the exponents alpha and beta of each pair follow. The cached sums over the first set of
+# charges are printed with kind m, and after cache_moves with kind n.
+def driver_source(hrr, batch, boys, charges, tree, attenuated=0, esp=0, field=0, pair_cache=0):
+    src=stub
+    for name in ("gpu_oei_classes.h", "gpu_oei_definitions.h", "gpu_oei_assembler.h", "gpu_oei_grad_assembler.h"):
+        src += '#include "%s"\n' % (name)
+    if batch:
+        src += '#include "cpu_oei_batch.h"\n'
+    if boys:
+        src += '#include "gpu_oei_boys.h"\n'
+    if charges:
+        src += '#include "gpu_oei_charges.h"\n'
+    if tree:
+        src += '#include "cpu_oei_tree.h"\n'
+    if esp:
+        src += '#include "gpu_oei_esp.h"\n'
+        src += '#include "cpu_oei_esp.h"\n'
+    if field:
+        src += '#include "gpu_oei_field.h"\n'
+    if pair_cache:
+        src += '#include "cpu_oei_pair_cache.h"\n'
+
+    src += '''
+static QUICKDouble store[STOREDIM*STOREDIM*8];
+
+static void print_store(const char* kind, int p, int I, int J, int m=0){
+  for(int i=0; i<STOREDIM; i++) for(int j=0; j<STOREDIM; j++)
+    if(LOCSTOREFULL(store, i, j, STOREDIM, STOREDIM, m) != 0) printf("%%s %%d %%d %%d %%d %%d %%.17e\\n", kind, p, I, J, i, j, LOCSTOREFULL(store, i, j, STOREDIM, STOREDIM, m));
+}
+
+int main(){
+  int n;
+  if(scanf("%%d", &n) != 1) return 1;
+  double* in=new double[n*(18+%d)];
+  for(int k=0; k<n*(18+%d); k++) if(scanf("%%lf", &in[k]) != 1) return 1;
+
+  for(int p=0; p<n; p++){
+    double* q=in+p*(18+%d);
+    QUICKDouble Y[%d];
+    for(int m=0; m<%d; m++) Y[m]=q[15+m];
+    for(int I=0; I<=%d; I++) for(int J=0; J<=%d; J++){
+      for(int k=0; k<STOREDIM*STOREDIM*8; k++) store[k]=0;
+      OEint_vertical(I, J, 0, 1, q[0], q[1], q[2], q[3], q[4], q[5], q[6], q[7], q[8], q[9], store, Y);
+''' % (nboys, nboys, nboys, nboys, nboys, max_branch_l, max_branch_l)
+    if hrr:
+        src += "      OEint_horizontal(I, J, q[10], q[11], q[12], store);\n"
+    src += '''      print_store("v", p, I, J);
+      for(int k=0; k<STOREDIM*STOREDIM*8; k++) store[k]=0;
+      oei_grad_vertical(I, J, 0, 1, q[0], q[1], q[2], q[3], q[4], q[5], q[6], q[7], q[8], q[9], store, Y);
+      print_store("g", p, I, J);
+    }
+  }
+
+  int nd;
+  if(scanf("%%d", &nd) != 1) return 1;
+  double* ind=new double[nd*(18+%d)];
+  for(int k=0; k<nd*(18+%d); k++) if(scanf("%%lf", &ind[k]) != 1) return 1;
+  for(int p=0; p<nd; p++){
+    double* q=ind+p*(18+%d);
+    QUICKDouble Y[%d];
+    for(int m=0; m<%d; m++) Y[m]=q[15+m];
+    for(int I=0; I<=%d; I++) for(int J=0; J<=%d; J++){
+      for(int k=0; k<STOREDIM*STOREDIM*8; k++) store[k]=0;
+      OEint_vertical(I, J, 0, 0, q[0], q[1], q[2], q[3], q[4], q[5], q[6], q[7], q[8], q[9], store, Y);
+''' % (nboys, nboys, nboys, nboys, nboys, max_branch_l, max_branch_l)
+    if hrr:
+        src += "      OEint_horizontal(I, J, q[10], q[11], q[12], store);\n"
+    src += '''      print_store("vd", p, I, J);
+      for(int k=0; k<STOREDIM*STOREDIM*8; k++) store[k]=0;
+      oei_grad_vertical(I, J, 0, 0, q[0], q[1], q[2], q[3], q[4], q[5], q[6], q[7], q[8], q[9], store, Y);
+      print_store("gd", p, I, J);
+    }
+  }
+'''
+    if batch:
+        src += '''
+  // the batch kernels read the pairs in structure of arrays layout
+  double* soa=new double[n*(10+%d)];
+  for(int p=0; p<n; p++){
+    for(int k=0; k<10; k++) soa[k*n+p]=in[p*(18+%d)+k];
+    for(int m=0; m<%d; m++) soa[(10+m)*n+p]=in[p*(18+%d)+15+m];
+  }
+  double* out=new double[STOREDIM*STOREDIM*n];
+  for(int I=0; I<=%d; I++) for(int J=0; J<=%d; J++){
+    int na=(I+1)*(I+2)/2, nb=(J+1)*(J+2)/2, i0=I*(I+1)*(I+2)/6, j0=J*(J+1)*(J+2)/6;
+    for(int k=0; k<na*nb*n; k++) out[k]=0;
+    oei_batch(I, J, n, soa, soa+n, soa+2*n, soa+3*n, soa+4*n, soa+5*n, soa+6*n, soa+7*n, soa+8*n, soa+9*n, soa+10*n, out);
+    for(int p=0; p<n; p++){
+      for(int k=0; k<STOREDIM*STOREDIM; k++) store[k]=0;
+      for(int i=0; i<na; i++) for(int j=0; j<nb; j++) LOCSTORE(store, i0+i, j0+j, STOREDIM, STOREDIM)=out[(i*nb+j)*n+p];
+      print_store("b", p, I, J);
+    }
+  }
+''' % (nboys, nboys, nboys, nboys, max_class_l, max_class_l)
+    if boys:
+        src += '''
+  int nt;
+  if(scanf("%%d", &nt) != 1) return 1;
+  for(int k=0; k<nt; k++){
+    double T, prefactor;
+    if(scanf("%%lf %%lf", &T, &prefactor) != 2) return 1;
+    for(int M=0; M<%d; M++){
+      QUICKDouble YVerticalTemp[%d];
+      for(int m=0; m<%d; m++) YVerticalTemp[m]=0;
+      oei_boys(M, T, prefactor, YVerticalTemp);
+      for(int m=0; m<%d; m++) if(YVerticalTemp[m] != 0) printf("y %%d %%d %%d 0 0 %%.17e\\n", k, M, m, YVerticalTemp[m]);
+''' % (nboys, nboys, nboys, nboys)
+        if attenuated:
+            for (kind, op) in (("w", "erf"), ("x", "erfc")):
+                src += '''      for(int m=0; m<%d; m++) YVerticalTemp[m]=0;
+      oei_boys_%s(M, T, prefactor, %.17e, %.17e, YVerticalTemp);
+      for(int m=0; m<%d; m++) if(YVerticalTemp[m] != 0) printf("%s %%d %%d %%d 0 0 %%.17e\\n", k, M, m, YVerticalTemp[m]);
+''' % (nboys, op, op_zeta, op_omega, nboys, kind)
+        src += "    }\n  }\n"
+    if charges:
+        src += '''
+  int nc;
+  if(scanf("%%d", &nc) != 1) return 1;
+  double* Cx=new double[nc];
+  double* Cy=new double[nc];
+  double* Cz=new double[nc];
+  double* Qc=new double[nc];
+  for(int c=0; c<nc; c++) if(scanf("%%lf %%lf %%lf %%lf", &Cx[c], &Cy[c], &Cz[c], &Qc[c]) != 4) return 1;
+  for(int p=0; p<n; p++){
+    double* q=in+p*(18+%d);
+    double* P=q+15+%d;
+    for(int I=0; I<=%d; I++) for(int J=0; J<=%d; J++){
+      for(int k=0; k<STOREDIM*STOREDIM*8; k++) store[k]=0;
+      OEint_vertical_charges(I, J, 0, 1, q[0], q[1], q[2], q[3], q[4], q[5], P[0], P[1], P[2], q[9], q[14], nc, Cx, Cy, Cz, Qc, store);
+''' % (nboys, nboys, max_branch_l, max_branch_l)
+        if hrr:
+            src += "      OEint_horizontal(I, J, q[10], q[11], q[12], store);\n"
+        src += '''      print_store("c", p, I, J);
+      for(int k=0; k<STOREDIM*STOREDIM*8; k++) store[k]=0;
+      oei_grad_vertical_charges(I, J, 0, 1, q[0], q[1], q[2], q[3], q[4], q[5], P[0], P[1], P[2], q[9], q[14], nc, Cx, Cy, Cz, Qc, store);
+      print_store("h", p, I, J);
+'''
+        if attenuated:
+            for (kinds, op, extra) in ((("e", "f"), "erf", "%.17e" % (op_omega)), (("k", "l"), "erfc", "%.17e, %.17e" % (op_omega, op_rcut))):
+                src += '''      for(int k=0; k<STOREDIM*STOREDIM*8; k++) store[k]=0;
+      OEint_vertical_charges_%s(I, J, 0, 1, q[0], q[1], q[2], q[3], q[4], q[5], P[0], P[1], P[2], q[9], q[14], %s, nc, Cx, Cy, Cz, Qc, store);
+''' % (op, extra)
+                if hrr:
+                    src += "      OEint_horizontal(I, J, q[10], q[11], q[12], store);\n"
+                src += '''      print_store("%s", p, I, J);
+      for(int k=0; k<STOREDIM*STOREDIM*8; k++) store[k]=0;
+      oei_grad_vertical_charges_%s(I, J, 0, 1, q[0], q[1], q[2], q[3], q[4], q[5], P[0], P[1], P[2], q[9], q[14], %s, nc, Cx, Cy, Cz, Qc, store);
+      print_store("%s", p, I, J);
+''' % (kinds[0], op, extra, kinds[1])
+        src += "    }\n  }\n"
+    if tree:
+        src += '''
+  int ntc;
+  if(scanf("%%d", &ntc) != 1) return 1;
+  double* chg=new double[4*ntc];
+  for(int c=0; c<ntc; c++) if(scanf("%%lf %%lf %%lf %%lf", &chg[c], &chg[ntc+c], &chg[2*ntc+c], &chg[3*ntc+c]) != 4) return 1;
+  oei_charge_tree tree;
+  oei_tree_build(tree, ntc, chg, chg+ntc, chg+2*ntc, chg+3*ntc);
+  const double theta[2]={0.0, %.17e};
+  const char* kinds[2][2]={{"t", "u"}, {"s", "r"}};
+  for(int p=0; p<n; p++){
+    double* q=in+p*(18+%d);
+    double* P=q+15+%d;
+    for(int I=0; I<=%d; I++) for(int J=0; J<=%d; J++) for(int k=0; k<2; k++){
+      for(int s=0; s<STOREDIM*STOREDIM*8; s++) store[s]=0;
+      OEint_vertical_tree(tree, theta[k], I, J, 0, 1, q[0], q[1], q[2], q[3], q[4], q[5], P[0], P[1], P[2], q[9], q[14], store);
+''' % (tree_theta, nboys, nboys, max_branch_l, max_branch_l)
+        if hrr:
+            src += "      OEint_horizontal(I, J, q[10], q[11], q[12], store);\n"
+        src += '''      print_store(kinds[k][0], p, I, J);
+      for(int s=0; s<STOREDIM*STOREDIM*8; s++) store[s]=0;
+      oei_grad_vertical_tree(tree, theta[k], I, J, 0, 1, q[0], q[1], q[2], q[3], q[4], q[5], P[0], P[1], P[2], q[9], q[14], store);
+      print_store(kinds[k][1], p, I, J);
+    }
+  }
+'''
+    if esp:
+        src += '''
+  int ng;
+  if(scanf("%%d", &ng) != 1) return 1;
+  double* G=new double[3*ng];
+  for(int g=0; g<ng; g++) if(scanf("%%lf %%lf %%lf", &G[g], &G[ng+g], &G[2*ng+g]) != 3) return 1;
+  double* Dm=new double[n*%d];
+  for(int k=0; k<n*%d; k++) if(scanf("%%lf", &Dm[k]) != 1) return 1;
+  double* grid=new double[ng];
+  oei_esp_pair* pairs=new oei_esp_pair[n*%d];
+  int npairs=0;
+  for(int p=0; p<n; p++){
+    double* q=in+p*(18+%d);
+    double* P=q+15+%d;
+    for(int I=0; I<=%d; I++) for(int J=0; J<=%d; J++){
+      for(int g=0; g<ng; g++) grid[g]=0;
+      oei_esp(I, J, q[0], q[1], q[2], q[3], q[4], q[5], P[0], P[1], P[2], q[9], q[14], Dm+p*%d, ng, G, G+ng, G+2*ng, grid);
+      for(int g=0; g<ng; g++) if(grid[g] != 0) printf("p %%d %%d %%d %%d 0 %%.17e\\n", p, I, J, g, grid[g]);
+      oei_esp_pair s={I, J, p*%d, q[0], q[1], q[2], q[3], q[4], q[5], P[0], P[1], P[2], q[9], q[14]};
+      pairs[npairs++]=s;
+    }
+  }
+  for(int g=0; g<ng; g++) grid[g]=0;
+  oei_esp_grid(npairs, pairs, Dm, ng, G, G+ng, G+2*ng, grid);
+  for(int g=0; g<ng; g++) printf("o 0 0 0 %%d 0 %%.17e\\n", g, grid[g]);
+''' % (esp_dsize, esp_dsize, (max_branch_l+1)**2, nboys, nboys, max_branch_l, max_branch_l, esp_dsize, esp_dsize)
+    if field:
+        src += '''
+  const char* fkinds[4]={"fv", "fx", "fy", "fz"};
+  for(int p=0; p<n; p++){
+    double* q=in+p*(18+%d);
+    for(int I=0; I<=%d; I++) for(int J=0; J<=%d; J++){
+      for(int k=0; k<STOREDIM*STOREDIM*8; k++) store[k]=0;
+      oei_field_vertical(I, J, 0, 1, q[0], q[1], q[2], q[3], q[4], q[5], q[6], q[7], q[8], q[9], store, q+15);
+      for(int m=0; m<4; m++) print_store(fkinds[m], p, I, J, m);
+    }
+  }
+  int ns;
+  if(scanf("%%d", &ns) != 1) return 1;
+  double* S=new double[7*ns];
+  for(int c=0; c<ns; c++) for(int k=0; k<7; k++) if(scanf("%%lf", &S[k*ns+c]) != 1) return 1;
+  for(int p=0; p<n; p++){
+    double* q=in+p*(18+%d);
+    double* P=q+15+%d;
+    for(int I=0; I<=%d; I++) for(int J=0; J<=%d; J++){
+      for(int k=0; k<STOREDIM*STOREDIM*8; k++) store[k]=0;
+      OEint_vertical_dipoles(I, J, 0, 1, q[0], q[1], q[2], q[3], q[4], q[5], P[0], P[1], P[2], q[9], q[14], ns, S, S+ns, S+2*ns, S+3*ns, S+4*ns, S+5*ns, S+6*ns, store);
+      print_store("d", p, I, J);
+    }
+  }
+''' % (nboys, max_branch_l, max_branch_l, nboys, nboys, max_branch_l, max_branch_l)
+    if pair_cache:
+        nbranch=(max_branch_l+1)**2
+        src += '''
+  const int np=n*%d;
+  int* Ic=new int[np];
+  int* Jc=new int[np];
+  double* prims=new double[9*np];
+  for(int p=0; p<n; p++){
+    double* q=in+p*(18+%d);
+    double ex[2];
+    if(scanf("%%lf %%lf", &ex[0], &ex[1]) != 2) return 1;
+    for(int I=0; I<=%d; I++) for(int J=0; J<=%d; J++){
+      const int k=p*%d+I*%d+J;
+      Ic[k]=I;
+      Jc[k]=J;
+      for(int d=0; d<3; d++){
+        prims[9*k+d]=q[15+%d+d]-q[d];
+        prims[9*k+3+d]=q[15+%d+d]-q[3+d];
+      }
+      prims[9*k+6]=ex[0];
+      prims[9*k+7]=ex[1];
+      prims[9*k+8]=1.0;
+    }
+  }
+
+  // the input geometry, two translated copies that evict it and the input geometry again
+  oei_pair_cache cache(2);
+  double* shifted=new double[9*np];
+  for(int s=0; s<4; s++){
+    for(int t=0; t<9*np; t++) shifted[t]=prims[t]+(t%%9 < 6 && s%%3 != 0 ? s : 0.0);
+    oei_cache_entry& e=oei_cache_update(cache, np, Ic, Jc, shifted, nc, Cx, Cy, Cz, Qc, %.17e);
+    if(s > 0) continue;
+    for(int k=0; k<np; k++){
+      for(int t=0; t<STOREDIM*STOREDIM*8; t++) store[t]=0;
+      oei_cache_add(e, k, store);
+''' % (nbranch, nboys, max_branch_l, max_branch_l, nbranch, max_branch_l+1, nboys, nboys, cache_threshold)
+        if hrr:
+            src += "      OEint_horizontal(Ic[k], Jc[k], prims[9*k]-prims[9*k+3], prims[9*k+1]-prims[9*k+4], prims[9*k+2]-prims[9*k+5], store);\n"
+        src += '''      print_store("m", k/%d, Ic[k], Jc[k]);
+    }
+  }
+  if(cache.hits != 0 || cache.misses != 4 || cache.evictions != 2) return 2;
+
+  // moved charges, only those beyond the threshold are updated
+  double* Cm=new double[4*nc];
+  for(int c=0; c<nc; c++){ Cm[c]=Cx[c]; Cm[nc+c]=Cy[c]; Cm[2*nc+c]=Cz[c]; Cm[3*nc+c]=Qc[c]; }
+''' % (nbranch)
+        for (c, k, delta) in cache_moves:
+            src += "  Cm[%d*nc+%d] += %.17e;\n" % (k, c, delta)
+        src += '''  const long moved=cache.moved;
+  oei_cache_entry& e=oei_cache_update(cache, np, Ic, Jc, prims, nc, Cm, Cm+nc, Cm+2*nc, Cm+3*nc, %.17e);
+  if(cache.hits != 1 || cache.moved != moved+%d) return 2;
+  for(int k=0; k<np; k++){
+    for(int t=0; t<STOREDIM*STOREDIM*8; t++) store[t]=0;
+    oei_cache_add(e, k, store);
+''' % (cache_threshold, len(set([c for (c, k, delta) in cache_moves if k == 3 or abs(delta) > cache_threshold])))
+        if hrr:
+            src += "    OEint_horizontal(Ic[k], Jc[k], prims[9*k]-prims[9*k+3], prims[9*k+1]-prims[9*k+4], prims[9*k+2]-prims[9*k+5], store);\n"
+        src += '''    print_store("n", k/%d, Ic[k], Jc[k]);
+  }
+''' % (nbranch)
+    src += "  return 0;\n}\n"
+    return src
+
+# random primitive pairs and point charges. Returns the centers, the Boys function arguments and
+# prefactors, the pair quantities and the exponents. If diagonal is set, B is A as for the
+# primitive pairs of a diagonal shell pair (II == JJ), with different exponents.
+def random_pairs(npairs, seed, diagonal=False):
+    rng=np.random.default_rng(seed)
+    A=rng.uniform(-1.5, 1.5, (npairs, 3))
+    B=rng.uniform(-1.5, 1.5, (npairs, 3))
+    if diagonal:
+        B=A.copy()
+    C=rng.uniform(-3.0, 3.0, (npairs, 3))
+    alpha=np.exp(rng.uniform(np.log(0.1), np.log(10.0), npairs))
+    beta=np.exp(rng.uniform(np.log(0.1), np.log(10.0), npairs))
+    T, prefactor = reference.boys_args(A, B, C, alpha, beta)
+    return (A, B, T, prefactor, reference.pair_quantities(A, B, C, alpha, beta, nboys-1), (alpha, beta))
+
+# random point charges in a box of half width box with magnitudes in [-1, 1], as an (nc, 3) array
+# of positions and an array of magnitudes
+def random_charges(ncharges, seed, box=3.0):
+    rng=np.random.default_rng(seed+1)
+    return (rng.uniform(-box, box, (ncharges, 3)), rng.uniform(-1.0, 1.0, ncharges))
+
+# reference [la|lb] integral of each pair summed over point charges C with magnitudes Q, with the
+# pair quantities q and Boys function prefactors of random_pairs. All pairs and charges are
+# evaluated at once. op and omega select the operator, see reference.boys_operator, and charges
+# farther than rcut from the product center are skipped.
+def charges_integral(la, lb, A, prefactor, q, C, Q, op="coulomb", omega=None, rcut=None):
+    npairs=len(A)
+    P=A+np.array(q[0:3]).T
+    PC=(P[:,None,:]-C[None,:,:]).reshape(-1, 3)
+    pair=lambda x: np.repeat(x, len(C))
+    T=pair(0.5/q[9])*np.sum(PC**2, axis=1)
+    weight=np.tile(Q, npairs)
+    if rcut is not None:
+        weight=np.where(np.sum(PC**2, axis=1) > rcut**2, 0.0, weight)
+    Y=pair(prefactor)*weight*reference.boys_operator(la+lb, T, pair(0.5/q[9]), op, omega)
+    block=reference.integral(la, lb, *([pair(x) for x in q[0:6]]+[PC[:,0], PC[:,1], PC[:,2], pair(q[9]), Y]))
+    return block.reshape((npairs, len(C))+block.shape[1:]).sum(axis=1)
+
+# reference [la|lb] integral of each pair summed over sites C with charges Q and dipole moments
+# Mu, i.e. sum_c Q_c [a|b] + Mu_c . grad_C [a|b], with the arguments of charges_integral
+def dipoles_integral(la, lb, A, prefactor, q, C, Q, Mu):
+    npairs=len(A)
+    P=A+np.array(q[0:3]).T
+    PC=(P[:,None,:]-C[None,:,:]).reshape(-1, 3)
+    pair=lambda x: np.repeat(x, len(C))
+    T=pair(0.5/q[9])*np.sum(PC**2, axis=1)
+    Y=pair(prefactor)*reference.boys(la+lb+1, T)
+    args=[pair(x) for x in q[0:6]]+[PC[:,0], PC[:,1], PC[:,2], pair(q[9]), Y]
+    block=reference.integral(la, lb, *args)*np.tile(Q, npairs)[:,None,None]
+    for c in range(0, 3):
+        block += reference.field(la, lb, c, *args)*np.tile(Mu[:,c], npairs)[:,None,None]
+    return block.reshape((npairs, len(C))+block.shape[1:]).sum(axis=1)
+
+# reference values sum_ij D_ij [i|j] of each pair at grid points G, where the density block of
+# pair p holds D_ij at Dm[p, i*nb+j], and the same sum over |D_ij [i|j]|, as (npairs, ng) arrays
+def esp_integral(la, lb, A, prefactor, q, G, Dm):
+    npairs=len(A)
+    na=len(params.shell_idx(la))
+    nb=len(params.shell_idx(lb))
+    P=A+np.array(q[0:3]).T
+    PC=(P[:,None,:]-G[None,:,:]).reshape(-1, 3)
+    pair=lambda x: np.repeat(x, len(G))
+    T=pair(0.5/q[9])*np.sum(PC**2, axis=1)
+    Y=pair(prefactor)*reference.boys(la+lb, T)
+    block=reference.integral(la, lb, *([pair(x) for x in q[0:6]]+[PC[:,0], PC[:,1], PC[:,2], pair(q[9]), Y]))
+    terms=block.reshape(npairs, len(G), na, nb)*Dm[:, None, 0:na*nb].reshape(npairs, 1, na, nb)
+    return (terms.sum(axis=(2, 3)), np.abs(terms).sum(axis=(2, 3)))
+
+# arguments at which the Boys function producer is checked: T of the random pairs, a logarithmic
+# sweep, points around the switch to the asymptotic formula and midpoints of the Taylor grid
+def boys_points(T):
+    import src.oei.boys as boys_printer
+
+    switch=reference.boys_switch
+    sweep=np.concatenate([[0.0], np.logspace(-12, 3, 151), switch+np.linspace(-0.2, 0.2, 41),\
+        (np.arange(0, int(switch/boys_printer.boys_delta))+0.5)*boys_printer.boys_delta])
+    return np.concatenate([T, sweep])
+
+# optional outputs and the file that marks each of them in folders without a manifest
+mode_files=(("batch", "cpu_oei_batch.h"), ("numpy", "oei_numpy.py"), ("boys", "gpu_oei_boys.h"), ("charges", "gpu_oei_charges.h"),\
+    ("tree", "cpu_oei_tree.h"), ("esp", "gpu_oei_esp.h"), ("field", "gpu_oei_field.h"), ("pair_cache", "cpu_oei_pair_cache.h"))
+
+# Modes and files of the run that generated outdir. Returns a dictionary of the settings hrr,
+# attenuated and those of mode_files, and the list of generated files. They are read from the
+# manifest of the run (see file_handler.write_cache), so files left by earlier runs are ignored.
+# Folders without a manifest are judged by the files they hold.
+def generated_modes(outdir):
+    cache=file_handler.read_cache(outdir)
+    if cache is not None and "settings" in cache:
+        settings=cache["settings"]
+        modes=dict([(name, int(settings.get(name, 0))) for name in ["hrr", "attenuated"]+[mode for (mode, fname) in mode_files]])
+        return (modes, sorted(cache["files"]))
+
+    print("Note: no manifest found in %s, the modes are judged by the files present. \n" % (outdir))
+    files=sorted(os.listdir(outdir))
+    modes=dict([(mode, int(fname in files)) for (mode, fname) in mode_files])
+    modes["hrr"]=int("OEint_horizontal" in open(os.path.join(outdir, "gpu_oei_assembler.h")).read())
+    modes["attenuated"]=int(modes["boys"] and "oei_boys_erf" in open(os.path.join(outdir, "gpu_oei_boys.h")).read())
+    return (modes, files)
+
+# Compile the headers in outdir with the driver and run it for the given pairs, Boys function
+# arguments, sets of point charges, a list of (C, Q) for the point charge assemblers and the
+# octree, grid points G with density blocks Dm of shape (npairs, esp_dsize) and sites, a tuple
+# (C, Q, Mu) of positions, charges and dipole moments. diagonal holds (A, T, prefactor, q) of the
+# pairs with A == B. Only the input of the generated headers, given by modes and files of
+# generated_modes, is passed. Returns a dictionary {(kind, p, I, J): {(i, j): value}}, raises
+# RuntimeError if the driver does not compile or fails.
+def run_host(outdir, modes, files, A, B, T, prefactor, q, exponents, boys_T, charge_sets, G, Dm, sites, diagonal, cxx):
+    hrr=modes["hrr"]
+    batch=modes["batch"]
+    boys=modes["boys"]
+    charges=modes["charges"]
+    tree=modes["tree"]
+    attenuated=modes["attenuated"]
+    esp=modes["esp"]
+    field=modes["field"]
+    pair_cache=modes["pair_cache"]
+
+    tmpdir=tempfile.mkdtemp(prefix="genint_validate_")
+    try:
+        for name in files:
+            if name.endswith(".h"):
+                shutil.copy(os.path.join(outdir, name), tmpdir)
+        fh=open(os.path.join(tmpdir, "driver.cpp"), 'w')
+        fh.write(driver_source(hrr, batch, boys, charges, tree, attenuated, esp, field, pair_cache))
+        fh.close()
+
+        exe=os.path.join(tmpdir, "driver")
+        proc=subprocess.run([cxx, "-O1", "-w", "-o", exe, os.path.join(tmpdir, "driver.cpp")], capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError("the driver does not compile with the headers in %s:\n%s" % (outdir, proc.stderr))
+
+        lines=[]
+        for (Ap, ABp, Tp, prefactorp, qp) in ((A, A-B, T, prefactor, q), (diagonal[0], 0.0*diagonal[0])+tuple(diagonal[1:4])):
+            P=Ap+np.array(qp[0:3]).T
+            lines.append("%d" % (len(Ap)))
+            for p in range(0, len(Ap)):
+                values=[qp[k][p] for k in range(0, 10)]+list(ABp[p])+[Tp[p], prefactorp[p]]+list(qp[10][:,p])+list(P[p])
+                lines.append(" ".join(["%.17e" % (v) for v in values]))
+        lines.append("%d" % (len(boys_T)))
+        for t in boys_T:
+            lines.append("%.17e 1.0" % (t))
+        for (C, Q) in charge_sets[0:int(charges)+int(tree)]:
+            lines.append("%d" % (len(Q)))
+            for (Cc, Qc) in zip(C, Q):
+                lines.append("%.17e %.17e %.17e %.17e" % (Cc[0], Cc[1], Cc[2], Qc))
+        if esp:
+            lines.append("%d" % (len(G)))
+            for Gg in G:
+                lines.append("%.17e %.17e %.17e" % (Gg[0], Gg[1], Gg[2]))
+            for Dp in Dm:
+                lines.append(" ".join(["%.17e" % (v) for v in Dp]))
+        if field:
+            C, Q, Mu = sites
+            lines.append("%d" % (len(Q)))
+            for c in range(0, len(Q)):
+                lines.append(" ".join(["%.17e" % (v) for v in list(C[c])+[Q[c]]+list(Mu[c])]))
+        if pair_cache:
+            for (alpha, beta) in zip(*exponents):
+                lines.append("%.17e %.17e" % (alpha, beta))
+        proc=subprocess.run([exe], input="\n".join(lines)+"\n", capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError("the driver failed with exit code %d:\n%s" % (proc.returncode, proc.stderr))
+    finally:
+        shutil.rmtree(tmpdir)
+
+    results={}
+    for line in proc.stdout.split("\n"):
+        if line.strip() == "":
+            continue
+        kind, p, I, J, i, j, value = line.split()
+        results.setdefault((kind, int(p), int(I), int(J)), {})[(int(i), int(j))]=float(value)
+    return results
+
+# Compare store entries with the reference. expected holds the [la|lb] classes whose entries are
+# compared; entries of other classes are ignored. If complete is set, every entry of the expected
+# classes must be present. Returns (number of compared entries, max relative error, number of
+# missing entries), where errors are relative to the largest reference value of the class, or of
+# the class in scales if it is given.
+def compare(entries, ref, expected, complete, scales=None):
+    count=0
+    maxrel=0.0
+    missing=0
+    for (la, lb) in expected:
+        block=ref[(la, lb)]
+        scale=max(np.max(np.abs(block if scales is None else scales[(la, lb)])), 1e-300)
+        for (ii, i) in enumerate(params.shell_idx(la)):
+            for (jj, j) in enumerate(params.shell_idx(lb)):
+                if (i, j) in entries:
+                    maxrel=max(maxrel, abs(entries[(i, j)]-block[ii, jj])/scale)
+                    count += 1
+                elif complete:
+                    missing += 1
+    return (count, maxrel, missing)
+
+# Validate the generated files in outdir against the reference for npairs random pairs. Prints a
+# report and returns True if all compared values agree within tol.
+def validate(outdir, npairs=16, seed=0, cxx=None, tol=1e-10, ncharges=5):
+    if cxx is None:
+        cxx=os.environ.get("CXX", "g++")
+    if not os.path.isfile(os.path.join(outdir, "gpu_oei_assembler.h")):
+        print("Error: no generated headers found in %s. \n" % (outdir))
+        return False
+    if shutil.which(cxx) is None:
+        print("Error: C++ compiler %s not found, set CXX or pass cxx. \n" % (cxx))
+        return False
+
+    A, B, T, prefactor, q, exponents = random_pairs(npairs, seed)
+    Ad, Bd, Td, prefactord, qd, exponentsd = random_pairs(npairs, seed+5, True)
+    boys_T=boys_points(T)
+    C, Q = random_charges(ncharges, seed)
+    C2, Q2 = random_charges(tree_charges, seed+1, tree_box)
+    G=random_charges(esp_points, seed+2)[0]
+    Dm=np.random.default_rng(seed+3).uniform(-1.0, 1.0, (npairs, esp_dsize))
+    Mu=np.random.default_rng(seed+4).uniform(-1.0, 1.0, (ncharges, 3))
+    modes, files = generated_modes(outdir)
+    try:
+        results=run_host(outdir, modes, files, A, B, T, prefactor, q, exponents, boys_T, [(C, Q), (C2, Q2)], G, Dm, (C, Q, Mu),\
+            (Ad, Td, prefactord, qd), cxx)
+    except RuntimeError as error:
+        print("Validation of %s against the reference failed: %s" % (outdir, error))
+        print("  FAILED \n")
+        return False
+
+    # reference values of all classes for each pair and each diagonal pair
+    ref={}
+    dgref={}
+    for la in range(0, max_class_l+1):
+        for lb in range(0, max_class_l+1):
+            ref[(la, lb)]=reference.integral(la, lb, *q)
+            dgref[(la, lb)]=reference.integral(la, lb, *qd)
+
+    # reference values summed over the point charges, only computed if they are compared
+    cref={}
+    if any([key[0] in ("c", "h", "m") for key in results]):
+        for la in range(0, max_branch_l+2):
+            for lb in range(0, max_branch_l+2):
+                cref[(la, lb)]=charges_integral(la, lb, A, prefactor, q, C, Q)
+    nref={}
+    if any([key[0] == "n" for key in results]):
+        Cm=np.array(C, dtype=float)
+        Qm=np.array(Q, dtype=float)
+        for (c, k, delta) in cache_moves:
+            if k == 3:
+                Qm[c] += delta
+            else:
+                Cm[c, k] += delta
+        for la in range(0, max_branch_l+1):
+            for lb in range(0, max_branch_l+1):
+                nref[(la, lb)]=charges_integral(la, lb, A, prefactor, q, Cm, Qm)
+    eref={}
+    kref={}
+    if any([key[0] in ("e", "f", "k", "l") for key in results]):
+        for la in range(0, max_branch_l+2):
+            for lb in range(0, max_branch_l+2):
+                eref[(la, lb)]=charges_integral(la, lb, A, prefactor, q, C, Q, "erf", op_omega)
+                kref[(la, lb)]=charges_integral(la, lb, A, prefactor, q, C, Q, "erfc", op_omega, op_rcut)
+    fref=[{}, {}, {}]
+    dref={}
+    if any([key[0] in ("fv", "d") for key in results]):
+        for la in range(0, max_branch_l+1):
+            for lb in range(0, max_branch_l+1):
+                for c in range(0, 3):
+                    fref[c][(la, lb)]=reference.field(la, lb, c, *q)
+                dref[(la, lb)]=dipoles_integral(la, lb, A, prefactor, q, C, Q, Mu)
+    tref={}
+    tabs={}
+    if any([key[0] in ("t", "u", "s", "r") for key in results]):
+        for la in range(0, max_branch_l+2):
+            for lb in range(0, max_branch_l+2):
+                tref[(la, lb)]=charges_integral(la, lb, A, prefactor, q, C2, Q2)
+                tabs[(la, lb)]=charges_integral(la, lb, A, prefactor, q, C2, np.abs(Q2))
+
+    ok=True
+    report=[]
+    checks=[("v", "OEint_vertical", max_branch_l, lambda I, J: [(I, J)], True, ref),\
+        ("g", "oei_grad_vertical", max_branch_l, grad_classes, False, ref),\
+        ("vd", "OEint_vertical II == JJ", max_branch_l, lambda I, J: [(I, J)], True, dgref),\
+        ("gd", "oei_grad_vertical II == JJ", max_branch_l, grad_classes, False, dgref),\
+        ("b", "oei_batch", max_class_l, lambda I, J: [(I, J)], True, ref),\
+        ("c", "OEint_vertical_charges", max_branch_l, lambda I, J: [(I, J)], True, cref),\
+        ("h", "oei_grad_vertical_charges", max_branch_l, grad_classes, False, cref),\
+        ("e", "OEint_vertical_charges_erf", max_branch_l, lambda I, J: [(I, J)], True, eref),\
+        ("f", "oei_grad_vertical_charges_erf", max_branch_l, grad_classes, False, eref),\
+        ("k", "OEint_vertical_charges_erfc", max_branch_l, lambda I, J: [(I, J)], True, kref),\
+        ("l", "oei_grad_vertical_charges_erfc", max_branch_l, grad_classes, False, kref),\
+        ("fv", "oei_field_vertical", max_branch_l, lambda I, J: [(I, J)], True, ref),\
+        ("fx", "  d/dCx", max_branch_l, lambda I, J: [(I, J)], True, fref[0]),\
+        ("fy", "  d/dCy", max_branch_l, lambda I, J: [(I, J)], True, fref[1]),\
+        ("fz", "  d/dCz", max_branch_l, lambda I, J: [(I, J)], True, fref[2]),\
+        ("d", "OEint_vertical_dipoles", max_branch_l, lambda I, J: [(I, J)], True, dref),\
+        ("m", "oei_cache_update", max_branch_l, lambda I, J: [(I, J)], True, cref),\
+        ("n", "  moved charges", max_branch_l, lambda I, J: [(I, J)], True, nref),\
+        ("t", "OEint_vertical_tree", max_branch_l, lambda I, J: [(I, J)], True, tref),\
+        ("u", "oei_grad_vertical_tree", max_branch_l, grad_classes, False, tref),\
+        ("s", "  theta=%.2f" % (tree_theta), max_branch_l, lambda I, J: [(I, J)], True, tref, tabs),\
+        ("r", "  theta=%.2f" % (tree_theta), max_branch_l, grad_classes, False, tref, tabs)]
+    for check in checks:
+        kind, name, lmax, classes, complete, values = check[0:6]
+        scales = check[6] if len(check) > 6 else None
+        nbranch=0
+        count=0
+        maxrel=0.0
+        missing=0
+        for I in range(0, lmax+1):
+            for J in range(0, lmax+1):
+                if not any([(kind, p, I, J) in results for p in range(0, npairs)]):
+                    continue
+                nbranch += 1
+                for p in range(0, npairs):
+                    pref=dict([(key, values[key][p]) for key in values])
+                    sref = None if scales is None else dict([(key, scales[key][p]) for key in scales])
+                    c, r, m = compare(results.get((kind, p, I, J), {}), pref, classes(I, J), complete, sref)
+                    count += c
+                    maxrel=max(maxrel, r)
+                    missing += m
+        if nbranch == 0:
+            continue
+        report.append("%-30s %2d branches %7d entries  max rel error %.2e  missing %d" % (name, nbranch, count, maxrel, missing))
+
+        # the far field of the octree is approximate
+        if maxrel > (tree_tol if kind in ("s", "r") else tol) or missing > 0:
+            ok=False
+
+    # Boys function producers, errors relative to each value. Keys are ("y", k, M, m) and, for the
+    # attenuated operators, ("w", k, M, m) and ("x", k, M, m); erfc values are differences, so
+    # their errors are relative to the coulomb value.
+    F=reference.boys(nboys-1, boys_T)
+    producers=[("y", "oei_boys", F),\
+        ("w", "oei_boys_erf", reference.boys_operator(nboys-1, boys_T, op_zeta, "erf", op_omega)),\
+        ("x", "oei_boys_erfc", reference.boys_operator(nboys-1, boys_T, op_zeta, "erfc", op_omega))]
+    for (kind, name, values) in producers:
+        keys=[key for key in results if key[0] == kind]
+        if len(keys) == 0:
+            continue
+        maxrel=max([abs(results[key][(0, 0)]-values[key[3]][key[1]])/(F if kind == "x" else values)[key[3]][key[1]] for key in keys])
+        report.append("%-30s %2d orders   %7d values   max rel error %.2e" % (name, len(set([key[2] for key in keys])), len(keys), maxrel))
+        if maxrel > tol:
+            ok=False
+
+    # grid point functions, errors relative to the largest sum of absolute terms of the pair.
+    # Keys are ("p", p, I, J) with values {(g, 0): value} and the host driver sums all of them.
+    keys=[key for key in results if key[0] == "p"]
+    if len(keys) > 0:
+        branches=sorted(set([key[2:4] for key in keys]))
+        maxrel=0.0
+        total=np.zeros(esp_points)
+        tabs=np.zeros(esp_points)
+        for (I, J) in branches:
+            values, scales = esp_integral(I, J, A, prefactor, q, G, Dm)
+            total += values.sum(axis=0)
+            tabs += scales.sum(axis=0)
+            for p in range(0, npairs):
+                entries=results.get(("p", p, I, J), {})
+                for g in range(0, esp_points):
+                    maxrel=max(maxrel, abs(entries.get((g, 0), 0.0)-values[p, g])/max(np.max(scales[p]), 1e-300))
+        report.append("%-30s %2d branches %7d points   max rel error %.2e" % ("oei_esp", len(branches), len(keys)*esp_points, maxrel))
+        if maxrel > tol:
+            ok=False
+
+        grid=results.get(("o", 0, 0, 0), {})
+        maxrel=max([abs(grid.get((g, 0), 0.0)-total[g])/max(np.max(tabs), 1e-300) for g in range(0, esp_points)])
+        report.append("%-30s %2d branches %7d points   max rel error %.2e" % ("oei_esp_grid", len(branches), esp_points, maxrel))
+        if maxrel > tol:
+            ok=False
+
+    # numpy functions, imported from the generated file
+    fname=os.path.join(outdir, "oei_numpy.py")
+    if modes["numpy"]:
+        spec=importlib.util.spec_from_file_location("oei_numpy", fname)
+        module=importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        count=0
+        maxrel=0.0
+        for (la, lb) in module.functions:
+            block=module.functions[(la, lb)](*q)
+            scale=np.maximum(np.max(np.abs(ref[(la, lb)]), axis=(1, 2)), 1e-300)
+            maxrel=max(maxrel, np.max(np.abs(block-ref[(la, lb)])/scale[:,None,None]))
+            count += block.size
+        report.append("%-30s %2d classes  %7d entries  max rel error %.2e" % ("oei_numpy", len(module.functions), count, maxrel))
+        if maxrel > tol:
+            ok=False
+
+    print("Validation of %s against the reference, %d random pairs:" % (outdir, npairs))
+    for line in report:
+        print("  "+line)
+    print("  %s \n" % ("passed" if ok else "FAILED"))
+    return ok
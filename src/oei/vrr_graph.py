@@ -0,0 +1,274 @@
+#!---------------------------------------------------------------------!
+#! Written by Madu Manathunga on 07/01/2021                            !
+#!                                                                     !
+#! Copyright (C) 2020-2021 Merz lab                                    !
+#! Copyright (C) 2020-2021 Götz lab                                    !
+#!                                                                     !
+#! This source file is a part of QUICK-GenInt code generator and       !
+#! is subjected to the terms of the Mozilla Public License, v. 2.0.    !
+#! If a copy of the MPL was not distributed with this file, you can    !
+#! obtain one at http://mozilla.org/MPL/2.0/.                          !
+#!_____________________________________________________________________!
+
+#!---------------------------------------------------------------------!
+#! This source file contains an in-memory representation of the       !
+#! Obara-Saika vertical recurrence relations as a directed acyclic     !
+#! graph. Nodes are integral components, Boys function values (VY)    !
+#! and primitive pair quantities (PA, PB, PC, TwoZetaInv). Printers in !
+#! printer.py lower the graph into source code.                        !
+#!---------------------------------------------------------------------!
+
+import json
+import src.common.params as params
+
+# labels of primitive pair quantities
+PA=("PAx", "PAy", "PAz") # Px-Ax, Py-Ay, Pz-Az
+PB=("PBx", "PBy", "PBz") # Px-Bx, Py-By, Pz-Bz
+PC=("PCx", "PCy", "PCz") # Px-Cx, Py-Cy, Pz-Cz
+AB=("ABx", "ABy", "ABz") # Ax-Bx, Ay-By, Az-Bz
+
+# ops of the derivatives of a component with respect to Cx, Cy and Cz and of its directional
+# derivative mu . grad_C, see Dag.field
+field_ops=("Ex", "Ey", "Ez", "Eu")
+MU=("mux", "muy", "muz") # components of the direction mu
+
+# Return the recurrence used to build component (i,j) of an [a|b] integral. As in the integral
+# classes, we increment the second function if b > 0 and a >= b (or a = 0) and the first function
+# otherwise, along the first nonzero cartesian direction k. The result is (center, k, src, terms);
+# src is the component multiplied by PA/PB and PC, terms is a list of (coefficient, component)
+# pairs multiplied by TwoZetaInv. Returns None for [s|s].
+def vrr_step(i, j):
+    if i == 0 and j == 0:
+        return None
+
+    if params.ang_mom(j) > 0 and (params.ang_mom(i) == 0 or params.ang_mom(i) >= params.ang_mom(j)):
+        center="B"
+        inc, oth = j, i
+    else:
+        center="A"
+        inc, oth = i, j
+
+    for k in range(0,3):
+        if params.Mcal[inc][k] != 0:
+            break
+
+    return vrr_step_dir(i, j, center, k)
+
+# Return the recurrence that builds component (i,j) by incrementing the function on center
+# ("A" or "B") along cartesian direction k. The result has the same form as vrr_step.
+def vrr_step_dir(i, j, center, k):
+    if center == "B":
+        inc, oth = j, i
+    else:
+        inc, oth = i, j
+
+    # lowered components, written as (incremented function, other function)
+    src=(params.lower_idx(inc, k), oth)
+    terms=[]
+    if params.Mcal[inc][k] > 1:
+        terms.append((params.Mcal[inc][k]-1, (params.lower_idx(inc, k, 2), oth)))
+    if params.Mcal[oth][k] > 0:
+        terms.append((params.Mcal[oth][k], (src[0], params.lower_idx(oth, k))))
+
+    # swap back into (i,j) order
+    if center == "B":
+        src=(src[1], src[0])
+        terms=[(coeff, (comp[1], comp[0])) for (coeff, comp) in terms]
+
+    return (center, k, src, terms)
+
+# A node of the recurrence graph. kind is one of
+#   "input" - a primitive pair quantity such as PAx or TwoZetaInv, identified by name
+#   "vy"    - the Boys function value VY(0, 0, m)
+#   "int"   - component (i,j) of auxiliary index m of an integral computed by op, where op is
+#             "V" for the vertical recurrence, "H" for the horizontal recurrence, "L" for a
+#             value loaded from the store array (such nodes have no terms) and one of field_ops
+#             for the derivative of a vertical recurrence component with respect to C
+# The value of an "int" node is the sum of coeff * product(factors) over its terms, where
+# factors are ids of other nodes.
+class Node:
+    def __init__(self, kind, name=None, i=None, j=None, m=None, op=None, terms=None):
+        self.id=-1
+        self.kind=kind
+        self.name=name
+        self.i=i
+        self.j=j
+        self.m=m
+        self.op=op
+        self.terms=terms
+
+    # unique key of the node, two nodes with the same key hold the same value
+    def key(self):
+        if self.kind == "input":
+            return (self.kind, self.name)
+        elif self.kind == "vy":
+            return (self.kind, self.m)
+        return (self.kind, self.op, self.i, self.j, self.m)
+
+    def to_dict(self):
+        d={"id": self.id, "kind": self.kind}
+        if self.kind == "input":
+            d["name"]=self.name
+        elif self.kind == "vy":
+            d["m"]=self.m
+        else:
+            d["op"]=self.op
+            d["i"]=self.i
+            d["j"]=self.j
+            d["m"]=self.m
+            d["terms"]=[[coeff, list(factors)] for (coeff, factors) in self.terms]
+        return d
+
+# The recurrence graph. Nodes are kept in a list in topological order, i.e. every node appears
+# after the nodes it depends on. Each node is created only once, so the graph shares all common
+# subexpressions. roots is a list of (name, node id) pairs, where name is a tuple describing
+# the value, e.g. ("store", i, j) for an integral that is saved into the store array.
+class Dag:
+    def __init__(self, step=vrr_step):
+        self.nodes=[]
+        self.ids={}
+        self.roots=[]
+        self.step=step
+
+    # add a node unless an identical one exists, return the node id
+    def add(self, node):
+        key=node.key()
+        if key in self.ids:
+            return self.ids[key]
+
+        node.id=len(self.nodes)
+        self.nodes.append(node)
+        self.ids[key]=node.id
+        return node.id
+
+    def input(self, name):
+        return self.add(Node("input", name=name))
+
+    def vy(self, m):
+        return self.add(Node("vy", m=m))
+
+    # return the id of the node holding component (i,j) of auxiliary index m, building the
+    # nodes of all lower components first
+    def vrr(self, i, j, m):
+        if i == 0 and j == 0:
+            return self.vy(m)
+
+        key=("int", "V", i, j, m)
+        if key in self.ids:
+            return self.ids[key]
+
+        center, k, src, comps = self.step(i, j)
+        PX = PB if center == "B" else PA
+
+        terms=[]
+        terms.append((1.0, [self.input(PX[k]), self.vrr(src[0], src[1], m)]))
+        terms.append((-1.0, [self.input(PC[k]), self.vrr(src[0], src[1], m+1)]))
+        for (coeff, comp) in comps:
+            terms.append((float(coeff), [self.input("TwoZetaInv"), self.vrr(comp[0], comp[1], m)]))
+            terms.append((-float(coeff), [self.input("TwoZetaInv"), self.vrr(comp[0], comp[1], m+1)]))
+
+        return self.add(Node("int", i=i, j=j, m=m, op="V", terms=terms))
+
+    # return the id of the node holding the derivative of component (i,j) of auxiliary index m
+    # with respect to C along direction c, or along the direction mu for c = 3. C only enters
+    # through PC and the Boys function, whose derivative is d VY(0, 0, m)/dC_c = 2 Zeta PC_c
+    # VY(0, 0, m+1), so the derivative follows the same recurrence steps as vrr with one extra
+    # term, [src]^(m+1) for k = c (mu_k [src]^(m+1) for c = 3). The input TwoZeta holds
+    # 1/TwoZetaInv and muPC the product of mu and PC.
+    def field(self, i, j, m, c):
+        if i == 0 and j == 0:
+            dPC = self.input(PC[c]) if c < 3 else self.input("muPC")
+            return self.add(Node("int", i=0, j=0, m=m, op=field_ops[c],\
+                terms=[(1.0, [self.input("TwoZeta"), dPC, self.vy(m+1)])]))
+
+        key=("int", field_ops[c], i, j, m)
+        if key in self.ids:
+            return self.ids[key]
+
+        center, k, src, comps = self.step(i, j)
+        PX = PB if center == "B" else PA
+
+        terms=[]
+        terms.append((1.0, [self.input(PX[k]), self.field(src[0], src[1], m, c)]))
+        terms.append((-1.0, [self.input(PC[k]), self.field(src[0], src[1], m+1, c)]))
+        if k == c:
+            terms.append((1.0, [self.vrr(src[0], src[1], m+1)]))
+        elif c == 3:
+            terms.append((1.0, [self.input(MU[k]), self.vrr(src[0], src[1], m+1)]))
+        for (coeff, comp) in comps:
+            terms.append((float(coeff), [self.input("TwoZetaInv"), self.field(comp[0], comp[1], m, c)]))
+            terms.append((-float(coeff), [self.input("TwoZetaInv"), self.field(comp[0], comp[1], m+1, c)]))
+
+        return self.add(Node("int", i=i, j=j, m=m, op=field_ops[c], terms=terms))
+
+    # return the id of the node holding component (i,j) obtained by the horizontal recurrence
+    # [i|j] = [i+1_k|j-1_k] + AB_k [i|j-1_k], where k is the first nonzero cartesian direction
+    # of j. The recurrence ends at [e|s] components, which are loaded from the store array.
+    def hrr(self, i, j):
+        if j == 0:
+            return self.add(Node("int", i=i, j=0, m=0, op="L", terms=[]))
+
+        key=("int", "H", i, j, 0)
+        if key in self.ids:
+            return self.ids[key]
+
+        for k in range(0,3):
+            if params.Mcal[j][k] != 0:
+                break
+
+        terms=[]
+        terms.append((1.0, [self.hrr(params.raise_idx(i, k), params.lower_idx(j, k))]))
+        terms.append((1.0, [self.input(AB[k]), self.hrr(i, params.lower_idx(j, k))]))
+        return self.add(Node("int", i=i, j=j, m=0, op="H", terms=terms))
+
+    # build all components of the [la|lb] integral for auxiliary index m
+    def add_class(self, la, lb, m):
+        for i in params.shell_idx(la):
+            for j in params.shell_idx(lb):
+                self.vrr(i, j, m)
+
+    # build the [la|lb] integral and register its components as roots saved into the store array
+    def add_store_roots(self, la, lb):
+        for i in params.shell_idx(la):
+            for j in params.shell_idx(lb):
+                self.roots.append((("store", i, j), self.vrr(i, j, 0)))
+
+    # ids of all nodes required to compute the given node ids, in topological order
+    def reachable(self, ids):
+        seen=set()
+        stack=list(ids)
+        while len(stack) > 0:
+            nid=stack.pop()
+            if nid in seen:
+                continue
+            seen.add(nid)
+            if self.nodes[nid].kind == "int":
+                for (coeff, factors) in self.nodes[nid].terms:
+                    stack.extend(factors)
+        return sorted(seen)
+
+    def to_json(self):
+        return json.dumps({"nodes": [node.to_dict() for node in self.nodes],\
+            "roots": [{"name": list(name), "node": nid} for (name, nid) in self.roots]}, indent=1)
+
+# rebuild a graph from its json representation
+def from_json(text):
+    data=json.loads(text)
+    dag=Dag()
+    for d in data["nodes"]:
+        if d["kind"] == "input":
+            node=Node("input", name=d["name"])
+        elif d["kind"] == "vy":
+            node=Node("vy", m=d["m"])
+        else:
+            node=Node("int", i=d["i"], j=d["j"], m=d["m"], op=d["op"],\
+                terms=[(coeff, list(factors)) for (coeff, factors) in d["terms"]])
+        dag.add(node)
+
+    for r in data["roots"]:
+        dag.roots.append((tuple(r["name"]), r["node"]))
+    return dag
+
+# angular momenta (a, b) of the integral class that holds an "int" node
+def node_class(node):
+    return (params.ang_mom(node.i), params.ang_mom(node.j))
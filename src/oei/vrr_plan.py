@@ -0,0 +1,109 @@
+#!---------------------------------------------------------------------!
+#! Written by Madu Manathunga on 07/01/2021                            !
+#!                                                                     !
+#! Copyright (C) 2020-2021 Merz lab                                    !
+#! Copyright (C) 2020-2021 Götz lab                                    !
+#!                                                                     !
+#! This source file is a part of QUICK-GenInt code generator and       !
+#! is subjected to the terms of the Mozilla Public License, v. 2.0.    !
+#! If a copy of the MPL was not distributed with this file, you can    !
+#! obtain one at http://mozilla.org/MPL/2.0/.                          !
+#!_____________________________________________________________________!
+
+#!---------------------------------------------------------------------!
+#! This source file contains a planner that chooses the center (A or   !
+#! B) and cartesian direction of the vertical recurrence step used for !
+#! each integral component. The default rule in the integral classes   !
+#! always increments along the first nonzero direction; the planner    !
+#! searches over all valid steps to minimize the number of distinct    !
+#! components and floating point operations required by a set of       !
+#! target components.                                                  !
+#!---------------------------------------------------------------------!
+
+import src.common.params as params
+import src.oei.vrr_graph as vrr_graph
+import src.oei.printer as printer
+
+# A recurrence plan. steps maps component (i,j) to the (center, k) pair used to build it;
+# components without an entry follow the default rule of vrr_graph.vrr_step.
+class Plan:
+    def __init__(self):
+        self.steps={}
+
+    # recurrence step for component (i,j), to be used as the step function of a graph
+    def step(self, i, j):
+        if (i, j) in self.steps:
+            center, k = self.steps[(i, j)]
+            return vrr_graph.vrr_step_dir(i, j, center, k)
+        return vrr_graph.vrr_step(i, j)
+
+    # (center, k) pair currently used for component (i,j)
+    def choice(self, i, j):
+        if (i, j) in self.steps:
+            return self.steps[(i, j)]
+        center, k, src, terms = vrr_graph.vrr_step(i, j)
+        return (center, k)
+
+# all valid (center, k) pairs that build component (i,j), i.e. the incremented function has a
+# nonzero cartesian index along k
+def candidates(i, j):
+    steps=[]
+    for (center, idx) in (("A", i), ("B", j)):
+        for k in range(0,3):
+            if params.Mcal[idx][k] > 0:
+                steps.append((center, k))
+    return steps
+
+# build the graph of the target components (i,j,m) using the given step function and return
+# the graph, the number of distinct integral components and the number of floating point operations
+def evaluate(targets, step):
+    dag=vrr_graph.Dag(step)
+    ids=[dag.vrr(i, j, m) for (i, j, m) in targets]
+    reach=[nid for nid in dag.reachable(ids) if dag.nodes[nid].kind == "int"]
+    flops=0
+    for nid in reach:
+        flops += printer.count_flops(dag.nodes[nid].terms)
+    return (dag, len(reach), flops)
+
+# Search for a plan that minimizes the number of distinct components, and then the number of
+# floating point operations, required by the target components. Starting from the default rule,
+# components are visited from the highest angular momentum down and the step of each one is
+# replaced whenever another candidate lowers the total cost. This is repeated until no step
+# changes or the maximum number of passes is reached.
+def plan(targets, passes=4):
+    p=Plan()
+    dag, ncomp, flops = evaluate(targets, p.step)
+    cost=(ncomp, flops)
+
+    for n in range(0, passes):
+        improved=False
+        comps=set()
+        for node in dag.nodes:
+            if node.kind == "int":
+                comps.add((node.i, node.j))
+
+        for (i, j) in sorted(comps, key=lambda c: (-params.ang_mom(c[0])-params.ang_mom(c[1]), c)):
+            current=p.choice(i, j)
+            for cand in candidates(i, j):
+                if cand == current:
+                    continue
+                p.steps[(i, j)]=cand
+                tmp_dag, tmp_ncomp, tmp_flops = evaluate(targets, p.step)
+                if (tmp_ncomp, tmp_flops) < cost:
+                    cost=(tmp_ncomp, tmp_flops)
+                    current=cand
+                    dag=tmp_dag
+                    improved=True
+                else:
+                    p.steps[(i, j)]=current
+
+        if not improved:
+            break
+
+    return p
+
+# short description of the savings of plan p over the default rule for the target components
+def summary(targets, p):
+    dag, ncomp, flops = evaluate(targets, p.step)
+    dag, ncomp_fixed, flops_fixed = evaluate(targets, vrr_graph.vrr_step)
+    return "recurrence plan: %d components, %d flops (fixed rule: %d components, %d flops)" % (ncomp, flops, ncomp_fixed, flops_fixed)